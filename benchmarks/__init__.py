@@ -0,0 +1 @@
+"""Benchmarks for the infinispan-vector client."""
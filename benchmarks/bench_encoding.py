@@ -0,0 +1,62 @@
+"""Payload size and client encode time of JSON against protostream entries.
+
+Usage:
+    python -m benchmarks.bench_encoding [--entries N] [--dimension D]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+
+from infinispan_vector.protostream import ProtobufEncoder
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--dimension", type=int, default=384)
+    args = parser.parse_args()
+    proto = """
+    message vector {
+    repeated float vector = 1;
+    optional string text = 2;
+    optional int64 page = 3;
+    }
+    """
+    encoder = ProtobufEncoder.from_schema(proto, "vector")
+    rnd = random.Random(0)
+    entries = [
+        {
+            "_type": "vector",
+            "vector": [rnd.uniform(-1, 1) for _ in range(args.dimension)],
+            "text": "sentence number " + str(i),
+            "page": i,
+        }
+        for i in range(args.entries)
+    ]
+    start = time.perf_counter()
+    json_bytes = sum(len(json.dumps(e).encode()) for e in entries)
+    json_time = time.perf_counter() - start
+    start = time.perf_counter()
+    proto_bytes = sum(len(encoder.encode(e)) for e in entries)
+    proto_time = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "benchmark": "encoding",
+                "entries": args.entries,
+                "dimension": args.dimension,
+                "json_bytes_per_entry": json_bytes // args.entries,
+                "protostream_bytes_per_entry": proto_bytes // args.entries,
+                "size_ratio": round(json_bytes / proto_bytes, 2),
+                "json_us_per_entry": round(json_time / args.entries * 1e6, 1),
+                "protostream_us_per_entry": round(proto_time / args.entries * 1e6, 1),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Requests/sec of the Hot Rod transport against the pooled REST transport.
+
+Both run the same put/get mix on the `bench` cache, created with JSON
+encoding when missing. Give a server with --host (REST) and --hotrod-host
+(Hot Rod, defaults to --host since a server answers both protocols on its
+single port) to compare the protocols.
+
+Without them it is a smoke test against in-process Python stubs, the REST
+stand-in (`http.server`) and the Hot Rod protocol stub: the numbers then
+include the cost of each stub and do not compare the protocols.
+
+Usage:
+    python -m benchmarks.bench_hotrod [--host HOST:PORT]
+        [--hotrod-host HOST:PORT] [--requests N] [--threads T]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from contextlib import ExitStack
+
+from benchmarks.bench_transport import _run
+from infinispan_vector import Infinispan
+from infinispan_vector.testing import HotRodStubCluster, StandinServer
+from infinispan_vector.transport import RestTransport
+
+CACHE_CONFIG = json.dumps(
+    {
+        "distributed-cache": {
+            "mode": "SYNC",
+            "encoding": {"media-type": "application/json"},
+        }
+    }
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", help="server REST host:port, stubs if omitted")
+    parser.add_argument(
+        "--hotrod-host", help="server Hot Rod host:port, defaults to --host"
+    )
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    smoke_test = args.host is None and args.hotrod_host is None
+    with ExitStack() as stack:
+        if smoke_test:
+            rest_host = stack.enter_context(StandinServer()).host
+            hotrod_hosts = stack.enter_context(HotRodStubCluster(nodes=1)).hosts
+        else:
+            rest_host = args.host or args.hotrod_host
+            hotrod_hosts = [args.hotrod_host or args.host]
+        with Infinispan(
+            hosts=[rest_host], transport=RestTransport(pool_size=args.threads)
+        ) as ispn:
+            if not smoke_test and not ispn.cache_exists("bench"):
+                assert ispn.cache_post("bench", CACHE_CONFIG).ok
+            rest = _run(ispn, args.requests, args.threads)
+        with Infinispan(
+            hosts=hotrod_hosts, protocol="hotrod", pool_size=args.threads
+        ) as ispn:
+            hotrod = _run(ispn, args.requests, args.threads)
+    report = {
+        "benchmark": "hotrod",
+        "server": "in-process stubs (smoke test)" if smoke_test else rest_host,
+        "requests": args.requests,
+        "threads": args.threads,
+        "rest_rps": round(rest, 1),
+        "hotrod_rps": round(hotrod, 1),
+    }
+    # the ratio of two stubs says nothing about the protocols
+    if not smoke_test:
+        report["hotrod_speedup"] = round(hotrod / rest, 2)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Recall loss and storage gain of int8 quantized vectors.
+
+Runs exact kNN with NumPy on synthetic clustered embeddings, once on the
+float32 vectors (ground truth) and once on the int8 codes, the way the
+server searches a byte vector index. Reports recall@k for global and
+per-dimension calibration, without rescoring, rescoring the oversampled
+candidates with their dequantized vectors (the store default) and with
+their opt-in float copy (float_vectorfield), which stores 5 bytes per
+dimension instead of 1.
+
+Usage:
+    python -m benchmarks.bench_quantization [--vectors N] [--dimension D]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+
+import numpy as np
+
+from infinispan_vector.quantization import Int8Quantizer
+from infinispan_vector.utils import similarity_scores, top_k
+
+
+def _knn(vectors: np.ndarray, query: np.ndarray, k: int) -> list:
+    return top_k(similarity_scores(query, vectors), k)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, default=4)
+    args = parser.parse_args()
+    rnd = np.random.default_rng(0)
+    centers = rnd.normal(size=(50, args.dimension))
+    spread = rnd.uniform(0.05, 1.0, size=args.dimension)
+    vectors = (
+        centers[rnd.integers(0, 50, args.vectors)]
+        + rnd.normal(size=(args.vectors, args.dimension)) * spread
+    ).astype(np.float32)
+    queries = vectors[rnd.choice(args.vectors, args.queries)] + rnd.normal(
+        size=(args.queries, args.dimension)
+    ).astype(np.float32) * 0.1
+    truth = [set(_knn(vectors, q, args.k)) for q in queries]
+    report = {
+        "benchmark": "quantization",
+        "vectors": args.vectors,
+        "dimension": args.dimension,
+        "k": args.k,
+        "float32_bytes_per_vector": args.dimension * 4,
+        "int8_bytes_per_vector": args.dimension,
+        "int8_with_float_copy_bytes_per_vector": args.dimension * 5,
+    }
+    for name, per_dimension in (("global", False), ("per_dimension", True)):
+        quantizer = Int8Quantizer.calibrate(vectors, per_dimension=per_dimension)
+        codes = quantizer.quantize(vectors).astype(np.float32)
+        restored = quantizer.dequantize(codes)
+        plain = rescored = dequantized = 0
+        for query, expected in zip(queries, truth):
+            code_query = quantizer.quantize(query).astype(np.float32)
+            plain += len(expected & set(_knn(codes, code_query, args.k)))
+            candidates = _knn(codes, code_query, args.k * args.oversample)
+            best = top_k(similarity_scores(query, vectors[candidates]), args.k)
+            rescored += len(expected & {candidates[i] for i in best})
+            best = top_k(similarity_scores(query, restored[candidates]), args.k)
+            dequantized += len(expected & {candidates[i] for i in best})
+        total = args.k * args.queries
+        report["recall_" + name] = round(plain / total, 4)
+        report["recall_" + name + "_rescored"] = round(rescored / total, 4)
+        report["recall_" + name + "_rescored_dequantized"] = round(
+            dequantized / total, 4
+        )
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Ingestion and query benchmark suite of InfinispanVS.
+
+Stores sentences of `rnd_sentences.txt.gz` with deterministic embeddings
+and measures, for each dimension:
+    - ingestion docs/sec for each batch size
+    - query QPS, p50/p95/p99 latency and recall@k for each concurrency
+      level and k, recall being measured against an exact NumPy search
+
+It runs against the in-process stand-in server (brute-force kNN, so
+recall is 1 and latencies are the client side cost), or against a real
+server with --host. The results are printed, or written with --output, as
+one JSON document whose rows can be compared between runs.
+
+Usage:
+    python -m benchmarks.bench_suite [--host HOST:PORT] [--docs N]
+        [--queries Q] [--dimensions 64,384] [--batch-sizes 32,128]
+        [--concurrency 1,8] [--k 4,10] [--output results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from infinispan_vector import InfinispanVS
+from infinispan_vector.testing import StandinServer
+from infinispan_vector.utils import similarity_scores, top_k
+
+CORPUS = Path(__file__).resolve().parent.parent / "rnd_sentences.txt.gz"
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic embeddings: each text gets a vector drawn around one
+    of `clusters` centers, from a generator seeded with the text hash."""
+
+    def __init__(self, dimension: int, clusters: int = 32, seed: int = 0):
+        self.dimension = dimension
+        self.model = "hash-%d-%d-%d" % (dimension, clusters, seed)
+        self._centers = np.random.default_rng(seed).normal(size=(clusters, dimension))
+
+    def _embed(self, text: str) -> List[float]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        rnd = np.random.default_rng(int.from_bytes(digest, "little"))
+        center = self._centers[rnd.integers(len(self._centers))]
+        vector = center + rnd.normal(size=self.dimension) * 0.5
+        return vector.astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _read_corpus(path: Path, count: int) -> List[str]:
+    texts: List[str] = []
+    with gzip.open(path, "rt", encoding="utf-8") as corpus:
+        for line in corpus:
+            line = line.strip()
+            if line:
+                texts.append(line)
+                if len(texts) == count:
+                    break
+    if len(texts) < count:
+        raise ValueError("The corpus has less than %d sentences" % count)
+    return texts
+
+
+def _percentile_ms(latencies: List[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000.0, 3)
+
+
+def _store(host: str, dimension: int, pool_size: int) -> InfinispanVS:
+    store = InfinispanVS(
+        embedding=HashEmbeddings(dimension),
+        hosts=[host],
+        cache_name="bench_%d" % dimension,
+        entity_name="bench%d" % dimension,
+        keyfield="_key",
+        pool_size=pool_size,
+        auto_projection=False,
+    )
+    store.config_clear()
+    store.configure({"text": "", "_key": ""}, dimension)
+    return store
+
+
+def bench_ingest(
+        store: InfinispanVS, texts: List[str], ids: List[str], batch_size: int
+) -> Dict[str, Any]:
+    store.cache_clear()
+    metadatas = [{"text": text, "_key": key} for text, key in zip(texts, ids)]
+    start = time.perf_counter()
+    store.add_texts(texts, metadatas, ids=ids, batch_size=batch_size, return_ids=False)
+    seconds = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "docs": len(texts),
+        "seconds": round(seconds, 4),
+        "docs_per_sec": round(len(texts) / seconds, 1),
+    }
+
+
+def bench_query(
+        store: InfinispanVS,
+        queries: List[List[float]],
+        truth: List[List[str]],
+        k: int,
+        concurrency: int,
+) -> Dict[str, Any]:
+    def search(query: List[float]) -> tuple:
+        start = time.perf_counter()
+        found = store.similarity_search_ids_by_vector(query, k)
+        return time.perf_counter() - start, [key for key, _ in found]
+
+    store.similarity_search_ids_by_vector(queries[0], k)  # warm up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(search, queries))
+    seconds = time.perf_counter() - start
+    latencies = [latency for latency, _ in results]
+    recall = np.mean(
+        [
+            len(set(found) & set(expected[:k])) / min(k, len(expected))
+            for (_, found), expected in zip(results, truth)
+        ]
+    )
+    return {
+        "k": k,
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "qps": round(len(queries) / seconds, 1),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "p99_ms": _percentile_ms(latencies, 99),
+        "recall": round(float(recall), 4),
+    }
+
+
+def run(
+        host: Optional[str],
+        docs: int,
+        queries: int,
+        dimensions: List[int],
+        batch_sizes: List[int],
+        concurrency: List[int],
+        ks: List[int],
+        corpus: Path = CORPUS,
+) -> Dict[str, Any]:
+    """Run the suite and return the report"""
+    sentences = _read_corpus(corpus, docs + queries)
+    texts, query_texts = sentences[:docs], sentences[docs:]
+    ids = ["doc-%d" % i for i in range(docs)]
+    report: Dict[str, Any] = {
+        "benchmark": "suite",
+        "server": host or "standin",
+        "python": platform.python_version(),
+        "docs": docs,
+        "queries": queries,
+        "ingest": [],
+        "query": [],
+    }
+    with ExitStack() as stack:
+        if host is None:
+            host = stack.enter_context(StandinServer()).host
+        for dimension in dimensions:
+            store = _store(host, dimension, max(concurrency + batch_sizes))
+            embeddings = HashEmbeddings(dimension)
+            for batch_size in batch_sizes:
+                row = bench_ingest(store, texts, ids, batch_size)
+                report["ingest"].append({"dimension": dimension, **row})
+            vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+            query_vectors = embeddings.embed_documents(query_texts)
+            truth = [
+                [ids[i] for i in top_k(similarity_scores(query, vectors), max(ks))]
+                for query in query_vectors
+            ]
+            for level in concurrency:
+                for k in ks:
+                    row = bench_query(store, query_vectors, truth, k, level)
+                    report["query"].append({"dimension": dimension, **row})
+            store.config_clear()
+    return report
+
+
+def _ints(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", help="server host:port, the stand-in if omitted")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=_ints, default=[64, 384])
+    parser.add_argument("--batch-sizes", type=_ints, default=[32, 128])
+    parser.add_argument("--concurrency", type=_ints, default=[1, 8])
+    parser.add_argument("--k", type=_ints, default=[4, 10])
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(
+        args.host,
+        args.docs,
+        args.queries,
+        args.dimensions,
+        args.batch_sizes,
+        args.concurrency,
+        args.k,
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Requests/sec of the pooled transport against one connection per call.
+
+Usage:
+    python -m benchmarks.bench_transport [--requests N] [--threads T]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+
+from infinispan_vector import Infinispan
+from infinispan_vector.testing import StandinServer
+from infinispan_vector.transport import RestTransport
+
+
+class UnpooledTransport:
+    """Opens a new connection for every request, like the module level
+    `requests` functions do."""
+
+    def request(self, method: str, url: str, timeout: float, **kwargs: Any):
+        return requests.request(method, url, timeout=timeout, **kwargs)
+
+
+def _run(ispn: Infinispan, n_requests: int, threads: int) -> float:
+    payload = json.dumps({"_type": "vector", "vector": [0.1] * 384})
+
+    def op(i: int) -> None:
+        ispn.put(str(i), payload, "bench")
+        ispn.get(str(i), "bench")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(op, range(n_requests // 2)))
+    return n_requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    with StandinServer() as server:
+        hosts = [server.host]
+        unpooled = _run(
+            Infinispan(hosts=hosts, transport=UnpooledTransport()),
+            args.requests,
+            args.threads,
+        )
+        pooled = _run(
+            Infinispan(hosts=hosts, transport=RestTransport(pool_size=args.threads)),
+            args.requests,
+            args.threads,
+        )
+    print(
+        json.dumps(
+            {
+                "benchmark": "transport",
+                "requests": args.requests,
+                "threads": args.threads,
+                "unpooled_rps": round(unpooled, 1),
+                "pooled_rps": round(pooled, 1),
+                "speedup": round(pooled / unpooled, 2),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Sweep the HNSW settings of the vector index and recommend one.
+
+Indexes a sample of vectors with every maxConnections x beamWidth
+candidate, measures recall@k against an exact search and the query
+latency, and prints the results, their Pareto front and the fastest
+setting reaching --min-recall as JSON.
+
+The sample is read from a .npy file of vectors (one per row), or embedded
+from the corpus with the deterministic embeddings of the benchmark suite.
+Without --host it runs against the stand-in server, whose exact search
+ignores the index settings: use it to check the tool, not to tune.
+
+Usage:
+    python -m benchmarks.tune_hnsw [--host HOST:PORT] [--vectors sample.npy]
+        [--max-connections 8,16,32] [--beam-widths 100,256,512]
+        [--oversample 1,2] [--k 10] [--min-recall 0.95]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from contextlib import ExitStack
+
+import numpy as np
+
+from benchmarks.bench_suite import CORPUS, HashEmbeddings, _ints, _read_corpus
+from infinispan_vector.testing import StandinServer
+from infinispan_vector.tuning import pareto_front, recommend, tune_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", help="server host:port, the stand-in if omitted")
+    parser.add_argument("--vectors", help=".npy file with the sample vectors")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--max-connections", type=_ints, default=[8, 16, 32])
+    parser.add_argument("--beam-widths", type=_ints, default=[100, 256, 512])
+    parser.add_argument(
+        "--oversample", type=lambda v: [float(x) for x in v.split(",")], default=[1.0]
+    )
+    parser.add_argument("--similarity", default="L2")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    args = parser.parse_args()
+    if args.vectors:
+        vectors = np.load(args.vectors)
+    else:
+        texts = _read_corpus(CORPUS, args.docs + args.queries)
+        vectors = np.asarray(HashEmbeddings(args.dimension).embed_documents(texts))
+    with ExitStack() as stack:
+        host = args.host or stack.enter_context(StandinServer()).host
+        results = tune_index(
+            vectors,
+            k=args.k,
+            max_connections=args.max_connections,
+            beam_widths=args.beam_widths,
+            oversample_factors=args.oversample,
+            num_queries=args.queries,
+            hosts=[host],
+            vector_similarity=args.similarity,
+        )
+    best = recommend(results, args.min_recall)
+    print(
+        json.dumps(
+            {
+                "benchmark": "tune_hnsw",
+                "server": args.host or "standin",
+                "vectors": len(vectors),
+                "k": args.k,
+                "results": [result._asdict() for result in results],
+                "pareto": [result._asdict() for result in pareto_front(results)],
+                "recommended": None if best is None else best._asdict(),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,20 @@
 """Main entrypoint into package."""
-from infinispan_vector.infinispanvs import Infinispan, InfinispanVS
+from infinispan_vector.aio import AsyncInfinispan
+from infinispan_vector.embedding_cache import MMapEmbeddingCache
+from infinispan_vector.hotrod import HotRodTransport
+from infinispan_vector.infinispanvs import (
+    Hit,
+    Infinispan,
+    InfinispanBulkWriteError,
+    InfinispanVS,
+    content_id,
+)
+from infinispan_vector.metrics import (
+    Metrics,
+    MetricsHook,
+    OpenTelemetryHook,
+    PrometheusHook,
+)
+from infinispan_vector.quantization import Int8Quantizer
+from infinispan_vector.routing import HedgePolicy, NodeRouter
+from infinispan_vector.transport import RestTransport
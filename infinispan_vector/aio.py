@@ -0,0 +1,458 @@
+"""Module providing an asyncio client for the Infinispan REST interface"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import weakref
+from typing import (
+    Any,
+    List,
+    Mapping,
+    Optional,
+    Union,
+)
+
+from infinispan_vector.metrics import Metrics, payload_size
+from infinispan_vector.routing import ROUND_ROBIN, HedgePolicy, Node, NodeRouter
+from infinispan_vector.transport import POOL_SIZE, REST_TIMEOUT
+
+
+class AsyncResponse:
+    """Fully read http response returned by `AsyncInfinispan`.
+
+    Mirrors the part of `requests.Response` used by the vector store,
+    so the same result handling works for sync and async calls.
+    """
+
+    def __init__(self, status_code: int, content: bytes, headers: Mapping[str, str]):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class AsyncInfinispan:
+    """Asyncio helper class for `Infinispan` REST interface.
+
+    Non-blocking counterpart of the `Infinispan` class, built on aiohttp.
+    It accepts the same configuration entries and keeps a pool of up to
+    `pool_size` keep-alive connections, so many queries and writes can share
+    one event loop.
+
+    Requests are spread over the hosts like `Infinispan` does, sharing its
+    `NodeRouter` when passed as the `router` configuration entry. Queries
+    are hedged like `Infinispan` does; here the slower request is
+    cancelled. Requests are instrumented like `Infinispan` does, with the
+    collector passed as the `metrics` configuration entry.
+
+    aiohttp sessions are bound to the loop they were created in, so one
+    session is created on first use in each running loop (i.e. each
+    `asyncio.run` call); call `close()` in each loop when done.
+    """
+
+    def __init__(self, **kwargs: Any):
+        try:
+            import aiohttp  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "Could not import aiohttp python package. "
+                "Please install it with `pip install aiohttp`."
+            )
+        self._configuration = kwargs
+        self._schema = str(self._configuration.get("schema", "http"))
+        self._hosts = tuple(self._configuration.get("hosts", ["127.0.0.1:11222"]))
+        self._host = str(self._hosts[0])
+        self._default_node = self._schema + "://" + self._host
+        self._cache_url = str(self._configuration.get("cache_url", "/rest/v2/caches"))
+        self._schema_url = str(self._configuration.get("cache_url", "/rest/v2/schemas"))
+        self._use_post_for_query = str(
+            self._configuration.get("use_post_for_query", True)
+        )
+        self._default_timeout = float(self._configuration.get("timeout", REST_TIMEOUT))
+        self._timeouts = dict(self._configuration.get("timeouts", {}))
+        self._pool_size = int(self._configuration.get("pool_size", POOL_SIZE))
+        self._sessions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._router = self._configuration.get("router") or NodeRouter(
+            [self._schema + "://" + str(host) for host in self._hosts],
+            strategy=str(self._configuration.get("routing", ROUND_ROBIN)),
+            retry_after=float(self._configuration.get("node_retry_after", 30.0)),
+        )
+        self._hedge_policy: Optional[HedgePolicy] = self._configuration.get(
+            "hedge_policy"
+        )
+        if self._hedge_policy is None and self._configuration.get("hedge_queries"):
+            self._hedge_policy = HedgePolicy(
+                percentile=float(self._configuration.get("hedge_percentile", 95.0)),
+                min_delay=float(self._configuration.get("hedge_min_delay", 0.002)),
+                max_delay=float(self._configuration.get("hedge_max_delay", 1.0)),
+            )
+        self._metrics = Metrics.of(
+            self._configuration.get("metrics"),
+            self._configuration.get("metrics_hooks", ()),
+        )
+
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        """The metrics collector, None if instrumentation is off"""
+        return self._metrics
+
+    @property
+    def hedge_policy(self) -> Optional[HedgePolicy]:
+        """The query hedging policy, None if hedging is off"""
+        return self._hedge_policy
+
+    def _get_session(self) -> Any:
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self._pool_size)
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def _request(
+            self,
+            operation: str,
+            method: str,
+            api_url: str,
+            tried: Optional[List[Node]] = None,
+            **kwargs: Any,
+    ) -> AsyncResponse:
+        metrics = self._metrics
+        if metrics is None:
+            return await self._send(operation, method, api_url, tried, **kwargs)
+        name = "http." + operation
+        with metrics.stage(name):
+            response = await self._send(operation, method, api_url, tried, **kwargs)
+        metrics.transferred(
+            name, payload_size(kwargs.get("data")), len(response.content)
+        )
+        if not response.ok and response.status_code != 404:
+            metrics.error(name)
+        return response
+
+    async def _send(
+            self,
+            operation: str,
+            method: str,
+            api_url: str,
+            tried: Optional[List[Node]] = None,
+            **kwargs: Any,
+    ) -> AsyncResponse:
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(
+            total=self._timeouts.get(operation, self._default_timeout)
+        )
+        tried = [] if tried is None else tried
+        while True:
+            node = self._router.pick(tried)
+            if node is None:
+                raise aiohttp.ClientConnectionError(
+                    "No Infinispan node reachable for " + api_url
+                )
+            tried.append(node)
+            start = time.perf_counter()
+            try:
+                async with self._get_session().request(
+                        method, node.url + api_url, timeout=timeout, **kwargs
+                ) as response:
+                    content = await response.read()
+            except aiohttp.ClientConnectionError:
+                self._router.failure(node)
+                if len(tried) >= len(self._router.nodes):
+                    raise
+                continue
+            self._router.success(node, time.perf_counter() - start)
+            return AsyncResponse(response.status, content, response.headers)
+
+    async def close(self) -> None:
+        """Close the pooled connections of the running loop"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    async def req_query(
+            self,
+            query: str,
+            cache_name: str,
+            local: bool = False,
+            offset: Optional[int] = None,
+            max_results: Optional[int] = None,
+    ) -> AsyncResponse:
+        """Request a query
+        Args:
+            query(str): query requested
+            cache_name(str): name of the target cache
+            local(boolean): whether the query is local to clustered
+            offset(int): index of the first result to return
+            max_results(int): max number of results to return,
+                the server default applies if None
+        Returns:
+            An http Response containing the result set or errors
+        """
+        api_url = self._cache_url + "/" + cache_name
+        paging = {}
+        if offset is not None:
+            paging["offset"] = offset
+        if max_results is not None:
+            paging["max_results"] = max_results
+
+        async def send(tried: List[Node]) -> AsyncResponse:
+            if self._use_post_for_query:
+                return await self._request(
+                    "query",
+                    "POST",
+                    api_url,
+                    tried,
+                    params={"action": "search", "local": str(local)},
+                    data=json.dumps({"query": query, **paging}),
+                    headers={"Content-Type": "application/json"},
+                )
+            return await self._request(
+                "query",
+                "GET",
+                api_url,
+                tried,
+                params={
+                    "action": "search",
+                    "query": query,
+                    "local": str(local),
+                    **paging,
+                },
+            )
+
+        if self._hedge_policy is None:
+            return await send([])
+        return await self._hedged(send)
+
+    async def _hedged(self, send: Any) -> AsyncResponse:
+        policy = self._hedge_policy
+        assert policy is not None
+        tried: List[Node] = []
+
+        async def timed() -> AsyncResponse:
+            start = time.perf_counter()
+            response = await send(tried)
+            policy.record(time.perf_counter() - start)
+            return response
+
+        policy.started()
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait((primary,), timeout=policy.delay())
+        if done or len(tried) >= len(self._router.nodes):
+            return await primary
+        policy.started(hedged=True)
+        hedge = asyncio.ensure_future(timed())
+        try:
+            done, _ = await asyncio.wait(
+                (primary, hedge), return_when=asyncio.FIRST_COMPLETED
+            )
+            winner = primary if primary in done else hedge
+            if winner.exception() is not None:
+                # the first answer is an error, wait for the other one
+                other = hedge if winner is primary else primary
+                await asyncio.wait((other,))
+                if other.exception() is None:
+                    winner = other
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+        if winner is hedge:
+            policy.won()
+        return winner.result()
+
+    async def post(self, key: str, data: str, cache_name: str) -> AsyncResponse:
+        """Post an entry
+        Args:
+            key(str): key of the entry
+            data(str): content of the entry in json format
+            cache_name(str): target cache
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        return await self._request(
+            "post",
+            "POST",
+            api_url,
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def put(
+            self,
+            key: str,
+            data: Union[str, bytes],
+            cache_name: str,
+            content_type: str = "application/json",
+    ) -> AsyncResponse:
+        """Put an entry
+        Args:
+            key(str): key of the entry
+            data(str): content of the entry, in json format by default
+            cache_name(str): target cache
+            content_type(str): media type of data
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        return await self._request(
+            "put",
+            "PUT",
+            api_url,
+            data=data,
+            headers={"Content-Type": content_type},
+        )
+
+    async def get(self, key: str, cache_name: str) -> AsyncResponse:
+        """Get an entry
+        Args:
+            key(str): key of the entry
+            cache_name(str): target cache
+        Returns:
+            An http Response containing the entry or errors
+        """
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        return await self._request(
+            "get", "GET", api_url, headers={"Content-Type": "application/json"}
+        )
+
+    async def delete(self, key: str, cache_name: str) -> AsyncResponse:
+        """Delete an entry
+        Args:
+            key(str): key of the entry
+            cache_name(str): target cache
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        return await self._request("delete", "DELETE", api_url)
+
+    async def schema_post(self, name: str, proto: str) -> AsyncResponse:
+        """Deploy a schema
+        Args:
+            name(str): name of the schema. Will be used as a key
+            proto(str): protobuf schema
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._schema_url + "/" + name
+        return await self._request("schema", "POST", api_url, data=proto)
+
+    async def schema_get(self, name: str) -> AsyncResponse:
+        """Get a schema
+        Args:
+            name(str): name of the schema.
+        Returns:
+            An http Response containing the protobuf schema
+        """
+        api_url = self._schema_url + "/" + name
+        return await self._request("schema", "GET", api_url)
+
+    async def schema_delete(self, name: str) -> AsyncResponse:
+        """Delete a schema
+        Args:
+            name(str): name of the schema.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._schema_url + "/" + name
+        return await self._request("schema", "DELETE", api_url)
+
+    async def cache_post(self, name: str, config: str) -> AsyncResponse:
+        """Create a cache
+        Args:
+            name(str): name of the cache.
+            config(str): configuration of the cache.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._cache_url + "/" + name
+        return await self._request(
+            "cache",
+            "POST",
+            api_url,
+            data=config,
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def cache_delete(self, name: str) -> AsyncResponse:
+        """Delete a cache
+        Args:
+            name(str): name of the cache.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = self._cache_url + "/" + name
+        return await self._request("cache", "DELETE", api_url)
+
+    async def cache_clear(self, cache_name: str) -> AsyncResponse:
+        """Clear a cache
+        Args:
+            cache_name(str): name of the cache.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = (
+                self._cache_url + "/" + cache_name + "?action=clear"
+        )
+        return await self._request("cache", "POST", api_url)
+
+    async def cache_exists(self, cache_name: str) -> bool:
+        """Check if a cache exists
+        Args:
+            cache_name(str): name of the cache.
+        Returns:
+            True if cache exists
+        """
+        api_url = (
+                self._cache_url + "/" + cache_name + "?action=clear"
+        )
+        return (await self._request("cache", "HEAD", api_url)).ok
+
+    async def index_clear(self, cache_name: str) -> AsyncResponse:
+        """Clear an index on a cache
+        Args:
+            cache_name(str): name of the cache.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = (
+                self._cache_url
+                + "/"
+                + cache_name
+                + "/search/indexes?action=clear"
+        )
+        return await self._request("index", "POST", api_url)
+
+    async def index_reindex(self, cache_name: str) -> AsyncResponse:
+        """Rebuild index on a cache
+        Args:
+            cache_name(str): name of the cache.
+        Returns:
+            An http Response containing the result of the operation
+        """
+        api_url = (
+                self._cache_url
+                + "/"
+                + cache_name
+                + "/search/indexes?action=reindex"
+        )
+        return await self._request("index", "POST", api_url)
@@ -0,0 +1,346 @@
+"""Module providing a persistent embedding cache shared across processes"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from langchain_core.embeddings import Embeddings
+
+from infinispan_vector.utils import _import_numpy
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None  # type: ignore
+
+_MAGIC = b"ISPNEMB1"
+_HEADER = struct.Struct("<8sI52x")
+_DIGEST_SIZE = 16
+# hash index: magic, slots, indexed records, inode of the indexed file
+_INDEX_MAGIC = b"ISPNIDX1"
+_INDEX_HEADER = struct.Struct("<8sQQQ32x")
+# slot: record key and record row + 1, 0 for an empty slot
+_SLOT = struct.Struct("<%dsI" % _DIGEST_SIZE)
+_ROW = struct.Struct("<I")
+_MIN_SLOTS = 1024
+
+
+class MMapEmbeddingCache(Embeddings):
+    """`Embeddings` wrapper that persists vectors in a memory-mapped file.
+
+    Vectors are stored as float32 records in an append-only file, each
+    record prefixed by a hash of the model id and the text. Records are
+    found through an open addressing hash table (linear probing, at most
+    half full) kept in a second file, `path + ".idx"`. Both files are
+    memory mapped, so any number of processes look vectors up through the
+    shared page cache without copying or indexing the records: opening the
+    cache, or seeing the records appended by another process, only maps
+    the files again. Appends, index updates and compaction are serialized
+    with a file lock; a found record is checked against its key, so
+    readers never need the lock.
+
+    Only cache misses are sent to the wrapped model. When the file holds
+    more than `max_entries` records, it is compacted keeping the most
+    recent three quarters of them.
+
+    Example:
+        .. code-block:: python
+            embeddings = MMapEmbeddingCache(
+                HuggingFaceEmbeddings(model_name=model_name),
+                "/var/cache/embeddings/minilm.bin",
+            )
+            vectorDb = InfinispanVS.from_documents(docs, embedding=embeddings)
+    """
+
+    def __init__(
+            self,
+            embedding: Embeddings,
+            path: str,
+            model_id: Optional[str] = None,
+            max_entries: int = 1_000_000,
+    ):
+        self.embedding = embedding
+        self.path = path
+        self.model_id = str(
+            model_id
+            or getattr(embedding, "model_name", None)
+            or getattr(embedding, "model", None)
+            or type(embedding).__name__
+        )
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._mmap: Optional[mmap.mmap] = None
+        self._records: Any = None
+        self._inode: Optional[int] = None
+        self._dimension = 0
+        self._count = 0
+        self._index_path = path + ".idx"
+        self._index: Optional[mmap.mmap] = None
+        self._index_inode: Optional[int] = None
+        self._slots = 0
+
+    def _digest(self, kind: str, text: str) -> bytes:
+        return hashlib.blake2b(
+            (self.model_id + "\0" + kind + "\0" + text).encode("utf-8"),
+            digest_size=_DIGEST_SIZE,
+        ).digest()
+
+    def _dtype(self) -> Any:
+        np = _import_numpy()
+        return np.dtype(
+            [("key", "V%d" % _DIGEST_SIZE), ("vector", "<f4", (self._dimension,))]
+        )
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with self._lock:
+            with open(self.path + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Map the files again if they grew or were replaced"""
+        np = _import_numpy()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if stat.st_size <= _HEADER.size:
+            return
+        self._refresh_index()
+        if (
+                stat.st_ino == self._inode
+                and self._mmap is not None
+                and stat.st_size == len(self._mmap)
+        ):
+            return
+        self._inode = stat.st_ino
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._dimension = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not an embedding cache file: " + self.path)
+        dtype = self._dtype()
+        self._count = (len(self._mmap) - _HEADER.size) // dtype.itemsize
+        self._records = np.frombuffer(
+            self._mmap, dtype=dtype, count=self._count, offset=_HEADER.size
+        )
+
+    def _refresh_index(self) -> None:
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            self._index = None
+            self._index_inode = None
+            return
+        if stat.st_ino == self._index_inode or stat.st_size <= _INDEX_HEADER.size:
+            return
+        with open(self._index_path, "rb") as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._slots, _, _ = _INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != _INDEX_MAGIC:
+            raise ValueError("Not an embedding cache index: " + self._index_path)
+        self._index_inode = stat.st_ino
+
+    def _find(self, digest: bytes) -> Optional[int]:
+        """Row of the record with this key according to the index"""
+        index = self._index
+        if index is None:
+            return None
+        mask = self._slots - 1
+        slot = int.from_bytes(digest[:8], "little") & mask
+        for _ in range(self._slots):
+            key, row = _SLOT.unpack_from(index, _INDEX_HEADER.size + slot * _SLOT.size)
+            if row == 0:
+                return None
+            if key == digest:
+                return row - 1
+            slot = (slot + 1) & mask
+        return None
+
+    def _vector(self, digest: bytes, row: Optional[int]) -> Optional[List[float]]:
+        if row is None or row >= self._count:
+            return None
+        if self._records["key"][row].tobytes() != digest:
+            return None  # index and records of different generations
+        return self._records["vector"][row].tolist()
+
+    def _lookup(self, digests: List[bytes]) -> List[Optional[List[float]]]:
+        with self._lock:
+            rows = [self._find(d) for d in digests]
+            if any(row is None or row >= self._count for row in rows):
+                self._refresh()
+                if self._index_behind():
+                    # i.e. a file written before the index existed
+                    with self._file_lock():
+                        self._refresh()
+                        self._update_index()
+                rows = [self._find(d) for d in digests]
+            return [self._vector(d, row) for d, row in zip(digests, rows)]
+
+    def _index_behind(self) -> bool:
+        if not self._count:
+            return False
+        if self._index is None:
+            return True
+        _, _, indexed, inode = _INDEX_HEADER.unpack_from(self._index, 0)
+        return inode != self._inode or indexed < self._count
+
+    @staticmethod
+    def _insert(index: mmap.mmap, slots: int, digest: bytes, row: int) -> None:
+        mask = slots - 1
+        slot = int.from_bytes(digest[:8], "little") & mask
+        while True:
+            offset = _INDEX_HEADER.size + slot * _SLOT.size
+            key, stored = _SLOT.unpack_from(index, offset)
+            if stored == 0 or key == digest:
+                # the key first: readers take a slot without row as empty
+                index[offset:offset + _DIGEST_SIZE] = digest
+                _ROW.pack_into(index, offset + _DIGEST_SIZE, row + 1)
+                return
+            slot = (slot + 1) & mask
+
+    def _update_index(self) -> None:
+        """Index the records appended since the last update, or rebuild the
+        index if it is missing, stale or more than half full. Called with
+        the file lock held."""
+        header = None
+        if self._index is not None:
+            header = _INDEX_HEADER.unpack_from(self._index, 0)
+        if (
+                header is None
+                or header[3] != self._inode
+                or header[2] > self._count
+                or 2 * self._count > self._slots
+        ):
+            self._rebuild_index()
+            return
+        if header[2] == self._count:
+            return
+        with open(self._index_path, "r+b") as f:
+            with mmap.mmap(f.fileno(), 0) as index:
+                keys = self._records["key"]
+                for row in range(header[2], self._count):
+                    self._insert(index, self._slots, keys[row].tobytes(), row)
+                _INDEX_HEADER.pack_into(
+                    index, 0, _INDEX_MAGIC, self._slots, self._count, self._inode
+                )
+
+    def _rebuild_index(self) -> None:
+        slots = _MIN_SLOTS
+        while slots < 4 * self._count:
+            slots *= 2
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w+b") as f:
+            f.truncate(_INDEX_HEADER.size + slots * _SLOT.size)
+            with mmap.mmap(f.fileno(), 0) as index:
+                keys = self._records["key"]
+                for row in range(self._count):
+                    self._insert(index, slots, keys[row].tobytes(), row)
+                _INDEX_HEADER.pack_into(
+                    index, 0, _INDEX_MAGIC, slots, self._count, self._inode
+                )
+                index.flush()
+        os.replace(tmp_path, self._index_path)
+        self._refresh_index()
+
+    def _append(self, digests: List[bytes], vectors: List[List[float]]) -> None:
+        np = _import_numpy()
+        with self._file_lock():
+            self._refresh()
+            if self._count:
+                self._update_index()
+            new: Dict[bytes, List[float]] = {}
+            for d, v in zip(digests, vectors):
+                if d not in new and self._vector(d, self._find(d)) is None:
+                    new[d] = v
+            if not new:
+                return
+            if self._dimension == 0:
+                self._dimension = len(next(iter(new.values())))
+                with open(self.path, "wb") as f:
+                    f.write(_HEADER.pack(_MAGIC, self._dimension))
+            records = np.empty(len(new), dtype=self._dtype())
+            records["key"] = np.frombuffer(
+                b"".join(new), dtype="V%d" % _DIGEST_SIZE
+            )
+            records["vector"] = list(new.values())
+            with open(self.path, "ab") as f:
+                f.write(records.tobytes())
+            self._refresh()
+            self._update_index()
+            if self._count > self.max_entries:
+                self._compact(self.max_entries * 3 // 4)
+
+    def _compact(self, keep: int) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self._dimension))
+            f.write(self._records[self._count - keep:].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._refresh()
+        self._rebuild_index()
+
+    def _embed(self, kind: str, texts: List[str]) -> List[List[float]]:
+        digests = [self._digest(kind, text) for text in texts]
+        vectors = self._lookup(digests)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            if kind == "query":
+                computed = [self.embedding.embed_query(t) for t in missing_texts]
+            else:
+                computed = self.embedding.embed_documents(missing_texts)
+            self._append([digests[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors  # type: ignore
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, calling the model only for cache misses"""
+        return self._embed("document", list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, calling the model only on a cache miss"""
+        return self._embed("query", [text])[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
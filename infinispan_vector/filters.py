@@ -0,0 +1,92 @@
+"""Module compiling metadata filters into Ickle conditions
+
+A filter is a dict mapping metadata fields to conditions:
+
+    {"label": "news"}                          equality
+    {"page": {"$gte": 1, "$lt": 10}}           ranges ($gt, $gte, $lt, $lte)
+    {"label": {"$ne": "draft"}}                inequality
+    {"title": {"$in": ["a", "b"]}}             membership ($in, $nin)
+    {"$or": [{"label": "a"}, {"page": 3}]}     disjunction
+    {"$and": [{...}, {...}]}                   conjunction
+
+Entries of the same dict are combined with AND.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Any, List
+
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+_COMPARISONS = {
+    "$eq": "=",
+    "$ne": "!=",
+    "$gt": ">",
+    "$gte": ">=",
+    "$lt": "<",
+    "$lte": "<=",
+}
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise ValueError("Unsupported filter value: " + repr(value))
+
+
+def _field(name: str, alias: str) -> str:
+    if not _FIELD.match(name):
+        raise ValueError("Invalid filter field name: " + repr(name))
+    return alias + "." + name
+
+
+def _condition(name: str, condition: Any, alias: str) -> List[str]:
+    field = _field(name, alias)
+    if not isinstance(condition, dict):
+        return [field + " = " + _literal(condition)]
+    clauses = []
+    for op, value in condition.items():
+        if op in _COMPARISONS:
+            clauses.append(field + " " + _COMPARISONS[op] + " " + _literal(value))
+        elif op in ("$in", "$nin"):
+            values = list(value)
+            if not values:
+                raise ValueError(op + " needs at least one value")
+            clauses.append(
+                field
+                + (" in (" if op == "$in" else " not in (")
+                + ", ".join(_literal(v) for v in values)
+                + ")"
+            )
+        else:
+            raise ValueError("Unsupported filter operator: " + op)
+    return clauses
+
+
+def compile_filter(filter: dict, alias: str = "v") -> str:  # noqa: A002
+    """Compile a metadata filter into an Ickle condition
+    Args:
+        filter(dict): the filter, see module documentation
+        alias(str): alias of the entity in the query
+    Returns:
+        The Ickle condition, i.e. "(v.label = 'a' and v.page >= 1)"
+    """
+    if not isinstance(filter, dict) or not filter:
+        raise ValueError("A filter must be a non empty dict")
+    clauses = []
+    for key, value in filter.items():
+        if key in ("$and", "$or"):
+            if not value:
+                raise ValueError(key + " needs at least one filter")
+            joiner = " and " if key == "$and" else " or "
+            clauses.append(
+                "(" + joiner.join(compile_filter(f, alias) for f in value) + ")"
+            )
+        else:
+            clauses.extend(_condition(key, value, alias))
+    return "(" + " and ".join(clauses) + ")"
@@ -0,0 +1,462 @@
+"""Module providing a Hot Rod transport for the Infinispan helper
+
+Hot Rod is the native binary protocol of Infinispan. This transport speaks
+protocol version 3.0 for the operations used by the vector store (put, get,
+remove and query) and is topology aware: it asks the server for the
+consistent hash of each cache and sends every key operation straight to the
+node owning the key.
+
+Keys are sent as protostream wrapped strings, the same storage format used
+for the string keys of the REST interface, and values and queries as JSON,
+so entries written by either transport can be read by the other one.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import math
+import queue
+import socket
+import struct
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from infinispan_vector.aio import AsyncResponse
+from infinispan_vector.protostream import (
+    PROTOSTREAM_MEDIA_TYPE,
+    encode_varint,
+    wrap_string,
+)
+from infinispan_vector.transport import POOL_SIZE, REST_TIMEOUT
+
+REQUEST_MAGIC = 0xA0
+RESPONSE_MAGIC = 0xA1
+VERSION = 30
+
+PUT = 0x01
+GET = 0x03
+REMOVE = 0x0B
+QUERY = 0x1F
+ERROR = 0x50
+
+STATUS_OK = 0x00
+STATUS_NOT_EXECUTED = 0x01
+STATUS_KEY_NOT_FOUND = 0x02
+
+INTELLIGENCE_HASH_AWARE = 0x03
+DEFAULT_EXPIRATION = 0x77
+
+KEY_MEDIA_TYPE = PROTOSTREAM_MEDIA_TYPE
+VALUE_MEDIA_TYPE = "application/json"
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# Hot Rod variable length ints are protobuf varints
+encode_vint = encode_varint
+
+
+def encode_bytes(value: bytes) -> bytes:
+    """Encode a length prefixed byte array"""
+    return encode_vint(len(value)) + value
+
+
+def encode_string(value: str) -> bytes:
+    """Encode a length prefixed utf-8 string"""
+    return encode_bytes(value.encode("utf-8"))
+
+
+def encode_media_type(media_type: str) -> bytes:
+    """Encode a custom media type without parameters"""
+    return b"\x02" + encode_string(media_type) + encode_vint(0)
+
+
+class Reader:
+    """Decoder of the Hot Rod primitive types from a buffered stream"""
+
+    def __init__(self, stream: Any):
+        self._stream = stream
+
+    def read(self, n: int) -> bytes:
+        data = self._stream.read(n)
+        if len(data) < n:
+            raise ConnectionError("Hot Rod connection closed")
+        return data
+
+    def byte(self) -> int:
+        return self.read(1)[0]
+
+    def vint(self) -> int:
+        shift = 0
+        value = 0
+        while True:
+            b = self.byte()
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                return value
+            shift += 7
+
+    vlong = vint
+
+    def ushort(self) -> int:
+        return struct.unpack(">H", self.read(2))[0]
+
+    def bytes(self) -> bytes:
+        return self.read(self.vint())
+
+    def string(self) -> str:
+        return self.bytes().decode("utf-8")
+
+    def media_type(self) -> Optional[str]:
+        kind = self.byte()
+        if kind == 1:
+            return str(self.vint())
+        if kind == 2:
+            media_type = self.string()
+            for _ in range(self.vint()):
+                self.string()
+                self.string()
+            return media_type
+        return None
+
+
+def _rotl(value: int, shift: int) -> int:
+    return ((value << shift) | (value >> (64 - shift))) & _MASK64
+
+
+def _fmix(k: int) -> int:
+    k ^= k >> 33
+    k = (k * 0xFF51AFD7ED558CCD) & _MASK64
+    k ^= k >> 33
+    k = (k * 0xC4CEB9FE1A85EC53) & _MASK64
+    k ^= k >> 33
+    return k
+
+
+def murmur3_x64_64(data: bytes, seed: int = 9001) -> int:
+    """64 bit MurmurHash3 as computed by Infinispan to place keys,
+    returned as an unsigned value"""
+    h1 = 0x9368E53C2F6AF274 ^ seed
+    h2 = 0x586DCD208F7CD3FD ^ seed
+    c1 = 0x87C37B91114253D5
+    c2 = 0x4CF5AD432745937F
+
+    def bmix(k1: int, k2: int) -> None:
+        nonlocal h1, h2, c1, c2
+        k1 = (k1 * c1) & _MASK64
+        k1 = _rotl(k1, 23)
+        k1 = (k1 * c2) & _MASK64
+        h1 ^= k1
+        h1 = (h1 + h2) & _MASK64
+        h2 = _rotl(h2, 41)
+        k2 = (k2 * c2) & _MASK64
+        k2 = _rotl(k2, 23)
+        k2 = (k2 * c1) & _MASK64
+        h2 ^= k2
+        h2 = (h2 + h1) & _MASK64
+        h1 = (h1 * 3 + 0x52DCE729) & _MASK64
+        h2 = (h2 * 3 + 0x38495AB5) & _MASK64
+        c1 = (c1 * 5 + 0x7B7D159C) & _MASK64
+        c2 = (c2 * 5 + 0x6BCE6396) & _MASK64
+
+    blocks = len(data) // 16
+    for i in range(blocks):
+        bmix(*struct.unpack_from("<QQ", data, i * 16))
+    tail = data[blocks * 16:]
+    if tail:
+        k1 = k2 = 0
+        for i, b in enumerate(tail):
+            # the java implementation sign extends the tail bytes
+            signed = (b - 256 if b > 127 else b) << (8 * (i % 8))
+            if i < 8:
+                k1 ^= signed & _MASK64
+            else:
+                k2 ^= signed & _MASK64
+        bmix(k1, k2)
+    h2 ^= len(data)
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    h1 = _fmix(h1)
+    h2 = _fmix(h2)
+    return (h1 + h2) & _MASK64
+
+
+def segment_of(key: bytes, num_segments: int) -> int:
+    """Segment of the consistent hash owning a key, given in storage format"""
+    normalized = (murmur3_x64_64(key) >> 32) & 0x7FFFFFFF
+    return normalized // int(math.ceil(2 ** 31 / num_segments))
+
+
+class Topology:
+    """Servers of a cache and owners of its hash segments"""
+
+    def __init__(
+            self,
+            topology_id: int,
+            servers: List[Tuple[str, int]],
+            owners: Optional[List[List[int]]] = None,
+    ):
+        self.topology_id = topology_id
+        self.servers = servers
+        self.owners = owners or []
+
+    def owner(self, key: bytes) -> Optional[Tuple[str, int]]:
+        """Address of the primary owner of a key, None if unknown"""
+        if not self.owners:
+            return None
+        segment_owners = self.owners[segment_of(key, len(self.owners))]
+        return self.servers[segment_owners[0]] if segment_owners else None
+
+    @staticmethod
+    def read(reader: Reader) -> "Topology":
+        topology_id = reader.vint()
+        servers = [(reader.string(), reader.ushort()) for _ in range(reader.vint())]
+        owners: List[List[int]] = []
+        if reader.byte() != 0:
+            for _ in range(reader.vint()):
+                owners.append([reader.vint() for _ in range(reader.byte())])
+        return Topology(topology_id, servers, owners)
+
+    def encode(self) -> bytes:
+        out = bytearray(encode_vint(self.topology_id))
+        out += encode_vint(len(self.servers))
+        for host, port in self.servers:
+            out += encode_string(host) + struct.pack(">H", port)
+        if not self.owners:
+            return bytes(out) + b"\x00"
+        out += b"\x03" + encode_vint(len(self.owners))
+        for segment_owners in self.owners:
+            out.append(len(segment_owners))
+            for owner in segment_owners:
+                out += encode_vint(owner)
+        return bytes(out)
+
+
+class HotRodResponse(AsyncResponse):
+    """Result of a Hot Rod operation, carrying the http status code the
+    same REST operation would return"""
+
+
+class _Connection:
+    def __init__(self, address: Tuple[str, int], timeout: float):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = Reader(self.sock.makefile("rb"))
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class HotRodTransport:
+    """Pooled, topology aware Hot Rod client for the `Infinispan` helper.
+
+    Keeps up to `pool_size` idle connections per node. The first operation
+    on a cache fetches its topology, later responses carry updates when
+    the cluster changes. Key operations go to the primary owner of the key;
+    queries are spread over the nodes.
+    """
+
+    def __init__(
+            self,
+            hosts: Iterable[str],
+            pool_size: int = POOL_SIZE,
+            timeout: float = REST_TIMEOUT,
+    ):
+        self._initial = [self._address(host) for host in hosts]
+        self._pool_size = pool_size
+        self._timeout = timeout
+        self._pools: Dict[Tuple[str, int], queue.LifoQueue] = {}
+        self._topologies: Dict[str, Topology] = {}
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._round_robin = itertools.count()
+
+    @staticmethod
+    def _address(host: str) -> Tuple[str, int]:
+        name, _, port = host.rpartition(":")
+        return (name, int(port)) if name else (host, 11222)
+
+    @property
+    def topologies(self) -> Dict[str, Topology]:
+        return self._topologies
+
+    def _servers(self, cache_name: str) -> List[Tuple[str, int]]:
+        topology = self._topologies.get(cache_name)
+        return topology.servers if topology and topology.servers else self._initial
+
+    def _route(self, cache_name: str, key: Optional[bytes]) -> Tuple[str, int]:
+        topology = self._topologies.get(cache_name)
+        if key is not None and topology is not None:
+            owner = topology.owner(key)
+            if owner is not None:
+                return owner
+        servers = self._servers(cache_name)
+        return servers[next(self._round_robin) % len(servers)]
+
+    def _acquire(self, address: Tuple[str, int], timeout: float) -> _Connection:
+        with self._lock:
+            pool = self._pools.setdefault(address, queue.LifoQueue())
+        try:
+            conn = pool.get_nowait()
+            conn.sock.settimeout(timeout)
+            return conn
+        except queue.Empty:
+            return _Connection(address, timeout)
+
+    def _release(self, address: Tuple[str, int], conn: _Connection) -> None:
+        pool = self._pools.get(address)
+        if pool is not None and pool.qsize() < self._pool_size:
+            pool.put(conn)
+        else:
+            conn.close()
+
+    def _header(
+            self, opcode: int, cache_name: str, value_media_type: str
+    ) -> bytes:
+        topology = self._topologies.get(cache_name)
+        return (
+                bytes([REQUEST_MAGIC])
+                + encode_vint(next(self._message_ids))
+                + bytes([VERSION, opcode])
+                + encode_string(cache_name)
+                + encode_vint(0)
+                + bytes([INTELLIGENCE_HASH_AWARE])
+                + encode_vint(topology.topology_id if topology else 0)
+                + encode_media_type(KEY_MEDIA_TYPE)
+                + encode_media_type(value_media_type)
+        )
+
+    def _execute(
+            self,
+            opcode: int,
+            cache_name: str,
+            body: bytes,
+            key: Optional[bytes],
+            parse: Callable[[Reader, int], HotRodResponse],
+            timeout: Optional[float] = None,
+            value_media_type: str = VALUE_MEDIA_TYPE,
+    ) -> HotRodResponse:
+        timeout = self._timeout if timeout is None else timeout
+        header = self._header(opcode, cache_name, value_media_type)
+        address = self._route(cache_name, key)
+        for attempt in range(2):
+            conn = self._acquire(address, timeout)
+            try:
+                conn.sock.sendall(header + body)
+                response = self._read_response(conn.reader, cache_name, parse)
+            except OSError:
+                conn.close()
+                if attempt:
+                    raise
+                # stale pooled connection or dead node: retry once elsewhere
+                self._topologies.pop(cache_name, None)
+                address = self._route(cache_name, None)
+                continue
+            self._release(address, conn)
+            return response
+        raise AssertionError("unreachable")
+
+    def _read_response(
+            self,
+            reader: Reader,
+            cache_name: str,
+            parse: Callable[[Reader, int], HotRodResponse],
+    ) -> HotRodResponse:
+        if reader.byte() != RESPONSE_MAGIC:
+            raise ConnectionError("Invalid Hot Rod response")
+        reader.vlong()
+        opcode = reader.byte()
+        status = reader.byte()
+        if reader.byte() == 1:
+            self._topologies[cache_name] = Topology.read(reader)
+        if opcode == ERROR or status >= 0x80:
+            return HotRodResponse(500, reader.bytes(), {})
+        return parse(reader, status)
+
+    @staticmethod
+    def _no_content(reader: Reader, status: int) -> HotRodResponse:
+        return HotRodResponse(404 if status == STATUS_KEY_NOT_FOUND else 204, b"", {})
+
+    @staticmethod
+    def _content(reader: Reader, status: int) -> HotRodResponse:
+        if status == STATUS_KEY_NOT_FOUND:
+            return HotRodResponse(404, b"", {})
+        return HotRodResponse(
+            200, reader.bytes(), {"Content-Type": VALUE_MEDIA_TYPE}
+        )
+
+    def put(
+            self,
+            key: str,
+            data: Union[str, bytes],
+            cache_name: str,
+            timeout: Optional[float] = None,
+            media_type: str = VALUE_MEDIA_TYPE,
+    ) -> HotRodResponse:
+        """Store an entry on the owner of its key"""
+        wrapped = wrap_string(key)
+        body = (
+                encode_bytes(wrapped)
+                + bytes([DEFAULT_EXPIRATION])
+                + encode_bytes(data.encode("utf-8") if isinstance(data, str) else data)
+        )
+        return self._execute(
+            PUT, cache_name, body, wrapped, self._no_content, timeout, media_type
+        )
+
+    def get(
+            self, key: str, cache_name: str, timeout: Optional[float] = None
+    ) -> HotRodResponse:
+        """Read an entry from the owner of its key"""
+        wrapped = wrap_string(key)
+        return self._execute(
+            GET, cache_name, encode_bytes(wrapped), wrapped, self._content, timeout
+        )
+
+    def remove(
+            self, key: str, cache_name: str, timeout: Optional[float] = None
+    ) -> HotRodResponse:
+        """Remove an entry from the owner of its key"""
+        wrapped = wrap_string(key)
+        return self._execute(
+            REMOVE, cache_name, encode_bytes(wrapped), wrapped, self._no_content, timeout
+        )
+
+    def query(
+            self,
+            query: str,
+            cache_name: str,
+            local: bool = False,
+            offset: Optional[int] = None,
+            max_results: Optional[int] = None,
+            timeout: Optional[float] = None,
+    ) -> HotRodResponse:
+        """Run an Ickle query, the result set has the REST JSON format"""
+        request: Dict[str, Any] = {"query": query, "local": local}
+        if offset is not None:
+            request["offset"] = offset
+        if max_results is not None:
+            request["max_results"] = max_results
+        body = encode_bytes(json.dumps(request).encode("utf-8"))
+        return self._execute(QUERY, cache_name, body, None, self._content, timeout)
+
+    def close(self) -> None:
+        """Close the pooled connections"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            while not pool.empty():
+                pool.get_nowait().close()
@@ -2,25 +2,317 @@
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import copy
+import hashlib
 import json
 import logging
+import math
+import re
+import struct
+import threading
+import time
+import unicodedata
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from itertools import chain, islice, tee
 from typing import (
     Any,
+    AsyncIterator,
+    Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
+    Sequence,
     Tuple,
     Type,
+    Union,
 )
+from urllib.parse import urlsplit
 
 import requests
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
 
+from infinispan_vector.aio import AsyncInfinispan
+from infinispan_vector.cache import LRUCache
+from infinispan_vector.embedding_cache import MMapEmbeddingCache
+from infinispan_vector.filters import compile_filter
+from infinispan_vector.hotrod import HotRodTransport
+from infinispan_vector.metrics import Metrics, payload_size, stage
+from infinispan_vector.protostream import PROTOSTREAM_MEDIA_TYPE, ProtobufEncoder
+from infinispan_vector.quantization import Int8Quantizer
+from infinispan_vector.routing import (
+    ROUND_ROBIN,
+    HedgePolicy,
+    Node,
+    NodeRouter,
+    release_router,
+    shared_router,
+)
+from infinispan_vector.transport import POOL_SIZE, REST_TIMEOUT, shared_transport
+from infinispan_vector.utils import (
+    maximal_marginal_relevance,
+    similarity_scores,
+    top_k,
+)
+
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+BATCH_SIZE = 128
+
+VECTOR_SIMILARITIES = ("L2", "COSINE", "INNER_PRODUCT", "MAX_INNER_PRODUCT")
+
+_VECTOR_SIMILARITY = re.compile(r"@Vector\([^)]*similarity\s*=\s*(\w+)")
+
+_STORED_QUANTIZER = re.compile(r"^//\s*(\{.*\})\s*$", re.MULTILINE)
+
+
+def content_id(text: str, metadata: Optional[dict] = None) -> str:
+    """Deterministic key of an entry, derived from its text and metadata"""
+    payload = json.dumps(
+        [text, metadata or {}], sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InfinispanBulkWriteError(Exception):
+    """Raised when some entries of a bulk write could not be stored.
+
+    Attributes:
+        failures(dict): failed key -> the error Response or the Exception raised
+        keys(list): keys that were stored successfully
+    """
+
+    def __init__(self, failures: Dict[str, Any], keys: List[str]):
+        super().__init__(
+            "Unable to store %d entries, first failed key: %s"
+            % (len(failures), next(iter(failures)))
+        )
+        self.failures = failures
+        self.keys = keys
+
+
+class _BulkWriter:
+    """Puts entries through a bounded worker pool, capping the requests
+    in flight and collecting per-key failures."""
+
+    def __init__(
+            self,
+            ispn: Infinispan,
+            cache_name: str,
+            executor: ThreadPoolExecutor,
+            max_in_flight: int,
+            content_type: str = "application/json",
+    ):
+        self._ispn = ispn
+        self._cache_name = cache_name
+        self._content_type = content_type
+        self._executor = executor
+        self._max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.failures: Dict[str, Any] = {}
+
+    def submit(self, key: str, data: Union[str, bytes]) -> None:
+        # Blocks while max_in_flight puts are pending: this is the
+        # back-pressure that stops the producer from reading ahead.
+        self._in_flight.acquire()
+        try:
+            future = self._executor.submit(self._put, key, data)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+
+    def _put(self, key: str, data: Union[str, bytes]) -> None:
+        try:
+            response = self._ispn.put(
+                key, data, self._cache_name, self._content_type
+            )
+        except Exception as e:  # noqa: BLE001
+            with self._lock:
+                self.failures[key] = e
+            return
+        if not response.ok:
+            with self._lock:
+                self.failures[key] = response
+
+    def wait(self) -> None:
+        for _ in range(self._max_in_flight):
+            self._in_flight.acquire()
+        for _ in range(self._max_in_flight):
+            self._in_flight.release()
+
+
+def _windows(
+        iterable: Iterable[Any], size: int
+) -> Iterator[Tuple[List[Any], bool]]:
+    """Split an iterable in lists of `size` items, reading at most one
+    window ahead. Yields each window and whether it is the last one."""
+    it = iter(iterable)
+    window = list(islice(it, size))
+    while window:
+        following = list(islice(it, size))
+        yield window, not following
+        window = following
+
+
+def _take(it: Iterator[Any], count: int, name: str) -> List[Any]:
+    """Read the `name` items paired with a window of `count` texts"""
+    items = list(islice(it, count))
+    if len(items) < count:
+        raise ValueError("There are fewer " + name + " than texts")
+    return items
+
+
+def _peek(iterable: Iterable[Any]) -> Tuple[Any, Iterable[Any]]:
+    """Return the first item of an iterable and an iterable over all the
+    items, without materializing it."""
+    if isinstance(iterable, (list, tuple)):
+        return (iterable[0] if iterable else None), iterable
+    it = iter(iterable)
+    for first in it:
+        return first, chain([first], it)
+    return None, []
+
+
+def _resource_exists(api_url: str) -> bool:
+    """HEAD a full url through the transport shared by the clients of its
+    node"""
+    url = urlsplit(api_url)
+    transport = shared_transport(url.scheme, (url.netloc,))
+    return transport.request("HEAD", api_url, timeout=REST_TIMEOUT).ok
+
+
+class Hit:
+    """A kNN search hit.
+
+    Holds the decoded row as returned by the server: the entity, the
+    Document and the metadata are only built when accessed.
+    """
+
+    __slots__ = ("_row", "_store", "_document")
+
+    def __init__(self, row: dict, store: InfinispanVS):
+        self._row = row
+        self._store = store
+        self._document: Optional[Document] = None
+
+    @property
+    def score(self) -> float:
+        return self._row["score()"]
+
+    @property
+    def id(self) -> Optional[str]:
+        """The key of the entry, available if the store has a `keyfield`"""
+        keyfield = self._store._keyfield
+        if keyfield is None:
+            return None
+        entity = self._row.get("*")
+        return (entity if entity is not None else self._row).get(keyfield)
+
+    @property
+    def vector(self) -> Optional[List[float]]:
+        """The stored vector, if it was fetched by the query. Quantized
+        vectors come from their float copy when the store keeps one."""
+        entity = self._row.get("*")
+        row = entity if entity is not None else self._row
+        float_vectorfield = self._store._float_vectorfield
+        if float_vectorfield is not None and row.get(float_vectorfield) is not None:
+            return row[float_vectorfield]
+        value = row.get(self._store._vectorfield)
+        return None if value is None else self._store._decode_vector(value)
+
+    @property
+    def entity(self) -> dict:
+        output_fields = self._store._output_fields
+        if output_fields is not None:
+            return {key: self._row.get(key) for key in output_fields}
+        entity = self._row.get("*")
+        if entity is not None:
+            return entity
+        # automatic projection: absent fields come back as null
+        excluded = (
+            self._store._vectorfield, self._store._float_vectorfield, "score()"
+        )
+        return {
+            key: value
+            for key, value in self._row.items()
+            if value is not None and key not in excluded
+        }
+
+    @property
+    def document(self) -> Document:
+        if self._document is None:
+            entity = self.entity
+            self._document = Document(
+                page_content=self._store._to_content(entity),
+                metadata=self._store._to_metadata(entity),
+            )
+        return self._document
+
+
+class _PreparedQuery:
+    """kNN query template.
+
+    The projection and the query text around the vector are built once,
+    only the vector and k are rendered for each call. The vector is
+    formatted with a single `%` operation using `precision` significant
+    digits (9 is exact for the float32 vectors stored by the server);
+    with precision None it is serialized with json.dumps.
+
+    The REST search endpoint does not take bind parameters, so the vector
+    is rendered into the query text client side.
+    """
+
+    def __init__(
+            self,
+            projection: str,
+            entity_name: str,
+            vectorfield: str,
+            precision: Optional[int] = 9,
+    ):
+        self._head = (
+                "select "
+                + projection
+                + " from "
+                + entity_name
+                + " v where v."
+                + vectorfield
+                + " <-> ["
+        )
+        self._item = None if precision is None else "%." + str(precision) + "g,"
+        self._formats: Dict[int, str] = {}
+
+    def format_vector(self, embedding: List[float]) -> str:
+        if self._item is None:
+            return json.dumps(embedding)[1:-1]
+        fmt = self._formats.get(len(embedding))
+        if fmt is None:
+            fmt = (self._item * len(embedding))[:-1]
+            self._formats[len(embedding)] = fmt
+        return fmt % tuple(embedding)
+
+    def render(
+            self, embedding: List[float], k: int, filtering: Optional[str] = None
+    ) -> str:
+        query = self._head + self.format_vector(embedding) + "]~" + str(k)
+        if filtering:
+            query += " filtering " + filtering
+        return query
+
 
 class InfinispanVS(VectorStore):
     """`Infinispan` VectorStore interface.
@@ -66,10 +358,20 @@ class InfinispanVS(VectorStore):
             **kwargs: Any,
     ):
         self.ispn = Infinispan(**kwargs)
+        self._metrics = self.ispn.metrics
         self._configuration = kwargs
         self._cache_name = str(self._configuration.get("cache_name", "vector"))
         self._entity_name = str(self._configuration.get("entity_name", "vector"))
         self._embedding = embedding
+        if embedding is not None and self._configuration.get("embedding_cache_path"):
+            self._embedding = MMapEmbeddingCache(
+                embedding,
+                str(self._configuration["embedding_cache_path"]),
+                model_id=self._configuration.get("embedding_model_id"),
+                max_entries=int(
+                    self._configuration.get("embedding_cache_max_entries", 1_000_000)
+                ),
+            )
         self._textfield = self._configuration.get("textfield", "text")
         self._vectorfield = self._configuration.get("vectorfield", "vector")
         self._to_content = self._configuration.get(
@@ -79,32 +381,277 @@ class InfinispanVS(VectorStore):
             "lambda_metadata", lambda item: self._default_metadata(item)
         )
         self._output_fields = self._configuration.get("output_fields")
+        self._keyfield = self._configuration.get("keyfield")
+        self._filterable_fields = set(self._configuration.get("filterable_fields", ()))
         self._ids = ids
+        self._entry_encoding = str(self._configuration.get("entry_encoding", "json"))
+        self._quantizer = Int8Quantizer.of(self._configuration.get("quantizer"))
+        self._quantized = (
+            self._quantizer is not None
+            or self._configuration.get("vector_quantization") == "int8"
+        )
+        self._quantize_per_dimension = (
+            self._configuration.get("quantization_calibration") == "per_dimension"
+        )
+        self._quantization_sample_size = int(
+            self._configuration.get("quantization_sample_size", 1000)
+        )
+        # opt-in float copy of the quantized vectors, not indexed, for
+        # rescoring: it costs 4 bytes per dimension on top of the int8 codes
+        self._float_vectorfield: Optional[str] = (
+            self._configuration.get("float_vectorfield") if self._quantized else None
+        )
+        self._encoder: Optional[ProtobufEncoder] = None
+        self._auto_projection = bool(self._configuration.get("auto_projection", True))
+        self._schema_fields: Optional[List[str]] = None
+        self._batch_size = int(self._configuration.get("batch_size", BATCH_SIZE))
+        self._max_workers = int(
+            self._configuration.get(
+                "max_workers", self._configuration.get("pool_size", POOL_SIZE)
+            )
+        )
+        self._max_in_flight = int(
+            self._configuration.get("max_in_flight", 2 * self._max_workers)
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._aispn: Optional[AsyncInfinispan] = None
+        query_cache_size = int(self._configuration.get("query_cache_size", 0))
+        self._query_cache: Optional[LRUCache] = (
+            LRUCache(query_cache_size, self._configuration.get("query_cache_ttl"))
+            if query_cache_size > 0
+            else None
+        )
+        result_cache_size = int(self._configuration.get("result_cache_size", 0))
+        self._result_cache: Optional[LRUCache] = (
+            LRUCache(result_cache_size, self._configuration.get("result_cache_ttl"))
+            if result_cache_size > 0
+            else None
+        )
+        self._result_cache_precision = int(
+            self._configuration.get("result_cache_precision", 6)
+        )
+        near_cache_size = int(self._configuration.get("near_cache_size", 0))
+        self._near_cache: Optional[LRUCache] = (
+            LRUCache(near_cache_size, self._configuration.get("near_cache_ttl"))
+            if near_cache_size > 0
+            else None
+        )
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._oversample = self._configuration.get("rescore_oversample")
+        self._similarity = str(
+            self._configuration.get("vector_similarity", "L2")
+        ).upper()
+        if self._similarity not in VECTOR_SIMILARITIES:
+            raise ValueError("Unknown vector similarity: " + self._similarity)
+        self._vector_index = {
+            "similarity": (
+                self._similarity
+                if "vector_similarity" in self._configuration
+                else None
+            ),
+            "maxConnections": self._configuration.get("vector_max_connections"),
+            "beamWidth": self._configuration.get("vector_beam_width"),
+        }
+        precision = self._configuration.get("query_vector_precision", 9)
+        self._query_vector_precision = None if precision is None else int(precision)
+        self._prepared: Dict[str, _PreparedQuery] = {}
+        # projection of each with_vectors flag, reset with the schema fields
+        self._projections: Dict[bool, str] = {}
+        self._embedding_model_id = str(
+            self._configuration.get("embedding_model_id")
+            or getattr(embedding, "model_name", None)
+            or getattr(embedding, "model", None)
+            or type(embedding).__name__
+        )
+
+    def close(self) -> None:
+        """Release the worker threads and the clients of the store, see
+        `Infinispan.close`. The async client is closed with
+        `await store.aispn.close()` in its event loop."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.ispn.close()
+
+    def __enter__(self) -> "InfinispanVS":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def aispn(self) -> AsyncInfinispan:
+        """The asyncio client, created on first use"""
+        if self._aispn is None:
+            self._aispn = AsyncInfinispan(
+                **{
+                    **self._configuration,
+                    "router": self.ispn.router,
+                    "hedge_policy": self.ispn.hedge_policy,
+                    "metrics": self.ispn.metrics,
+                }
+            )
+        return self._aispn
+
+    @property
+    def query_cache(self) -> Optional[LRUCache]:
+        """The query embedding cache, None if disabled. Use its `stats()`
+        to read hit and miss counters."""
+        return self._query_cache
+
+    def _query_cache_key(
+            self, query: str, method: str = "embed_query"
+    ) -> Tuple[str, str, str]:
+        """Cache key of a query embedding. The embedding method is part of
+        the key, as models may embed queries and documents differently."""
+        return (
+            self._embedding_model_id,
+            method,
+            " ".join(unicodedata.normalize("NFC", query).split()),
+        )
+
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        """The metrics collector shared with the clients, None if
+        instrumentation is off. See `Infinispan` for its configuration."""
+        return self._metrics
+
+    def _embed_query(self, query: str) -> List[float]:
+        with stage(self._metrics, "embed_query"):
+            if self._query_cache is None:
+                return self._embedding.embed_query(query)  # type: ignore
+            key = self._query_cache_key(query)
+            embed = self._query_cache.get(key)
+            if embed is None:
+                embed = self._embedding.embed_query(query)  # type: ignore
+                self._query_cache.put(key, embed)
+            return embed
+
+    async def _aembed_query(self, query: str) -> List[float]:
+        with stage(self._metrics, "embed_query"):
+            if self._query_cache is None:
+                return await self._embedding.aembed_query(query)  # type: ignore
+            key = self._query_cache_key(query)
+            embed = self._query_cache.get(key)
+            if embed is None:
+                embed = await self._embedding.aembed_query(query)  # type: ignore
+                self._query_cache.put(key, embed)
+            return embed
+
+    @property
+    def result_cache(self) -> Optional[LRUCache]:
+        """The kNN result cache, None if disabled"""
+        return self._result_cache
+
+    @property
+    def near_cache(self) -> Optional[LRUCache]:
+        """The near cache of entries fetched by `get_by_ids`, None if disabled"""
+        return self._near_cache
+
+    def _invalidate(self) -> None:
+        """Bump the write generation so that no result or entry read before
+        a local write is served from the result or near cache"""
+        with self._generation_lock:
+            self._generation += 1
+            if self._result_cache is not None:
+                self._result_cache.clear()
+            if self._near_cache is not None:
+                self._near_cache.clear()
+
+    def _result_cache_key(self, embedding: List[float], k: int, *extra: Any) -> Tuple:
+        scale = 10 ** self._result_cache_precision
+        quantized = [round(x * scale) for x in embedding]
+        digest = hashlib.blake2b(
+            struct.pack("%dq" % len(quantized), *quantized), digest_size=16
+        ).digest()
+        return (digest, k, tuple(self._output_fields or ()), *extra)
+
+    def _cached_result(
+            self, key: Tuple
+    ) -> Tuple[int, Optional[List[Tuple[Document, float]]]]:
+        """The write generation and the cached result, as new Documents so
+        that callers cannot alter the cache"""
+        with self._generation_lock:
+            generation = self._generation
+        rows = self._result_cache.get(key)  # type: ignore
+        if rows is None:
+            return generation, None
+        return generation, [
+            (Document(page_content=content, metadata=copy.deepcopy(metadata)), score)
+            for content, metadata, score in rows
+        ]
+
+    def _cache_result(
+            self, key: Tuple, generation: int, result: List[Tuple[Document, float]]
+    ) -> None:
+        rows = tuple(
+            (doc.page_content, copy.deepcopy(doc.metadata), score)
+            for doc, score in result
+        )
+        with self._generation_lock:
+            if generation == self._generation:
+                self._result_cache.put(key, rows)  # type: ignore
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers,
+                    thread_name_prefix="infinispanvs",
+                )
+            return self._executor
 
     def _default_metadata(self, item: dict) -> dict:
-        meta = dict(item)
-        meta.pop(self._vectorfield, None)
-        meta.pop(self._textfield, None)
-        meta.pop("_type", None)
-        return meta
+        excluded = (
+            self._vectorfield,
+            self._float_vectorfield,
+            self._textfield,
+            "_type",
+            self._keyfield,
+        )
+        return {key: value for key, value in item.items() if key not in excluded}
 
     def _default_content(self, item: dict[str, Any]) -> Any:
         return item.get(self._textfield)
 
     def schema_builder(self, templ: dict, dimension: int) -> str:
+        """Build the protobuf schema of the entity
+        Args:
+            templ(dict): a sample of the metadata, fields are typed from it
+            dimension(int): dimension of the vectors
+        Returns:
+            The schema. The vector index is tuned by the configuration
+            entries vector_similarity (L2, COSINE, INNER_PRODUCT or
+            MAX_INNER_PRODUCT), vector_max_connections and
+            vector_beam_width (the HNSW graph degree and construction beam
+            width); the server defaults apply to the ones not set.
+            Quantized vectors get a non-indexed float copy, used to rescore
+            the candidates instead of their dequantized vector, when
+            float_vectorfield names it. It is not stored by default: it
+            takes 4 bytes per dimension, more than the plain float vectors
+            together with the int8 codes
+        """
         metadata_proto_tpl = '''
 /**
 * @Indexed
 */
 message %s {
 /**
-* @Vector(dimension=%d)
+* %s
 */
-repeated float %s = 1;
-'''
-        metadata_proto = metadata_proto_tpl % (self._entity_name, dimension, self._vectorfield)
+''' + ("optional bytes %s = 1;\n" if self._quantized else "repeated float %s = 1;\n")
+        metadata_proto = metadata_proto_tpl % (
+            self._entity_name,
+            self._vector_annotation(dimension),
+            self._vectorfield,
+        )
         idx = 2
         for f, v in templ.items():
+            if f in self._filterable_fields:
+                metadata_proto += "/**\n* @Basic\n*/\n"
             if isinstance(v, str):
                 metadata_proto += "optional string " + f + " = " + str(idx) + ";\n"
             elif isinstance(v, int):
@@ -118,9 +665,23 @@ repeated float %s = 1;
             else:
                 raise Exception("Unable to build proto schema for metadata. Unhandled type for field: " + f)
             idx += 1
+        if self._keyfield is not None and self._keyfield not in templ:
+            metadata_proto += "optional string " + self._keyfield + " = " + str(idx) + ";\n"
+            idx += 1
+        if self._float_vectorfield is not None:
+            metadata_proto += (
+                "repeated float " + self._float_vectorfield + " = " + str(idx) + ";\n"
+            )
         metadata_proto += "}\n"
         return metadata_proto
 
+    def _vector_annotation(self, dimension: int) -> str:
+        params = ["dimension=" + str(dimension)]
+        for name, value in self._vector_index.items():
+            if value is not None:
+                params.append(name + "=" + str(value))
+        return "@Vector(" + ", ".join(params) + ")"
+
     def schema_create(self, proto: str) -> requests.Response:
         """Deploy the schema for the vector db
         Args:
@@ -128,6 +689,7 @@ repeated float %s = 1;
         Returns:
             An http Response containing the result of the operation
         """
+        self._set_schema(proto)
         return self.ispn.schema_post(self._entity_name + ".proto", proto)
 
     def schema_delete(self) -> requests.Response:
@@ -138,7 +700,9 @@ repeated float %s = 1;
         return self.ispn.schema_delete(self._entity_name + ".proto")
 
     def cache_create(self, config: str = "") -> requests.Response:
-        """Create the cache for the vector db
+        """Create the cache for the vector db. The vector index parameters
+        are part of the schema, see `schema_builder`: the default
+        configuration indexes the entity, so they apply to this cache.
         Args:
             config(str): configuration of the cache.
         Returns:
@@ -177,6 +741,7 @@ repeated float %s = 1;
         Returns:
             An http Response containing the result of the operation
         """
+        self._invalidate()
         return self.ispn.cache_delete(self._cache_name)
 
     def cache_clear(self) -> requests.Response:
@@ -184,6 +749,7 @@ repeated float %s = 1;
         Returns:
             An http Response containing the result of the operation
         """
+        self._invalidate()
         return self.ispn.cache_clear(self._cache_name)
 
     def cache_exists(self) -> bool:
@@ -198,6 +764,7 @@ repeated float %s = 1;
         Returns:
             An http Response containing the result of the operation
         """
+        self._invalidate()
         return self.ispn.index_clear(self._cache_name)
 
     def cache_index_reindex(self) -> requests.Response:
@@ -210,34 +777,637 @@ repeated float %s = 1;
     def add_texts(
             self,
             texts: Iterable[str],
-            metadatas: Optional[List[dict]] = None,
+            metadatas: Optional[Iterable[dict]] = None,
             last_vector: Optional[List[float]] = None,
             **kwargs: Any,
     ) -> List[str]:
-        result = []
-        texts_l = list(texts)
-        if last_vector:
-            last_text = texts_l.pop()
-        embeds = self._embedding.embed_documents(texts_l)  # type: ignore
-        if last_vector:
-            embeds.append(last_vector)
-        if not metadatas:
-            metadatas = [{} for _ in texts]
-        ids = self._ids or [str(uuid.uuid4()) for _ in texts]
-        data_input = list(zip(metadatas, embeds, ids))
-        for metadata, embed, key in data_input:
-            data = {"_type": self._entity_name, self._vectorfield: embed}
-            data.update(metadata)
-            data_str = json.dumps(data)
-            self.ispn.put(key, data_str, self._cache_name)
-            result.append(key)
+        """Embed and store texts.
+
+        Input is consumed lazily in windows of `batch_size`, so texts,
+        metadatas and ids can be generators (i.e. rows read from a gzip csv).
+        While window N is being embedded, the entries of window N-1 are
+        written by a pool of `max_workers` threads. Reading stops while
+        `max_in_flight` puts are pending, so peak memory does not depend on
+        the input size.
+
+        Args:
+            texts: texts to store.
+            metadatas: optional metadata for each text.
+            last_vector: precomputed embedding of the last text.
+            ids: optional keys for the entries. Defaults to the ids the
+                store was created with, or random uuids.
+            batch_size(int): overrides the configured window size.
+            return_ids(bool): set to False to not collect the stored keys.
+                Defaults to True.
+
+        Returns:
+            The keys of the stored entries.
+
+        Raises:
+            InfinispanBulkWriteError: if some entries could not be stored.
+            ValueError: if there are fewer metadatas or ids than texts.
+        """
+        result: List[str] = []
+        return_ids = kwargs.get("return_ids", True)
+        batch_size = int(kwargs.get("batch_size", self._batch_size))
+        metas_it = iter(metadatas) if metadatas else None
+        ids_in = kwargs.get("ids") or self._ids
+        ids_it = iter(ids_in) if ids_in else None
+        self._invalidate()
+        writer = _BulkWriter(
+            self.ispn,
+            self._cache_name,
+            self._get_executor(),
+            self._max_in_flight,
+            self._entry_content_type(),
+        )
+        windows = self._embedded_windows(
+            texts, metas_it, ids_it, batch_size, last_vector
+        )
+        for keys, metas, embeds in self._calibrated(windows):
+            for key, metadata, embed in zip(keys, metas, embeds):
+                with stage(self._metrics, "encode"):
+                    data = self._entry_data(key, metadata, embed)
+                writer.submit(key, data)
+            if return_ids:
+                result.extend(keys)
+        writer.wait()
+        self._invalidate()
+        if writer.failures:
+            raise InfinispanBulkWriteError(
+                writer.failures, [key for key in result if key not in writer.failures]
+            )
         return result
 
+    def _embedded_windows(
+            self,
+            texts: Iterable[str],
+            metas_it: Optional[Iterator[dict]],
+            ids_it: Optional[Iterator[Any]],
+            batch_size: int,
+            last_vector: Optional[List[float]] = None,
+    ) -> Iterator[Tuple[List[str], List[dict], List[List[float]]]]:
+        """Keys, metadata and embeddings of the input, one window at a time"""
+        for chunk, is_last in _windows(texts, batch_size):
+            metas = (
+                _take(metas_it, len(chunk), "metadatas")
+                if metas_it
+                else [{}] * len(chunk)
+            )
+            keys = (
+                [str(key) for key in _take(ids_it, len(chunk), "ids")]
+                if ids_it
+                else [str(uuid.uuid4()) for _ in chunk]
+            )
+            with stage(self._metrics, "embed_documents"):
+                if is_last and last_vector:
+                    embeds = self._embedding.embed_documents(chunk[:-1])  # type: ignore
+                    embeds.append(last_vector)
+                else:
+                    embeds = self._embedding.embed_documents(chunk)  # type: ignore
+            yield keys, metas, embeds
+
+    def _entry_data(
+            self, key: str, metadata: dict, embed: List[float]
+    ) -> Union[str, bytes]:
+        vector: Any = embed
+        if self._quantizer is not None:
+            vector = self._quantizer.encode(embed)
+            if self._encoder is None:
+                vector = base64.b64encode(vector).decode("ascii")
+        data = {"_type": self._entity_name, self._vectorfield: vector}
+        if self._float_vectorfield is not None:
+            data[self._float_vectorfield] = embed
+        data.update(metadata)
+        if self._keyfield is not None:
+            data[self._keyfield] = key
+        if self._encoder is not None:
+            return self._encoder.encode(data)
+        return json.dumps(data)
+
+    @property
+    def quantizer(self) -> Optional[Int8Quantizer]:
+        """The int8 quantizer of the vectors, None if vectors are stored as
+        floats or not calibrated yet.
+
+        The first write of a quantized store calibrates the quantizer on
+        the first quantization_sample_size vectors (defaults to 1000) and
+        stores it on the server as the `<entity_name>_quantizer.proto`
+        schema, unless one is already stored there or was passed as the
+        `quantizer` configuration entry. Every process then loads the same
+        quantizer before writing or querying."""
+        return self._quantizer
+
+    @property
+    def _quantizer_schema(self) -> str:
+        return self._entity_name + "_quantizer.proto"
+
+    def _needs_calibration(self, stored: Optional[str]) -> bool:
+        """Adopt the quantizer stored on the server, if any. True when the
+        store must calibrate one before writing."""
+        if stored is not None and self._quantizer is None:
+            found = _STORED_QUANTIZER.search(stored)
+            if found is not None:
+                self._quantizer = Int8Quantizer.from_dict(json.loads(found.group(1)))
+        return self._quantized and self._quantizer is None
+
+    def _load_quantizer(self) -> bool:
+        if not self._quantized or self._quantizer is not None:
+            return False
+        response = self.ispn.schema_get(self._quantizer_schema)
+        return self._needs_calibration(response.text if response.ok else None)
+
+    async def _aload_quantizer(self) -> bool:
+        if not self._quantized or self._quantizer is not None:
+            return False
+        response = await self.aispn.schema_get(self._quantizer_schema)
+        return self._needs_calibration(response.text if response.ok else None)
+
+    def _calibration(self, embeds: List[List[float]]) -> Tuple[Int8Quantizer, str]:
+        quantizer = Int8Quantizer.calibrate(
+            embeds, per_dimension=self._quantize_per_dimension
+        )
+        proto = (
+            "// int8 quantizer of " + self._entity_name + "." + self._vectorfield
+            + ", written by InfinispanVS\n// " + json.dumps(quantizer.to_dict()) + "\n"
+        )
+        return quantizer, proto
+
+    def _quantizer_stored(
+            self, quantizer: Int8Quantizer, response: Any, stored: Optional[str]
+    ) -> None:
+        """Keep the quantizer just stored, or the one another process stored
+        first. Writing without a stored quantizer is refused, entries would
+        not be comparable with the ones written by other processes."""
+        if response.ok and _json_loads(response.content or b"{}").get("error") is None:
+            self._quantizer = quantizer
+        elif self._needs_calibration(stored):
+            raise ValueError(
+                "Unable to store the quantizer as schema " + self._quantizer_schema
+                + ": " + response.text + ". Pass it with the quantizer configuration"
+                " entry"
+            )
+
+    def _calibrated(
+            self, windows: Iterator[Tuple[List[str], List[dict], List[List[float]]]]
+    ) -> Iterator[Tuple[List[str], List[dict], List[List[float]]]]:
+        """Hold back the first windows until the quantizer is loaded, or
+        calibrated on quantization_sample_size vectors and stored"""
+        if not self._load_quantizer():
+            yield from windows
+            return
+        pending = []
+        count = 0
+        for window in windows:
+            pending.append(window)
+            count += len(window[2])
+            if count >= self._quantization_sample_size:
+                break
+        if count:
+            quantizer, proto = self._calibration(
+                [embed for _, _, embeds in pending for embed in embeds]
+            )
+            response = self.ispn.schema_post(self._quantizer_schema, proto)
+            stored = None
+            if not response.ok:
+                # i.e. created meanwhile by another process
+                found = self.ispn.schema_get(self._quantizer_schema)
+                stored = found.text if found.ok else None
+            self._quantizer_stored(quantizer, response, stored)
+        yield from pending
+        yield from windows
+
+    async def _acalibrated(
+            self, windows: AsyncIterator[Tuple[List[str], List[dict], List[List[float]]]]
+    ) -> AsyncIterator[Tuple[List[str], List[dict], List[List[float]]]]:
+        if not await self._aload_quantizer():
+            async for window in windows:
+                yield window
+            return
+        pending = []
+        count = 0
+        async for window in windows:
+            pending.append(window)
+            count += len(window[2])
+            if count >= self._quantization_sample_size:
+                break
+        if count:
+            quantizer, proto = self._calibration(
+                [embed for _, _, embeds in pending for embed in embeds]
+            )
+            response = await self.aispn.schema_post(self._quantizer_schema, proto)
+            stored = None
+            if not response.ok:
+                found = await self.aispn.schema_get(self._quantizer_schema)
+                stored = found.text if found.ok else None
+            self._quantizer_stored(quantizer, response, stored)
+        for window in pending:
+            yield window
+        async for window in windows:
+            yield window
+
+    def _query_vector(self, embedding: List[float]) -> List[Any]:
+        if self._quantized and self._quantizer is None:
+            self._load_quantizer()
+        return self._encode_query(embedding)
+
+    async def _aquery_vector(self, embedding: List[float]) -> List[Any]:
+        if self._quantized and self._quantizer is None:
+            await self._aload_quantizer()
+        return self._encode_query(embedding)
+
+    def _encode_query(self, embedding: List[float]) -> List[Any]:
+        """The query vector as searched, quantized like the stored ones"""
+        if not self._quantized:
+            return embedding
+        if self._quantizer is None:
+            raise ValueError(
+                "Quantized vectors need a calibrated quantizer, store vectors "
+                "first or pass it with the quantizer configuration entry"
+            )
+        return self._quantizer.quantize(embedding).tolist()
+
+    def _decode_vector(self, value: Any) -> List[float]:
+        if self._quantizer is None:
+            return value
+        return self._quantizer.decode(value)
+
+    def _entry_content_type(self) -> str:
+        """Media type of the entries written by the store. With protostream
+        encoding, the schema is fetched from the server if it was not
+        created by this store."""
+        if self._entry_encoding != "protostream":
+            return "application/json"
+        if self._encoder is None:
+            response = self.ispn.schema_get(self._entity_name + ".proto")
+            self._set_schema(response.text if response.ok else None)
+        if self._encoder is None:
+            raise ValueError(
+                "Schema " + self._entity_name + ".proto is required "
+                "by the protostream entry encoding"
+            )
+        return PROTOSTREAM_MEDIA_TYPE
+
+    async def _aentry_content_type(self) -> str:
+        if self._entry_encoding == "protostream" and self._encoder is None:
+            response = await self.aispn.schema_get(self._entity_name + ".proto")
+            self._set_schema(response.text if response.ok else None)
+        return self._entry_content_type()
+
+    def _set_schema(self, proto: Optional[str]) -> None:
+        """Learn the entity layout from its schema, None if unavailable"""
+        self._projections.clear()
+        layout = None
+        if proto is not None:
+            try:
+                layout = ProtobufEncoder.from_schema(proto, self._entity_name)
+            except ValueError:
+                pass
+        if layout is None:
+            self._schema_fields = []
+            return
+        similarity = _VECTOR_SIMILARITY.search(proto)  # type: ignore
+        if similarity is not None and "vector_similarity" not in self._configuration:
+            # score rescored hits like the deployed index does
+            self._similarity = similarity.group(1).upper()
+        self._schema_fields = [
+            name
+            for name in layout.fields
+            if name not in (self._vectorfield, self._float_vectorfield)
+        ]
+        if self._entry_encoding == "protostream":
+            self._encoder = layout
+
+    def _result_fields(self) -> Optional[List[str]]:
+        """Fields projected by searches, None to fetch whole entities"""
+        if self._output_fields is not None:
+            return list(self._output_fields)
+        if not self._auto_projection:
+            return None
+        if self._schema_fields is None:
+            response = self.ispn.schema_get(self._entity_name + ".proto")
+            self._set_schema(response.text if response.ok else None)
+        return list(self._schema_fields) or None  # type: ignore
+
+    async def _aresult_fields(self) -> None:
+        if (
+                self._output_fields is None
+                and self._auto_projection
+                and self._schema_fields is None
+        ):
+            response = await self.aispn.schema_get(self._entity_name + ".proto")
+            self._set_schema(response.text if response.ok else None)
+
+    async def aadd_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[Iterable[dict]] = None,
+            **kwargs: Any,
+    ) -> List[str]:
+        """Embed and store texts without blocking the event loop.
+
+        Same windowing as `add_texts`: window N is embedded with
+        `aembed_documents` while the puts of window N-1 are in flight,
+        at most `max_in_flight` at a time.
+
+        Raises:
+            InfinispanBulkWriteError: if some entries could not be stored.
+            ValueError: if there are fewer metadatas or ids than texts.
+        """
+        result: List[str] = []
+        return_ids = kwargs.get("return_ids", True)
+        batch_size = int(kwargs.get("batch_size", self._batch_size))
+        metas_it = iter(metadatas) if metadatas else None
+        ids_in = kwargs.get("ids") or self._ids
+        ids_it = iter(ids_in) if ids_in else None
+        in_flight = asyncio.Semaphore(self._max_in_flight)
+        failures: Dict[str, Any] = {}
+        content_type = await self._aentry_content_type()
+        self._invalidate()
+
+        async def put(key: str, data: Union[str, bytes]) -> None:
+            try:
+                response = await self.aispn.put(
+                    key, data, self._cache_name, content_type
+                )
+                if not response.ok:
+                    failures[key] = response
+            except Exception as e:  # noqa: BLE001
+                failures[key] = e
+            finally:
+                in_flight.release()
+
+        async def embedded_windows() -> AsyncIterator[
+            Tuple[List[str], List[dict], List[List[float]]]
+        ]:
+            for chunk, _ in _windows(texts, batch_size):
+                metas = (
+                    _take(metas_it, len(chunk), "metadatas")
+                    if metas_it
+                    else [{}] * len(chunk)
+                )
+                keys = (
+                    [str(key) for key in _take(ids_it, len(chunk), "ids")]
+                    if ids_it
+                    else [str(uuid.uuid4()) for _ in chunk]
+                )
+                embeds = await self._embedding.aembed_documents(chunk)  # type: ignore
+                yield keys, metas, embeds
+
+        tasks = set()
+        async for keys, metas, embeds in self._acalibrated(embedded_windows()):
+            for key, metadata, embed in zip(keys, metas, embeds):
+                await in_flight.acquire()
+                task = asyncio.ensure_future(put(key, self._entry_data(key, metadata, embed)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if return_ids:
+                result.extend(keys)
+        await asyncio.gather(*tasks)
+        self._invalidate()
+        if failures:
+            raise InfinispanBulkWriteError(
+                failures, [key for key in result if key not in failures]
+            )
+        return result
+
+    def sync_texts(
+            self,
+            texts: Iterable[str],
+            metadatas: Optional[Iterable[dict]] = None,
+            delete_missing: bool = False,
+            **kwargs: Any,
+    ) -> Dict[str, int]:
+        """Incrementally index texts.
+
+        Every entry gets a key derived from the hash of its text and
+        metadata (see `content_id`). Keys already in the cache hold the
+        same content, so only new or changed texts are embedded and stored.
+        Input is streamed in windows like `add_texts`; for each window the
+        existing keys are checked concurrently with HEAD requests.
+
+        Args:
+            texts: texts to index.
+            metadatas: optional metadata for each text.
+            delete_missing: delete the entries of the cache whose key was
+                not produced by this input, i.e. documents removed from the
+                source. The whole cache is considered, so use a cache
+                dedicated to this source. Defaults to False.
+            batch_size(int): overrides the configured window size.
+
+        Returns:
+            The number of entries added, skipped (unchanged) and deleted.
+        """
+        batch_size = int(kwargs.get("batch_size", self._batch_size))
+        stats = {"added": 0, "skipped": 0, "deleted": 0}
+        existing: Optional[set] = None
+        seen: set = set()
+        if delete_missing:
+            existing = set(_json_loads(self.ispn.keys(self._cache_name).content))
+        metas_it = iter(metadatas) if metadatas else None
+
+        def changed() -> Iterator[Tuple[str, dict, str]]:
+            for chunk, _ in _windows(texts, batch_size):
+                metas = (
+                    _take(metas_it, len(chunk), "metadatas")
+                    if metas_it
+                    else [{}] * len(chunk)
+                )
+                keys = [content_id(t, m) for t, m in zip(chunk, metas)]
+                if existing is not None:
+                    present = [key in existing for key in keys]
+                else:
+                    present = list(
+                        self._get_executor().map(
+                            lambda key: self.ispn.entry_exists(key, self._cache_name),
+                            keys,
+                        )
+                    )
+                for text, meta, key, found in zip(chunk, metas, keys, present):
+                    if found or key in seen:
+                        stats["skipped"] += 1
+                    else:
+                        stats["added"] += 1
+                        yield text, meta, key
+                    seen.add(key)
+
+        texts_src, metas_src, keys_src = tee(changed(), 3)
+        self.add_texts(
+            (text for text, _, _ in texts_src),
+            (meta for _, meta, _ in metas_src),
+            ids=(key for _, _, key in keys_src),
+            batch_size=batch_size,
+            return_ids=False,
+        )
+        if existing is not None:
+            stale = list(existing - seen)
+            if stale:
+                self.delete(stale)
+            stats["deleted"] = len(stale)
+        return stats
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete entries by key.
+
+        Args:
+            ids: keys of the entries to delete.
+
+        Returns:
+            True if all the entries were deleted, False otherwise.
+        """
+        if ids is None:
+            return None
+        self._invalidate()
+        try:
+            responses = list(
+                self._get_executor().map(
+                    lambda key: self.ispn.delete(key, self._cache_name), ids
+                )
+            )
+        finally:
+            self._invalidate()
+        return all(response.ok for response in responses)
+
+    async def adelete(
+            self, ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> Optional[bool]:
+        """Async version of delete"""
+        if ids is None:
+            return None
+        self._invalidate()
+        try:
+            responses = await asyncio.gather(
+                *(self.aispn.delete(key, self._cache_name) for key in ids)
+            )
+        finally:
+            self._invalidate()
+        return all(response.ok for response in responses)
+
+    def get_entries(
+            self, ids: Sequence[str], cache_name: Optional[str] = None
+    ) -> List[Optional[dict]]:
+        """Fetch entries by key.
+
+        The keys not held by the near cache are fetched concurrently by
+        the `max_workers` pool, so hydrating k hits costs about one round
+        trip instead of k.
+
+        Args:
+            ids: keys of the entries.
+            cache_name: cache holding the entries, i.e. the `sentence` cache
+                referenced by the vectors. Defaults to the vector cache.
+
+        Returns:
+            The entries as dicts, in the order of ids, None for missing keys.
+        """
+        cache_name = cache_name or self._cache_name
+        entries, missing, generation = self._near_cache_lookup(ids, cache_name)
+        if missing:
+            responses = self._get_executor().map(
+                lambda key: self.ispn.get(key, cache_name), missing
+            )
+            fetched = {
+                key: entry
+                for key, entry in zip(
+                    missing, map(self._entry_from_response, missing, responses)
+                )
+                if entry is not None
+            }
+            self._store_entries(cache_name, fetched, generation)
+            entries.update(fetched)
+        return [entries.get(key) for key in ids]
+
+    async def aget_entries(
+            self, ids: Sequence[str], cache_name: Optional[str] = None
+    ) -> List[Optional[dict]]:
+        """Async version of get_entries"""
+        cache_name = cache_name or self._cache_name
+        entries, missing, generation = self._near_cache_lookup(ids, cache_name)
+        if missing:
+            responses = await asyncio.gather(
+                *(self.aispn.get(key, cache_name) for key in missing)
+            )
+            fetched = {
+                key: entry
+                for key, entry in zip(
+                    missing, map(self._entry_from_response, missing, responses)
+                )
+                if entry is not None
+            }
+            self._store_entries(cache_name, fetched, generation)
+            entries.update(fetched)
+        return [entries.get(key) for key in ids]
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        """Return the Documents stored under the given keys.
+
+        Args:
+            ids: keys of the entries.
+
+        Returns:
+            The Documents found, in the order of ids. Missing keys are skipped.
+        """
+        return self._entries_to_docs(self.get_entries(ids))
+
+    async def aget_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        """Async version of get_by_ids"""
+        return self._entries_to_docs(await self.aget_entries(ids))
+
+    def _near_cache_lookup(
+            self, ids: Sequence[str], cache_name: str
+    ) -> Tuple[Dict[str, dict], List[str], int]:
+        with self._generation_lock:
+            generation = self._generation
+        entries: Dict[str, dict] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(ids):
+            entry = (
+                self._near_cache.get((cache_name, key))
+                if self._near_cache is not None
+                else None
+            )
+            if entry is None:
+                missing.append(key)
+            else:
+                # copies, so that callers cannot alter the cached entries
+                entries[key] = copy.deepcopy(entry)
+        return entries, missing, generation
+
+    def _store_entries(
+            self, cache_name: str, entries: Dict[str, dict], generation: int
+    ) -> None:
+        if self._near_cache is None:
+            return
+        with self._generation_lock:
+            if generation == self._generation:
+                for key, entry in entries.items():
+                    self._near_cache.put((cache_name, key), copy.deepcopy(entry))
+
+    @staticmethod
+    def _entry_from_response(key: str, response: Any) -> Optional[dict]:
+        if response.status_code == 404:
+            return None
+        if not response.ok:
+            raise Exception(
+                "Unable to get entry " + key + ": " + str(response.status_code)
+            )
+        return _json_loads(response.content)
+
+    def _entries_to_docs(self, entries: List[Optional[dict]]) -> List[Document]:
+        return [
+            Document(
+                page_content=self._to_content(entry),
+                metadata=self._to_metadata(entry),
+            )
+            for entry in entries
+            if entry is not None
+        ]
+
     def similarity_search(
             self, query: str, k: int = 4, **kwargs: Any
     ) -> List[Document]:
         """Return docs most similar to query."""
-        documents = self.similarity_search_with_score(query=query, k=k)
+        documents = self.similarity_search_with_score(query=query, k=k, **kwargs)
         return [doc for doc, _ in documents]
 
     def similarity_search_with_score(
@@ -252,76 +1422,486 @@ repeated float %s = 1;
         Returns:
             List[Tuple[Document, float]]
         """
-        embed = self._embedding.embed_query(query)  # type: ignore
-        documents = self.similarity_search_with_score_by_vector(embedding=embed, k=k)
+        with stage(self._metrics, "similarity_search"):
+            embed = self._embed_query(query)
+            documents = self.similarity_search_with_score_by_vector(
+                embedding=embed, k=k, **kwargs
+            )
         return documents
 
     def similarity_search_by_vector(
             self, embedding: List[float], k: int = 4, **kwargs: Any
     ) -> List[Document]:
-        res = self.similarity_search_with_score_by_vector(embedding, k)
+        res = self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
         return [doc for doc, _ in res]
 
     def similarity_search_with_score_by_vector(
-            self, embedding: List[float], k: int = 4
+            self, embedding: List[float], k: int = 4, **kwargs: Any
     ) -> List[Tuple[Document, float]]:
         """Return docs most similar to embedding vector.
 
         Args:
             embedding: Embedding to look up documents similar to.
             k: Number of Documents to return. Defaults to 4.
+            oversample(float): if greater than 1, fetch k * oversample
+                candidates with their vectors and return the top k by exact
+                score. Quantized candidates are rescored with their
+                dequantized vector, or with their float copy when
+                float_vectorfield is configured. Defaults to the configured
+                rescore_oversample.
+            filter(dict): metadata filter applied by the server during the
+                kNN search, see `infinispan_vector.filters`.
 
         Returns:
             List of pair (Documents, score) most similar to the query vector.
         """
-        if self._output_fields is None:
-            query_str = (
-                    "select v, score(v) from "
-                    + self._entity_name
-                    + " v where v."
-                    + self._vectorfield
-                    + " <-> "
-                    + json.dumps(embedding)
-                    + "~"
-                    + str(k)
+        oversample = kwargs.get("oversample", self._oversample)
+        filter = kwargs.get("filter")  # noqa: A001
+        if self._result_cache is not None:
+            key = self._result_cache_key(
+                embedding, k, oversample, self._filtering(filter)
             )
+            generation, documents = self._cached_result(key)
+            if documents is not None:
+                return documents
+        if oversample and oversample > 1:
+            scored = self._rescored_hits(embedding, k, oversample, filter)
         else:
-            query_proj = "select "
-            for field in self._output_fields[:-1]:
-                query_proj = query_proj + "v." + field + ","
-            query_proj = query_proj + "v." + self._output_fields[-1]
-            query_str = (
-                    query_proj
-                    + ", score(v) from "
-                    + self._entity_name
-                    + " v where v."
-                    + self._vectorfield
-                    + " <-> "
-                    + json.dumps(embedding)
-                    + "~"
-                    + str(k)
-            )
-        query_res = self.ispn.req_query(query_str, self._cache_name)
-        result = json.loads(query_res.text)
-        return self._query_result_to_docs(result)
-
-    def _query_result_to_docs(
-            self, result: dict[str, Any]
+            scored = [
+                (hit, hit.score)
+                for hit in self.similarity_search_hits_by_vector(
+                    embedding, k, filter=filter
+                )
+            ]
+        with stage(self._metrics, "to_docs"):
+            documents = [(hit.document, score) for hit, score in scored]
+        if self._result_cache is not None:
+            self._cache_result(key, generation, documents)
+        return documents
+
+    def _rescored_hits(
+            self,
+            embedding: List[float],
+            k: int,
+            oversample: float,
+            filter: Optional[dict] = None,  # noqa: A002
+    ) -> List[Tuple[Hit, float]]:
+        hits = self.similarity_search_hits_by_vector(
+            embedding, int(math.ceil(k * oversample)), with_vectors=True, filter=filter
+        )
+        return self._rescore(embedding, hits, k)
+
+    def _rescore(
+            self, embedding: List[float], hits: List[Hit], k: int
+    ) -> List[Tuple[Hit, float]]:
+        scores = similarity_scores(
+            embedding, [hit.vector for hit in hits], self._similarity
+        )
+        return [(hits[i], float(scores[i])) for i in top_k(scores, k)]
+
+    def similarity_search_hits_by_vector(
+            self,
+            embedding: List[float],
+            k: int = 4,
+            with_vectors: bool = False,
+            filter: Optional[dict] = None,  # noqa: A002
+    ) -> List[Hit]:
+        """Return the hits most similar to embedding vector.
+
+        The response is decoded straight from bytes (with orjson when
+        installed) and Documents are only built when a hit's `document`
+        is accessed.
+
+        Args:
+            embedding: Embedding to look up documents similar to.
+            k: Number of hits to return. Defaults to 4.
+            with_vectors: also fetch the stored vectors. Defaults to False.
+            filter: metadata filter applied during the kNN search.
+
+        Returns:
+            List of Hit most similar to the query vector.
+        """
+        with stage(self._metrics, "build_query"):
+            query_str = self._prepared_query(self._projection(with_vectors)).render(
+                self._query_vector(embedding), k, self._filtering(filter)
+            )
+        query_res = self.ispn.req_query(query_str, self._cache_name, max_results=k)
+        with stage(self._metrics, "decode"):
+            return self._query_result_to_hits(_json_loads(query_res.content))
+
+    def iter_similar(
+            self,
+            embedding: List[float],
+            k: int,
+            page_size: int = 100,
+            with_vectors: bool = False,
+            filter: Optional[dict] = None,  # noqa: A002
+    ) -> Iterator[Hit]:
+        """Iterate over the k hits most similar to embedding vector.
+
+        The result set is fetched in pages of `page_size` hits using the
+        search endpoint offset and max_results, and hits are yielded as
+        soon as their page arrives. Only one page is held in memory.
+
+        Args:
+            embedding: Embedding to look up documents similar to.
+            k: Total number of hits.
+            page_size: Number of hits fetched with each request.
+            with_vectors: also fetch the stored vectors. Defaults to False.
+            filter: metadata filter applied during the kNN search.
+
+        Returns:
+            An iterator of Hit, most similar first.
+        """
+        query_str = self._prepared_query(self._projection(with_vectors)).render(
+            self._query_vector(embedding), k, self._filtering(filter)
+        )
+        for row in self._iter_rows(query_str, page_size, limit=k):
+            yield Hit(row["hit"] or {}, self)
+
+    def _iter_rows(
+            self, query_str: str, page_size: int, limit: Optional[int] = None
+    ) -> Iterator[dict]:
+        offset = 0
+        while limit is None or offset < limit:
+            max_results = page_size if limit is None else min(page_size, limit - offset)
+            query_res = self.ispn.req_query(
+                query_str, self._cache_name, offset=offset, max_results=max_results
+            )
+            rows = _json_loads(query_res.content)["hits"]
+            yield from rows
+            if len(rows) < max_results:
+                return
+            offset += len(rows)
+
+    def _scan_vectors(self, page_size: int = 1000) -> Iterator[List[float]]:
+        vectorfield = self._float_vectorfield or self._vectorfield
+        query_str = "select v." + vectorfield + " from " + self._entity_name + " v"
+        for row in self._iter_rows(query_str, page_size):
+            yield Hit(row["hit"], self).vector  # type: ignore
+
+    def measure_recall(
+            self,
+            embeddings: List[List[float]],
+            k: int = 4,
+            oversample_factors: Iterable[float] = (1, 2, 4, 8),
+    ) -> Dict[float, float]:
+        """Measure the recall@k of the kNN search, with and without
+        rescoring, against an exact brute force search over all the
+        stored vectors. Use it to choose rescore_oversample from data.
+
+        A result counts as relevant if its exact score is not lower than
+        the exact k-th best score, so ties are not penalized.
+
+        Args:
+            embeddings: sample query vectors.
+            k: number of results per query.
+            oversample_factors: factors to measure, 1 is the plain kNN search.
+
+        Returns:
+            Mean recall@k for each oversample factor.
+        """
+        stored = list(self._scan_vectors())
+        recalls: Dict[float, List[float]] = {f: [] for f in oversample_factors}
+        for embedding in embeddings:
+            exact = similarity_scores(embedding, stored, self._similarity)
+            best = top_k(exact, k)
+            if not best:
+                continue
+            threshold = float(exact[best[-1]]) - 1e-6
+            for factor in recalls:
+                found = self._rescored_hits(embedding, k, max(factor, 1))
+                relevant = sum(1 for _, score in found if score >= threshold)
+                recalls[factor].append(relevant / len(best))
+        return {
+            factor: (sum(values) / len(values) if values else 0.0)
+            for factor, values in recalls.items()
+        }
+
+    def similarity_search_ids_by_vector(
+            self,
+            embedding: List[float],
+            k: int = 4,
+            filter: Optional[dict] = None,  # noqa: A002
+    ) -> List[Tuple[str, float]]:
+        """Return only keys and scores of the entries most similar to
+        embedding vector. Content and metadata are not fetched.
+
+        Requires the store to be configured with a `keyfield`.
+
+        Args:
+            embedding: Embedding to look up documents similar to.
+            k: Number of results to return. Defaults to 4.
+            filter: metadata filter applied during the kNN search.
+
+        Returns:
+            List of pair (key, score) most similar to the query vector.
+        """
+        if self._keyfield is None:
+            raise ValueError("keyfield must be configured to search ids only")
+        query_str = self._prepared_query(
+            "v." + self._keyfield + ", score(v)"
+        ).render(self._query_vector(embedding), k, self._filtering(filter))
+        query_res = self.ispn.req_query(query_str, self._cache_name, max_results=k)
+        return [
+            ((row["hit"] or {}).get(self._keyfield), row["hit"]["score()"])
+            for row in _json_loads(query_res.content)["hits"]
+        ]
+
+    def max_marginal_relevance_search(
+            self,
+            query: str,
+            k: int = 4,
+            fetch_k: int = 20,
+            lambda_mult: float = 0.5,
+            **kwargs: Any,
+    ) -> List[Document]:
+        """Return docs selected using the maximal marginal relevance.
+
+        Args:
+            query: Text to look up documents similar to.
+            k: Number of Documents to return. Defaults to 4.
+            fetch_k: Number of Documents to fetch to pass to MMR algorithm.
+            lambda_mult: Number between 0 and 1 that determines the degree
+                        of diversity among the results with 0 corresponding
+                        to maximum diversity and 1 to minimum diversity.
+                        Defaults to 0.5.
+        Returns:
+            List of Documents selected by maximal marginal relevance.
+        """
+        embed = self._embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(
+            embed, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs
+        )
+
+    def max_marginal_relevance_search_by_vector(
+            self,
+            embedding: List[float],
+            k: int = 4,
+            fetch_k: int = 20,
+            lambda_mult: float = 0.5,
+            **kwargs: Any,
+    ) -> List[Document]:
+        """Return docs selected using the maximal marginal relevance.
+
+        The fetch_k candidates and their stored vectors come back from a
+        single kNN query; the re-ranking runs as NumPy matrix operations.
+
+        Args:
+            embedding: Embedding to look up documents similar to.
+            k: Number of Documents to return. Defaults to 4.
+            fetch_k: Number of Documents to fetch to pass to MMR algorithm.
+            lambda_mult: Number between 0 and 1 that determines the degree
+                        of diversity among the results with 0 corresponding
+                        to maximum diversity and 1 to minimum diversity.
+                        Defaults to 0.5.
+            filter: metadata filter applied during the kNN search.
+        Returns:
+            List of Documents selected by maximal marginal relevance.
+        """
+        hits = self.similarity_search_hits_by_vector(
+            embedding, fetch_k, with_vectors=True, filter=kwargs.get("filter")
+        )
+        selected = maximal_marginal_relevance(
+            embedding, [hit.vector for hit in hits], k=k, lambda_mult=lambda_mult
+        )
+        return [hits[i].document for i in selected]
+
+    def similarity_search_batch(
+            self, queries: List[str], k: int = 4, **kwargs: Any
+    ) -> List[List[Document]]:
+        """Return docs most similar to each query, in input order."""
+        results = self.similarity_search_with_score_batch(queries, k, **kwargs)
+        return [[doc for doc, _ in documents] for documents in results]
+
+    def similarity_search_with_score_batch(
+            self, queries: List[str], k: int = 4, **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """Perform a search for many query strings at once.
+
+        All the queries are embedded with a single `embed_documents` call
+        (queries found in the query cache are not embedded again), then the
+        kNN queries are run concurrently over the pooled connections. These
+        embeddings are cached apart from the `embed_query` ones, so single
+        query searches never get a document embedding.
+
+        Args:
+            queries (List[str]): The texts being searched.
+            k (int, optional): The amount of results for each query. Defaults to 4.
+
+        Returns:
+            For each query, in input order, a List[Tuple[Document, float]]
+        """
+        embeds: List[Optional[List[float]]] = [None] * len(queries)
+        missing = []
+        for i, query in enumerate(queries):
+            if self._query_cache is not None:
+                embeds[i] = self._query_cache.get(
+                    self._query_cache_key(query, "embed_documents")
+                )
+            if embeds[i] is None:
+                missing.append(i)
+        if missing:
+            computed = self._embedding.embed_documents(  # type: ignore
+                [queries[i] for i in missing]
+            )
+            for i, embed in zip(missing, computed):
+                embeds[i] = embed
+                if self._query_cache is not None:
+                    self._query_cache.put(
+                        self._query_cache_key(queries[i], "embed_documents"), embed
+                    )
+        return self.similarity_search_with_score_by_vector_batch(
+            embeds, k, **kwargs  # type: ignore
+        )
+
+    def similarity_search_by_vector_batch(
+            self, embeddings: List[List[float]], k: int = 4, **kwargs: Any
+    ) -> List[List[Document]]:
+        """Return docs most similar to each embedding, in input order."""
+        results = self.similarity_search_with_score_by_vector_batch(
+            embeddings, k, **kwargs
+        )
+        return [[doc for doc, _ in documents] for documents in results]
+
+    def similarity_search_with_score_by_vector_batch(
+            self, embeddings: List[List[float]], k: int = 4, **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """Run many kNN queries concurrently.
+
+        Args:
+            embeddings: Embeddings to look up documents similar to.
+            k: Number of Documents to return for each embedding. Defaults to 4.
+
+        Returns:
+            For each embedding, in input order, the list of pair
+            (Documents, score) most similar to it.
+        """
+        return list(
+            self._get_executor().map(
+                lambda embedding: self.similarity_search_with_score_by_vector(
+                    embedding, k, **kwargs
+                ),
+                embeddings,
+            )
+        )
+
+    async def asimilarity_search(
+            self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        """Return docs most similar to query."""
+        documents = await self.asimilarity_search_with_score(
+            query=query, k=k, **kwargs
+        )
+        return [doc for doc, _ in documents]
+
+    async def asimilarity_search_with_score(
+            self, query: str, k: int = 4, **kwargs: Any
     ) -> List[Tuple[Document, float]]:
-        documents = []
-        for row in result["hits"]:
-            hit = row["hit"] or {}
-            if self._output_fields is None:
-                entity = hit["*"]
-            else:
-                entity = {key: hit.get(key) for key in self._output_fields}
-            doc = Document(
-                page_content=self._to_content(entity),
-                metadata=self._to_metadata(entity),
+        """Async version of similarity_search_with_score"""
+        with stage(self._metrics, "similarity_search"):
+            embed = await self._aembed_query(query)
+            return await self.asimilarity_search_with_score_by_vector(
+                embedding=embed, k=k, **kwargs
+            )
+
+    async def asimilarity_search_by_vector(
+            self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        res = await self.asimilarity_search_with_score_by_vector(
+            embedding, k, **kwargs
+        )
+        return [doc for doc, _ in res]
+
+    async def asimilarity_search_with_score_by_vector(
+            self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Async version of similarity_search_with_score_by_vector"""
+        oversample = kwargs.get("oversample", self._oversample)
+        filter = kwargs.get("filter")  # noqa: A001
+        if self._result_cache is not None:
+            key = self._result_cache_key(
+                embedding, k, oversample, self._filtering(filter)
+            )
+            generation, documents = self._cached_result(key)
+            if documents is not None:
+                return documents
+        if oversample and oversample > 1:
+            hits = await self.asimilarity_search_hits_by_vector(
+                embedding,
+                int(math.ceil(k * oversample)),
+                with_vectors=True,
+                filter=filter,
             )
-            documents.append((doc, hit["score()"]))
+            scored = self._rescore(embedding, hits, k)
+        else:
+            scored = [
+                (hit, hit.score)
+                for hit in await self.asimilarity_search_hits_by_vector(
+                    embedding, k, filter=filter
+                )
+            ]
+        with stage(self._metrics, "to_docs"):
+            documents = [(hit.document, score) for hit, score in scored]
+        if self._result_cache is not None:
+            self._cache_result(key, generation, documents)
         return documents
 
+    async def asimilarity_search_hits_by_vector(
+            self,
+            embedding: List[float],
+            k: int = 4,
+            with_vectors: bool = False,
+            filter: Optional[dict] = None,  # noqa: A002
+    ) -> List[Hit]:
+        """Async version of similarity_search_hits_by_vector"""
+        await self._aresult_fields()
+        vector = await self._aquery_vector(embedding)
+        with stage(self._metrics, "build_query"):
+            query_str = self._prepared_query(self._projection(with_vectors)).render(
+                vector, k, self._filtering(filter)
+            )
+        query_res = await self.aispn.req_query(
+            query_str, self._cache_name, max_results=k
+        )
+        with stage(self._metrics, "decode"):
+            return self._query_result_to_hits(_json_loads(query_res.content))
+
+    def _projection(self, with_vectors: bool = False) -> str:
+        projection = self._projections.get(with_vectors)
+        if projection is not None:
+            return projection
+        fields = self._result_fields()
+        if fields is None:
+            projection = "v, score(v)"
+        else:
+            vectorfield = self._float_vectorfield or self._vectorfield
+            if with_vectors and vectorfield not in fields:
+                fields.append(vectorfield)
+            projection = ",".join("v." + field for field in fields) + ", score(v)"
+        self._projections[with_vectors] = projection
+        return projection
+
+    def _prepared_query(self, projection: Optional[str] = None) -> _PreparedQuery:
+        projection = projection or self._projection()
+        prepared = self._prepared.get(projection)
+        if prepared is None:
+            prepared = _PreparedQuery(
+                projection,
+                self._entity_name,
+                self._vectorfield,
+                self._query_vector_precision,
+            )
+            self._prepared[projection] = prepared
+        return prepared
+
+    @staticmethod
+    def _filtering(filter: Optional[dict]) -> Optional[str]:  # noqa: A002
+        return compile_filter(filter) if filter else None
+
+    def _query_result_to_hits(self, result: dict[str, Any]) -> List[Hit]:
+        return [Hit(row["hit"] or {}, self) for row in result["hits"]]
+
     def configure(self, metadata: dict, dimension: int):
         schema = self.schema_builder(metadata, dimension)
         output = self.schema_create(schema)
@@ -335,36 +1915,76 @@ repeated float %s = 1;
 
     def config_clear(self):
         self.schema_delete()
+        self._schema_fields = None
+        self._projections.clear()
+        if self._quantized:
+            self.ispn.schema_delete(self._quantizer_schema)
+            self._quantizer = Int8Quantizer.of(self._configuration.get("quantizer"))
         self.cache_delete()
 
     @classmethod
     def from_texts(
             cls: Type[InfinispanVS],
-            texts: List[str],
+            texts: Iterable[str],
             embedding: Embeddings,
-            metadatas: Optional[List[dict]] = None,
-            ids: Optional[List[str]] = None,
+            metadatas: Optional[Iterable[dict]] = None,
+            ids: Optional[Iterable[str]] = None,
             clear_old: Optional[bool] = True,
             auto_config: Optional[bool] = True,
             **kwargs: Any,
     ) -> InfinispanVS:
-        """Return VectorStore initialized from texts and embeddings."""
+        """Return VectorStore initialized from texts and embeddings.
+
+        texts, metadatas and ids can be iterators: they are consumed in
+        windows by `add_texts` and never materialized.
+
+        With incremental=True the cache is not cleared and `sync_texts`
+        only embeds and stores new or changed texts; delete_missing=True
+        also removes the entries no longer in the input.
+        """
+        incremental = kwargs.pop("incremental", False)
+        delete_missing = kwargs.pop("delete_missing", False)
         infinispanvs = cls(embedding=embedding, ids=ids, **kwargs)
-        if auto_config and len(metadatas or []) > 0:
+        first_text, texts = _peek(texts)
+        first_meta, metadatas = _peek(metadatas or [])
+        if incremental:
+            if auto_config and first_meta is not None and not infinispanvs.cache_exists():
+                vec = embedding.embed_query(first_text)
+                infinispanvs.configure(first_meta, len(vec))
+            infinispanvs.sync_texts(
+                texts, metadatas or None, delete_missing=delete_missing
+            )
+            return infinispanvs
+        if auto_config and first_meta is not None:
             if clear_old:
                 infinispanvs.config_clear()
-            vec = embedding.embed_query(texts[len(texts) - 1])
-            infinispanvs.configure(metadatas[0], len(vec))
+            vec = embedding.embed_query(first_text)
+            infinispanvs.configure(first_meta, len(vec))
         else:
             if clear_old:
                 infinispanvs.cache_clear()
-            vec = embedding.embed_query(texts[len(texts) - 1])
-        if texts:
-            infinispanvs.add_texts(texts, metadatas, vector=vec)
+        if first_text is not None:
+            infinispanvs.add_texts(texts, metadatas or None, return_ids=False)
         return infinispanvs
 
+    @classmethod
+    def from_documents(
+            cls: Type[InfinispanVS],
+            documents: Iterable[Document],
+            embedding: Embeddings,
+            **kwargs: Any,
+    ) -> InfinispanVS:
+        """Return VectorStore initialized from documents and embeddings.
 
-REST_TIMEOUT = 10
+        documents can be an iterator, it is streamed through `from_texts`.
+        """
+        docs_for_texts, docs_for_metas = tee(documents)
+        return cls.from_texts(
+            (doc.page_content for doc in docs_for_texts),
+            embedding,
+            metadatas=(doc.metadata for doc in docs_for_metas),
+            **kwargs,
+        )
 
 
 class Infinispan:
@@ -375,61 +1995,399 @@ class Infinispan:
 
     You need a running Infinispan (15+) server without authentication.
     You can easily start one, see: https://github.com/rigazilla/infinispan-vector#run-infinispan
+
+    All the operations go through a pooled keep-alive transport shared by
+    every client pointing at the same cluster. The following configuration
+    entries tune it:
+        pool_size(int): max pooled connections per node. Defaults to 10
+        timeout(float): default timeout in seconds. Defaults to REST_TIMEOUT
+        timeouts(dict): per-operation timeouts, keys are
+            query, put, post, get, delete, schema, cache, index
+        transport: a custom transport object exposing
+            request(method, url, timeout, **kwargs)
+        protocol(str): "rest" or "hotrod". With "hotrod" put, get, delete
+            and queries go through the native Hot Rod protocol and key
+            operations are routed to the owner node; the other operations
+            keep using REST, whose transport and router are only created
+            when one of them is used. Defaults to "rest"
+        hotrod_hosts(list): Hot Rod endpoints. Defaults to hosts, as the
+            server listens for both protocols on the same port
+
+    Requests are spread over all the hosts by a `NodeRouter`. A node that
+    cannot be reached is marked down and the request is retried on the
+    next one. Routing is tuned by:
+        routing(str): "round_robin" or "least_latency". Defaults to
+            "round_robin"
+        node_retry_after(float): seconds before a down node gets traffic
+            again, when health checks are off. Defaults to 30
+        health_check_interval(float): seconds between background health
+            checks of the nodes. Defaults to None, no background checks
+        discover_nodes(bool): add the cluster members reported by the
+            server to hosts. Defaults to False
+        router: a `NodeRouter` to use instead of the one shared by the
+            clients with the same hosts and routing entries
+    Call `close()`, or use the client as a context manager, to stop the
+    health checks once no other client shares the router.
+
+    Queries are read-only, so they can be hedged: when a query has not
+    answered within a percentile of the recent query latencies, it is sent
+    to a second node and the first answer wins. The slower request cannot
+    be aborted once sent, its answer is discarded, and it keeps a worker
+    until then: a query is neither hedged, nor run on the 2 * pool_size
+    workers, while they are all busy. Hedging is tuned by:
+        hedge_queries(bool): enable hedging. Defaults to False
+        hedge_percentile(float): latency percentile after which a query is
+            hedged. Defaults to 95
+        hedge_min_delay(float): lower bound of the hedging delay in seconds.
+            Defaults to 0.002
+        hedge_max_delay(float): upper bound of the hedging delay in seconds.
+            Defaults to 1
+        hedge_policy: a `HedgePolicy` to share with other clients, its
+            `stats()` tell how often hedges fire, win and are skipped
+
+    Requests are instrumented when a collector is configured, see
+    `infinispan_vector.metrics`:
+        metrics: a `Metrics` instance to share, or True for a new one.
+            Defaults to None, no instrumentation
+        metrics_hooks(list): `MetricsHook` instances, i.e. OpenTelemetry or
+            Prometheus exporters. Setting hooks enables the metrics
     """
 
     def __init__(self, **kwargs: Any):
         self._configuration = kwargs
         self._schema = str(self._configuration.get("schema", "http"))
-        self._host = str(self._configuration.get("hosts", ["127.0.0.1:11222"])[0])
+        self._hosts = tuple(self._configuration.get("hosts", ["127.0.0.1:11222"]))
+        self._host = str(self._hosts[0])
         self._default_node = self._schema + "://" + self._host
         self._cache_url = str(self._configuration.get("cache_url", "/rest/v2/caches"))
         self._schema_url = str(self._configuration.get("cache_url", "/rest/v2/schemas"))
         self._use_post_for_query = str(
             self._configuration.get("use_post_for_query", True)
         )
+        self._default_timeout = float(self._configuration.get("timeout", REST_TIMEOUT))
+        self._timeouts = dict(self._configuration.get("timeouts", {}))
+        self._transport: Any = self._configuration.get("transport")
+        self._router: Optional[NodeRouter] = self._configuration.get("router")
+        # the router from shared_router, to release on close
+        self._shared_router: Optional[NodeRouter] = None
+        self._rest_lock = threading.RLock()
+        self._hotrod: Optional[HotRodTransport] = None
+        if self._configuration.get("protocol", "rest") == "hotrod":
+            self._hotrod = HotRodTransport(
+                self._configuration.get("hotrod_hosts", self._hosts),
+                int(self._configuration.get("pool_size", POOL_SIZE)),
+                self._default_timeout,
+            )
+        else:
+            # discover the nodes and start the health checks right away
+            self._get_router()
+        self._hedge_policy: Optional[HedgePolicy] = self._configuration.get(
+            "hedge_policy"
+        )
+        if self._hedge_policy is None and self._configuration.get("hedge_queries"):
+            self._hedge_policy = HedgePolicy(
+                percentile=float(self._configuration.get("hedge_percentile", 95.0)),
+                min_delay=float(self._configuration.get("hedge_min_delay", 0.002)),
+                max_delay=float(self._configuration.get("hedge_max_delay", 1.0)),
+            )
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedge_executor_lock = threading.Lock()
+        self._hedge_workers = 2 * int(self._configuration.get("pool_size", POOL_SIZE))
+        # one slot per worker, held by each query request until it ends
+        self._hedge_slots = threading.BoundedSemaphore(self._hedge_workers)
+        self._metrics = Metrics.of(
+            self._configuration.get("metrics"),
+            self._configuration.get("metrics_hooks", ()),
+        )
+
+    @property
+    def metrics(self) -> Optional[Metrics]:
+        """The metrics collector, None if instrumentation is off"""
+        return self._metrics
+
+    @property
+    def transport(self) -> Any:
+        """The REST transport. With the hotrod protocol it is only created
+        when a REST operation is used, like the router."""
+        if self._transport is None:
+            with self._rest_lock:
+                if self._transport is None:
+                    self._transport = shared_transport(
+                        self._schema,
+                        self._hosts,
+                        int(self._configuration.get("pool_size", POOL_SIZE)),
+                    )
+        return self._transport
+
+    @property
+    def router(self) -> NodeRouter:
+        """The router of the REST requests"""
+        return self._get_router()
+
+    def _get_router(self) -> NodeRouter:
+        if self._router is None:
+            with self._rest_lock:
+                if self._router is None:
+                    self._router = shared_router(
+                        [self._schema + "://" + str(host) for host in self._hosts],
+                        transport=self.transport,
+                        strategy=str(self._configuration.get("routing", ROUND_ROBIN)),
+                        retry_after=float(
+                            self._configuration.get("node_retry_after", 30.0)
+                        ),
+                        health_interval=self._configuration.get(
+                            "health_check_interval"
+                        ),
+                        discover=bool(self._configuration.get("discover_nodes", False)),
+                        timeout=self._default_timeout,
+                    )
+                    self._shared_router = self._router
+        return self._router
+
+    def close(self) -> None:
+        """Release the resources of the client: the router health checks
+        stop once no other client shares the router, the hedging threads
+        and the Hot Rod connections are closed. The pooled REST transport
+        is shared, see `close_shared_transports`."""
+        with self._rest_lock:
+            router, self._shared_router = self._shared_router, None
+            if router is not None:
+                self._router = None
+        if router is not None:
+            release_router(router)
+        with self._hedge_executor_lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if self._hotrod is not None:
+            self._hotrod.close()
+
+    def __enter__(self) -> "Infinispan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def hedge_policy(self) -> Optional[HedgePolicy]:
+        """The query hedging policy, None if hedging is off"""
+        return self._hedge_policy
+
+    @property
+    def hotrod(self) -> Optional[HotRodTransport]:
+        """The Hot Rod transport, None if protocol is rest"""
+        return self._hotrod
+
+    def _timeout(self, operation: str) -> float:
+        return self._timeouts.get(operation, self._default_timeout)
+
+    def _request(
+            self,
+            operation: str,
+            method: str,
+            api_url: str,
+            tried: Optional[List[Node]] = None,
+            **kwargs: Any,
+    ) -> requests.Response:
+        if self._metrics is not None:
+            with self._metrics.stage("http." + operation):
+                response = self._send(operation, method, api_url, tried, **kwargs)
+            self._record(
+                "http." + operation, payload_size(kwargs.get("data")), response
+            )
+            return response
+        return self._send(operation, method, api_url, tried, **kwargs)
+
+    def _record(self, name: str, sent: int, response: Any) -> None:
+        metrics = self._metrics
+        assert metrics is not None
+        metrics.transferred(name, sent, len(response.content or b""))
+        if not response.ok and response.status_code != 404:
+            metrics.error(name)
+
+    def _send(
+            self,
+            operation: str,
+            method: str,
+            api_url: str,
+            tried: Optional[List[Node]] = None,
+            **kwargs: Any,
+    ) -> requests.Response:
+        # tried may be shared with a hedged request, so that each one
+        # avoids the nodes used by the other
+        tried = [] if tried is None else tried
+        router = self.router
+        transport = self.transport
+        while True:
+            node = router.pick(tried)
+            if node is None:
+                raise requests.ConnectionError(
+                    "No Infinispan node reachable for " + api_url
+                )
+            tried.append(node)
+            start = time.perf_counter()
+            try:
+                response = transport.request(
+                    method, node.url + api_url, timeout=self._timeout(operation), **kwargs
+                )
+            except requests.ConnectionError:
+                router.failure(node)
+                if len(tried) >= len(router.nodes):
+                    raise
+                continue
+            router.success(node, time.perf_counter() - start)
+            return response
+
+    def _hotrod_request(self, operation: str, sent: int, call: Any, *args: Any) -> Any:
+        if self._metrics is None:
+            return call(*args)
+        with self._metrics.stage("hotrod." + operation):
+            response = call(*args)
+        self._record("hotrod." + operation, sent, response)
+        return response
 
     def req_query(
-            self, query: str, cache_name: str, local: bool = False
+            self,
+            query: str,
+            cache_name: str,
+            local: bool = False,
+            offset: Optional[int] = None,
+            max_results: Optional[int] = None,
     ) -> requests.Response:
         """Request a query
         Args:
             query(str): query requested
             cache_name(str): name of the target cache
             local(boolean): whether the query is local to clustered
+            offset(int): index of the first result to return
+            max_results(int): max number of results to return,
+                the server default applies if None
         Returns:
             An http Response containing the result set or errors
         """
-        if self._use_post_for_query:
-            return self._query_post(query, cache_name, local)
-        return self._query_get(query, cache_name, local)
+        if self._hotrod is not None:
+            return self._hotrod_request(
+                "query",
+                payload_size(query),
+                self._hotrod.query,
+                query,
+                cache_name,
+                local,
+                offset,
+                max_results,
+                self._timeout("query"),
+            )
+        send = self._query_post if self._use_post_for_query else self._query_get
+        if self._hedge_policy is None:
+            return send(query, cache_name, local, offset, max_results)
+        return self._hedged(
+            lambda tried: send(query, cache_name, local, offset, max_results, tried)
+        )
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._hedge_executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self._hedge_workers,
+                    thread_name_prefix="infinispan-hedge",
+                )
+            return self._hedge_executor
+
+    def _hedged(self, send: Any) -> requests.Response:
+        policy = self._hedge_policy
+        assert policy is not None
+        tried: List[Node] = []
+
+        def timed() -> requests.Response:
+            start = time.perf_counter()
+            response = send(tried)
+            policy.record(time.perf_counter() - start)
+            return response
+
+        def released() -> requests.Response:
+            try:
+                return timed()
+            finally:
+                self._hedge_slots.release()
+
+        policy.started()
+        # a request runs on the executor only if a worker is free for it:
+        # losing requests keep their worker until the server answers, and
+        # queueing behind them would delay the next queries
+        if not self._hedge_slots.acquire(blocking=False):
+            policy.skipped()
+            return timed()
+        executor = self._get_hedge_executor()
+        primary = executor.submit(released)
+        try:
+            return primary.result(timeout=policy.delay())
+        except FutureTimeoutError:
+            pass
+        if len(tried) >= len(self.router.nodes):
+            # no other node to hedge to
+            return primary.result()
+        if not self._hedge_slots.acquire(blocking=False):
+            policy.skipped()
+            return primary.result()
+        policy.started(hedged=True)
+        hedge = executor.submit(released)
+        done, pending = wait((primary, hedge), return_when=FIRST_COMPLETED)
+        winner = primary if primary in done else hedge
+        if winner.exception() is not None and pending:
+            # the first answer is an error, wait for the other one
+            other = hedge if winner is primary else primary
+            if other.exception() is None:
+                winner = other
+        if winner is hedge:
+            policy.won()
+        for future in (primary, hedge):
+            if future is not winner and future.cancel():
+                self._hedge_slots.release()
+        return winner.result()
 
     def _query_post(
-            self, query_str: str, cache_name: str, local: bool = False
+            self,
+            query_str: str,
+            cache_name: str,
+            local: bool = False,
+            offset: Optional[int] = None,
+            max_results: Optional[int] = None,
+            tried: Optional[List[Node]] = None,
     ) -> requests.Response:
         api_url = (
-                self._default_node
-                + self._cache_url
+                self._cache_url
                 + "/"
                 + cache_name
                 + "?action=search&local="
                 + str(local)
         )
-        data = {"query": query_str}
+        data: Dict[str, Any] = {"query": query_str}
+        if offset is not None:
+            data["offset"] = offset
+        if max_results is not None:
+            data["max_results"] = max_results
         data_json = json.dumps(data)
-        response = requests.post(
+        response = self._request(
+            "query",
+            "POST",
             api_url,
-            data_json,
+            tried,
+            data=data_json,
             headers={"Content-Type": "application/json"},
-            timeout=REST_TIMEOUT,
         )
         return response
 
     def _query_get(
-            self, query_str: str, cache_name: str, local: bool = False
+            self,
+            query_str: str,
+            cache_name: str,
+            local: bool = False,
+            offset: Optional[int] = None,
+            max_results: Optional[int] = None,
+            tried: Optional[List[Node]] = None,
     ) -> requests.Response:
         api_url = (
-                self._default_node
-                + self._cache_url
+                self._cache_url
                 + "/"
                 + cache_name
                 + "?action=search&query="
@@ -437,7 +2395,11 @@ class Infinispan:
                 + "&local="
                 + str(local)
         )
-        response = requests.get(api_url, timeout=REST_TIMEOUT)
+        if offset is not None:
+            api_url += "&offset=" + str(offset)
+        if max_results is not None:
+            api_url += "&max_results=" + str(max_results)
+        response = self._request("query", "GET", api_url, tried)
         return response
 
     def post(self, key: str, data: str, cache_name: str) -> requests.Response:
@@ -449,30 +2411,51 @@ class Infinispan:
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._cache_url + "/" + cache_name + "/" + key
-        response = requests.post(
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        response = self._request(
+            "post",
+            "POST",
             api_url,
-            data,
+            data=data,
             headers={"Content-Type": "application/json"},
-            timeout=REST_TIMEOUT,
         )
         return response
 
-    def put(self, key: str, data: str, cache_name: str) -> requests.Response:
+    def put(
+            self,
+            key: str,
+            data: Union[str, bytes],
+            cache_name: str,
+            content_type: str = "application/json",
+    ) -> requests.Response:
         """Put an entry
         Args:
             key(str): key of the entry
-            data(str): content of the entry in json format
+            data(str): content of the entry, in json format by default
             cache_name(str): target cache
+            content_type(str): media type of data, i.e.
+                application/x-protostream for encoded entries
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._cache_url + "/" + cache_name + "/" + key
-        response = requests.put(
+        if self._hotrod is not None:
+            return self._hotrod_request(
+                "put",
+                payload_size(data),
+                self._hotrod.put,
+                key,
+                data,
+                cache_name,
+                self._timeout("put"),
+                content_type,
+            )
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        response = self._request(
+            "put",
+            "PUT",
             api_url,
-            data,
-            headers={"Content-Type": "application/json"},
-            timeout=REST_TIMEOUT,
+            data=data,
+            headers={"Content-Type": content_type},
         )
         return response
 
@@ -484,12 +2467,60 @@ class Infinispan:
         Returns:
             An http Response containing the entry or errors
         """
-        api_url = self._default_node + self._cache_url + "/" + cache_name + "/" + key
-        response = requests.get(
-            api_url, headers={"Content-Type": "application/json"}, timeout=REST_TIMEOUT
+        if self._hotrod is not None:
+            return self._hotrod_request(
+                "get", 0, self._hotrod.get, key, cache_name, self._timeout("get")
+            )
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        response = self._request(
+            "get", "GET", api_url, headers={"Content-Type": "application/json"}
         )
         return response
 
+    def delete(self, key: str, cache_name: str) -> requests.Response:
+        """Delete an entry
+        Args:
+            key(str): key of the entry
+            cache_name(str): target cache
+        Returns:
+            An http Response containing the result of the operation
+        """
+        if self._hotrod is not None:
+            return self._hotrod_request(
+                "delete",
+                0,
+                self._hotrod.remove,
+                key,
+                cache_name,
+                self._timeout("delete"),
+            )
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        response = self._request("delete", "DELETE", api_url)
+        return response
+
+    def entry_exists(self, key: str, cache_name: str) -> bool:
+        """Check if an entry exists
+        Args:
+            key(str): key of the entry
+            cache_name(str): target cache
+        Returns:
+            True if the entry exists
+        """
+        api_url = self._cache_url + "/" + cache_name + "/" + key
+        return self._request("get", "HEAD", api_url).ok
+
+    def keys(self, cache_name: str) -> requests.Response:
+        """List the keys of a cache
+        Args:
+            cache_name(str): target cache
+        Returns:
+            An http Response containing the keys as a json array
+        """
+        api_url = (
+                self._cache_url + "/" + cache_name + "?action=keys"
+        )
+        return self._request("cache", "GET", api_url)
+
     def schema_post(self, name: str, proto: str) -> requests.Response:
         """Deploy a schema
         Args:
@@ -498,8 +2529,19 @@ class Infinispan:
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._schema_url + "/" + name
-        response = requests.post(api_url, proto, timeout=REST_TIMEOUT)
+        api_url = self._schema_url + "/" + name
+        response = self._request("schema", "POST", api_url, data=proto)
+        return response
+
+    def schema_get(self, name: str) -> requests.Response:
+        """Get a schema
+        Args:
+            name(str): name of the schema.
+        Returns:
+            An http Response containing the protobuf schema
+        """
+        api_url = self._schema_url + "/" + name
+        response = self._request("schema", "GET", api_url)
         return response
 
     def cache_post(self, name: str, config: str) -> requests.Response:
@@ -510,12 +2552,13 @@ class Infinispan:
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._cache_url + "/" + name
-        response = requests.post(
+        api_url = self._cache_url + "/" + name
+        response = self._request(
+            "cache",
+            "POST",
             api_url,
-            config,
+            data=config,
             headers={"Content-Type": "application/json"},
-            timeout=REST_TIMEOUT,
         )
         return response
 
@@ -526,8 +2569,8 @@ class Infinispan:
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._schema_url + "/" + name
-        response = requests.delete(api_url, timeout=REST_TIMEOUT)
+        api_url = self._schema_url + "/" + name
+        response = self._request("schema", "DELETE", api_url)
         return response
 
     def cache_delete(self, name: str) -> requests.Response:
@@ -537,8 +2580,8 @@ class Infinispan:
         Returns:
             An http Response containing the result of the operation
         """
-        api_url = self._default_node + self._cache_url + "/" + name
-        response = requests.delete(api_url, timeout=REST_TIMEOUT)
+        api_url = self._cache_url + "/" + name
+        response = self._request("cache", "DELETE", api_url)
         return response
 
     def cache_clear(self, cache_name: str) -> requests.Response:
@@ -549,9 +2592,9 @@ class Infinispan:
             An http Response containing the result of the operation
         """
         api_url = (
-                self._default_node + self._cache_url + "/" + cache_name + "?action=clear"
+                self._cache_url + "/" + cache_name + "?action=clear"
         )
-        response = requests.post(api_url, timeout=REST_TIMEOUT)
+        response = self._request("cache", "POST", api_url)
         return response
 
     def cache_exists(self, cache_name: str) -> bool:
@@ -562,20 +2605,29 @@ class Infinispan:
             True if cache exists
         """
         api_url = (
-                self._default_node + self._cache_url + "/" + cache_name + "?action=clear"
+                self._cache_url + "/" + cache_name + "?action=clear"
         )
-        return self.resource_exists(api_url)
+        return self._request("cache", "HEAD", api_url).ok
 
     @staticmethod
     def resource_exists(api_url: str) -> bool:
         """Check if a resource exists
         Args:
-            api_url(str): url of the resource.
+            api_url(str): full url of the resource.
+        Returns:
+            true if resource exists
+        """
+        return _resource_exists(api_url)
+
+    def path_exists(self, api_path: str) -> bool:
+        """Check if a resource exists, asking the nodes like the other
+        operations do
+        Args:
+            api_path(str): path of the resource, i.e. /rest/v2/caches/name
         Returns:
             true if resource exists
         """
-        response = requests.head(api_url, timeout=REST_TIMEOUT)
-        return response.ok
+        return self._request("get", "HEAD", api_path).ok
 
     def index_clear(self, cache_name: str) -> requests.Response:
         """Clear an index on a cache
@@ -585,13 +2637,12 @@ class Infinispan:
             An http Response containing the result of the operation
         """
         api_url = (
-                self._default_node
-                + self._cache_url
+                self._cache_url
                 + "/"
                 + cache_name
                 + "/search/indexes?action=clear"
         )
-        return requests.post(api_url, timeout=REST_TIMEOUT)
+        return self._request("index", "POST", api_url)
 
     def index_reindex(self, cache_name: str) -> requests.Response:
         """Rebuild index on a cache
@@ -601,10 +2652,9 @@ class Infinispan:
             An http Response containing the result of the operation
         """
         api_url = (
-                self._default_node
-                + self._cache_url
+                self._cache_url
                 + "/"
                 + cache_name
                 + "/search/indexes?action=reindex"
         )
-        return requests.post(api_url, timeout=REST_TIMEOUT)
+        return self._request("index", "POST", api_url)
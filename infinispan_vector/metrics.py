@@ -0,0 +1,336 @@
+"""Module providing the instrumentation of the client operations
+
+A `Metrics` collector records the latency of each stage of an operation
+(embedding, query building, http round trip, decoding, ...) in fixed bucket
+histograms, the bytes sent and received and the errors. Hooks forward the
+same events to other systems, `OpenTelemetryHook` and `PrometheusHook` are
+provided.
+
+Instrumentation is off unless a collector is configured: every stage then
+goes through a shared no-op context manager.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+# upper bounds in seconds of the histogram buckets, the last one is +inf
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+_NOOP = nullcontext()
+
+# Prometheus collectors by (registry, namespace), a name can only be
+# registered once per registry
+_prometheus_collectors: Dict[Tuple[Any, str], Tuple[Any, Any, Any]] = {}
+_prometheus_lock = threading.Lock()
+
+
+class Histogram:
+    """Latency histogram with fixed buckets"""
+
+    __slots__ = ("count", "sum", "counts")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.counts = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.counts[bisect_left(BUCKETS, value)] += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile, inf if it falls
+        in the last bucket and 0 if nothing was observed"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([*BUCKETS, float("inf")], self.counts)),
+        }
+
+
+class MetricsHook:
+    """Receives the events recorded by `Metrics`. Subclasses override the
+    methods they need."""
+
+    def stage_started(self, name: str) -> Any:
+        """Called when a stage starts
+        Returns:
+            A token handed back to `stage_finished`
+        """
+        return None
+
+    def stage_finished(
+            self, name: str, token: Any, seconds: float, error: Optional[BaseException]
+    ) -> None:
+        """Called when a stage ends, error is the exception raised if any"""
+
+    def bytes_transferred(self, operation: str, sent: int, received: int) -> None:
+        """Called after each request to the server"""
+
+    def error(self, name: str) -> None:
+        """Called for each failed stage or request"""
+
+
+class _Stage:
+    __slots__ = ("_metrics", "_name", "_start", "_tokens")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self._metrics = metrics
+        self._name = name
+        self._tokens: List[Any] = []
+
+    def __enter__(self) -> "_Stage":
+        hooks = self._metrics.hooks
+        if hooks:
+            self._tokens = [hook.stage_started(self._name) for hook in hooks]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        seconds = time.perf_counter() - self._start
+        metrics = self._metrics
+        metrics.observe(self._name, seconds)
+        # an exception is counted by the stage raising it, not again by each
+        # enclosing stage it goes through
+        if exc is not None and getattr(exc, "_infinispan_metrics", None) is not metrics:
+            metrics.error(self._name)
+            try:
+                exc._infinispan_metrics = metrics
+            except AttributeError:
+                pass
+        for hook, token in zip(metrics.hooks, self._tokens):
+            hook.stage_finished(self._name, token, seconds, exc)
+
+
+class Metrics:
+    """Collects stage latencies, byte counts and errors of the clients.
+
+    Share one instance between `InfinispanVS`, `Infinispan` and
+    `AsyncInfinispan` through the `metrics` configuration entry, then read
+    `snapshot()`.
+
+    Args:
+        hooks: `MetricsHook` instances receiving every event
+    """
+
+    def __init__(self, hooks: Iterable[MetricsHook] = ()):
+        self.hooks: List[MetricsHook] = list(hooks)
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._errors: Dict[str, int] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def stage(self, name: str) -> ContextManager[Any]:
+        """Context manager timing a stage"""
+        return _Stage(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram()
+            histogram.observe(seconds)
+
+    def error(self, name: str) -> None:
+        with self._lock:
+            self._errors[name] = self._errors.get(name, 0) + 1
+        for hook in self.hooks:
+            hook.error(name)
+
+    def transferred(self, operation: str, sent: int, received: int) -> None:
+        with self._lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+        for hook in self.hooks:
+            hook.bytes_transferred(operation, sent, received)
+
+    def histogram(self, name: str) -> Optional[Histogram]:
+        return self._stages.get(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the recorded values"""
+        with self._lock:
+            return {
+                "stages": {
+                    name: histogram.to_dict()
+                    for name, histogram in self._stages.items()
+                },
+                "errors": dict(self._errors),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._errors.clear()
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    @staticmethod
+    def of(value: Any, hooks: Iterable[MetricsHook] = ()) -> Optional["Metrics"]:
+        """Accept a collector, True for a new one, or a false value"""
+        if isinstance(value, Metrics):
+            return value
+        if value or hooks:
+            return Metrics(hooks)
+        return None
+
+
+def stage(metrics: Optional[Metrics], name: str) -> ContextManager[Any]:
+    """Time a stage, a no-op when metrics is None"""
+    if metrics is None:
+        return _NOOP
+    return _Stage(metrics, name)
+
+
+def payload_size(data: Any) -> int:
+    """Size in bytes of a request body"""
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+class OpenTelemetryHook(MetricsHook):
+    """Records each stage as an OpenTelemetry span, nested stages as child
+    spans.
+
+    Args:
+        tracer: the tracer to use. Defaults to the tracer of this module
+            from the global tracer provider
+    """
+
+    def __init__(self, tracer: Any = None):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError(
+                "Could not import opentelemetry python package. "
+                "Please install it with `pip install opentelemetry-api`."
+            )
+        self._trace = trace
+        self._tracer = tracer or trace.get_tracer(__name__)
+
+    def stage_started(self, name: str) -> Any:
+        span = self._tracer.start_as_current_span("infinispan." + name)
+        span.__enter__()
+        return span
+
+    def stage_finished(
+            self, name: str, token: Any, seconds: float, error: Optional[BaseException]
+    ) -> None:
+        if error is not None:
+            # exiting the span with the error records it as an event
+            current = self._trace.get_current_span()
+            current.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+            token.__exit__(type(error), error, error.__traceback__)
+        else:
+            token.__exit__(None, None, None)
+
+
+class PrometheusHook(MetricsHook):
+    """Exports the stages, bytes and errors as Prometheus collectors.
+
+    Hooks on the same registry and namespace share their collectors.
+
+    Args:
+        registry: the prometheus_client registry. Defaults to the global one
+        namespace(str): prefix of the metric names
+    """
+
+    def __init__(self, registry: Any = None, namespace: str = "infinispan_vector"):
+        try:
+            import prometheus_client
+        except ImportError:
+            raise ImportError(
+                "Could not import prometheus_client python package. "
+                "Please install it with `pip install prometheus-client`."
+            )
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        with _prometheus_lock:
+            collectors = _prometheus_collectors.get((registry, namespace))
+            if collectors is None:
+                kwargs: Dict[str, Any] = {"namespace": namespace, "registry": registry}
+                collectors = (
+                    prometheus_client.Histogram(
+                        "stage_seconds",
+                        "Latency of the client stages",
+                        ["stage"],
+                        buckets=BUCKETS,
+                        **kwargs,
+                    ),
+                    prometheus_client.Counter(
+                        "transferred_bytes",
+                        "Bytes exchanged with the server",
+                        ["operation", "direction"],
+                        **kwargs,
+                    ),
+                    prometheus_client.Counter(
+                        "errors", "Failed stages and requests", ["stage"], **kwargs
+                    ),
+                )
+                _prometheus_collectors[(registry, namespace)] = collectors
+        self._seconds, self._bytes, self._errors = collectors
+
+    def stage_finished(
+            self, name: str, token: Any, seconds: float, error: Optional[BaseException]
+    ) -> None:
+        self._seconds.labels(name).observe(seconds)
+
+    def bytes_transferred(self, operation: str, sent: int, received: int) -> None:
+        self._bytes.labels(operation, "sent").inc(sent)
+        self._bytes.labels(operation, "received").inc(received)
+
+    def error(self, name: str) -> None:
+        self._errors.labels(name).inc()
+
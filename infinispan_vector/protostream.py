@@ -0,0 +1,175 @@
+"""Module encoding entries as protostream messages
+
+Infinispan stores indexed entries as protobuf messages wrapped in a
+protostream `WrappedMessage`. Encoding them on the client avoids the
+server side JSON transcoding and sends vectors as packed float32 instead
+of decimal text.
+"""
+
+from __future__ import annotations
+
+import re
+import struct
+from typing import (
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+)
+
+PROTOSTREAM_MEDIA_TYPE = "application/x-protostream"
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+# WrappedMessage field numbers
+_WRAPPED_STRING = 9
+_WRAPPED_DESCRIPTOR_FULL_NAME = 16
+_WRAPPED_MESSAGE = 17
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+_PACKAGE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_MESSAGE = re.compile(r"message\s+(\w+)\s*\{(.*?)\}", re.DOTALL)
+_FIELD = re.compile(
+    r"(?:(optional|required|repeated)\s+)?([\w.]+)\s+(\w+)\s*=\s*(\d+)\s*"
+    r"(\[[^\]]*\])?\s*;"
+)
+_COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*", re.DOTALL)
+
+_FIXED_FORMATS = {
+    "double": (_FIXED64, "d"),
+    "fixed64": (_FIXED64, "Q"),
+    "sfixed64": (_FIXED64, "q"),
+    "float": (_FIXED32, "f"),
+    "fixed32": (_FIXED32, "I"),
+    "sfixed32": (_FIXED32, "i"),
+}
+_VARINT_TYPES = ("int32", "int64", "uint32", "uint64", "bool", "enum")
+_ZIGZAG_TYPES = ("sint32", "sint64")
+_BYTES_TYPES = ("string", "bytes")
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode an int as a protobuf varint, negative values as 64 bit"""
+    value &= _MASK64
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _tag(number: int, wire_type: int) -> bytes:
+    return encode_varint((number << 3) | wire_type)
+
+
+def _length_delimited(number: int, data: bytes) -> bytes:
+    return _tag(number, _LENGTH_DELIMITED) + encode_varint(len(data)) + data
+
+
+def wrap_string(value: str) -> bytes:
+    """Encode a string as a protostream WrappedMessage"""
+    return _length_delimited(_WRAPPED_STRING, value.encode("utf-8"))
+
+
+def wrap_message(type_name: str, message: bytes) -> bytes:
+    """Wrap an encoded message with its full type name"""
+    return _length_delimited(
+        _WRAPPED_DESCRIPTOR_FULL_NAME, type_name.encode("utf-8")
+    ) + _length_delimited(_WRAPPED_MESSAGE, message)
+
+
+class Field(NamedTuple):
+    number: int
+    type: str
+    repeated: bool
+
+
+class ProtobufEncoder:
+    """Encodes dict entities into protostream wrapped protobuf messages.
+
+    The layout comes from the message definition of the schema, i.e. the
+    one produced by `InfinispanVS.schema_builder`. Repeated numeric fields,
+    like the vector, are packed.
+    """
+
+    def __init__(self, type_name: str, fields: Dict[str, Field]):
+        self.type_name = type_name
+        self.fields = fields
+
+    @staticmethod
+    def from_schema(proto: str, message_name: str) -> "ProtobufEncoder":
+        """Build the encoder of a message defined in a .proto schema
+        Args:
+            proto(str): protobuf schema
+            message_name(str): name of the message, without package
+        Returns:
+            The encoder for the message
+        """
+        proto = _COMMENT.sub("", proto)
+        package = _PACKAGE.search(proto)
+        for match in _MESSAGE.finditer(proto):
+            if match.group(1) == message_name:
+                fields = {
+                    name: Field(int(number), type_name, label == "repeated")
+                    for label, type_name, name, number, _ in _FIELD.findall(
+                        match.group(2)
+                    )
+                }
+                full_name = (
+                    package.group(1) + "." + message_name if package else message_name
+                )
+                return ProtobufEncoder(full_name, fields)
+        raise ValueError("Message " + message_name + " not found in schema")
+
+    def _scalar(self, field: Field, value: Any) -> bytes:
+        if field.type in _FIXED_FORMATS:
+            wire_type, fmt = _FIXED_FORMATS[field.type]
+            return _tag(field.number, wire_type) + struct.pack("<" + fmt, value)
+        if field.type in _VARINT_TYPES:
+            return _tag(field.number, _VARINT) + encode_varint(int(value))
+        if field.type in _ZIGZAG_TYPES:
+            value = int(value)
+            return _tag(field.number, _VARINT) + encode_varint(
+                (value << 1) ^ (value >> 63)
+            )
+        if field.type in _BYTES_TYPES:
+            data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+            return _length_delimited(field.number, data)
+        raise ValueError("Unsupported protobuf type: " + field.type)
+
+    def _packed(self, field: Field, values: Any) -> bytes:
+        if field.type in _FIXED_FORMATS:
+            fmt = _FIXED_FORMATS[field.type][1]
+            data = struct.pack("<%d%s" % (len(values), fmt), *values)
+        elif field.type in _VARINT_TYPES:
+            data = b"".join(encode_varint(int(v)) for v in values)
+        else:
+            return b"".join(self._scalar(field, v) for v in values)
+        return _length_delimited(field.number, data)
+
+    def encode_message(self, entity: Dict[str, Any]) -> bytes:
+        """Encode an entity as a bare protobuf message. None values and
+        the `_type` marker of the JSON format are skipped."""
+        out: List[bytes] = []
+        for name, value in entity.items():
+            if value is None or name == "_type":
+                continue
+            field = self.fields.get(name)
+            if field is None:
+                raise ValueError(
+                    "Field " + name + " is not defined in message " + self.type_name
+                )
+            if field.repeated:
+                out.append(self._packed(field, value))
+            else:
+                out.append(self._scalar(field, value))
+        return b"".join(out)
+
+    def encode(self, entity: Dict[str, Any]) -> bytes:
+        """Encode an entity as a protostream WrappedMessage"""
+        return wrap_message(self.type_name, self.encode_message(entity))
@@ -0,0 +1,106 @@
+"""Module providing the int8 scalar quantization of vectors"""
+
+from __future__ import annotations
+
+import base64
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
+
+from infinispan_vector.utils import _import_numpy
+
+QMAX = 127
+
+
+class Int8Quantizer:
+    """Symmetric int8 scalar quantizer.
+
+    Each component is stored as round(x / scale) clipped to [-127, 127].
+    With a global scale the quantized vectors are the original ones scaled
+    down, so distances keep their ranking up to rounding errors. With
+    per-dimension scales every component uses the full int8 range, which
+    lowers the rounding error of dimensions with a small spread at the cost
+    of weighting the distance computed by the server.
+
+    Scales are calibrated from a sample of vectors; `to_dict` and
+    `from_dict` let the calibration be stored with the application
+    configuration so every process quantizes the same way.
+    """
+
+    def __init__(self, scales: Any):
+        np = _import_numpy()
+        self.scales = np.asarray(scales, dtype=np.float32)
+        self.scales[self.scales == 0] = 1.0
+
+    @staticmethod
+    def calibrate(
+            vectors: Any, per_dimension: bool = False, percentile: float = 100.0
+    ) -> "Int8Quantizer":
+        """Compute the scales from a sample of vectors
+        Args:
+            vectors: sample of vectors, one per row
+            per_dimension(bool): one scale per dimension instead of a global one
+            percentile(float): percentile of the absolute values mapped to 127.
+                Lower values clip outliers to gain resolution. Defaults to 100
+        Returns:
+            The calibrated quantizer
+        """
+        np = _import_numpy()
+        sample = np.abs(np.asarray(vectors, dtype=np.float32))
+        if sample.ndim != 2 or not sample.size:
+            raise ValueError("Calibration needs a non empty 2D sample")
+        if per_dimension:
+            bound = np.percentile(sample, percentile, axis=0)
+        else:
+            bound = np.full(sample.shape[1], np.percentile(sample, percentile))
+        return Int8Quantizer(bound / QMAX)
+
+    @property
+    def dimension(self) -> int:
+        return len(self.scales)
+
+    def quantize(self, vectors: Any) -> Any:
+        """Quantize a vector, or a batch of vectors, to an int8 NumPy array"""
+        np = _import_numpy()
+        codes = np.rint(np.asarray(vectors, dtype=np.float32) / self.scales)
+        return np.clip(codes, -QMAX, QMAX).astype(np.int8)
+
+    def dequantize(self, codes: Any) -> Any:
+        """Approximate float32 vectors of int8 codes"""
+        np = _import_numpy()
+        return np.asarray(codes, dtype=np.float32) * self.scales
+
+    def encode(self, vector: List[float]) -> bytes:
+        """Quantized vector as the content of a protobuf bytes field"""
+        return self.quantize(vector).tobytes()
+
+    def decode(self, value: Any) -> List[float]:
+        """Dequantize a stored vector, returned by the server either as
+        base64 text or as a list of ints"""
+        np = _import_numpy()
+        if isinstance(value, str):
+            codes = np.frombuffer(base64.b64decode(value), dtype=np.int8)
+        elif isinstance(value, (bytes, bytearray)):
+            codes = np.frombuffer(value, dtype=np.int8)
+        else:
+            codes = np.asarray(value, dtype=np.int8)
+        return self.dequantize(codes).tolist()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": "int8", "scales": self.scales.tolist()}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "Int8Quantizer":
+        if data.get("type", "int8") != "int8":
+            raise ValueError("Unsupported quantization: " + str(data.get("type")))
+        return Int8Quantizer(data["scales"])
+
+    @staticmethod
+    def of(value: Optional[Any]) -> Optional["Int8Quantizer"]:
+        """Accept a quantizer, its dict form or None"""
+        if value is None or isinstance(value, Int8Quantizer):
+            return value
+        return Int8Quantizer.from_dict(value)
@@ -0,0 +1,352 @@
+"""Module routing requests over the nodes of an Infinispan cluster"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from infinispan_vector.transport import REST_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+HEALTH_URL = "/rest/v2/cache-managers/default/health/status"
+CLUSTER_URL = "/rest/v2/cache-managers/default"
+
+ROUND_ROBIN = "round_robin"
+LEAST_LATENCY = "least_latency"
+
+
+class Node:
+    """A cluster node, with its health and smoothed latency"""
+
+    __slots__ = ("url", "healthy", "latency", "failures", "down_since")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.latency = 0.0
+        self.failures = 0
+        self.down_since = 0.0
+
+    def __repr__(self) -> str:
+        return "Node(%r, healthy=%r, latency=%.4f)" % (
+            self.url,
+            self.healthy,
+            self.latency,
+        )
+
+
+class NodeRouter:
+    """Picks the node serving each request.
+
+    Requests are spread over the healthy nodes, either round-robin or to
+    the node with the lowest smoothed latency. A node is marked down when
+    a request to it fails to connect. Down nodes are probed by background
+    health checks when `health_interval` is set, otherwise they get real
+    traffic again after `retry_after` seconds.
+
+    With `discover`, the cluster members reported by the server are added
+    to the nodes. Members are reached on the port of the first node, as
+    the server reports their cluster (not REST) addresses.
+    """
+
+    def __init__(
+            self,
+            urls: Iterable[str],
+            strategy: str = ROUND_ROBIN,
+            retry_after: float = 30.0,
+            health_interval: Optional[float] = None,
+            discover: bool = False,
+            transport: Any = None,
+            timeout: float = REST_TIMEOUT,
+            smoothing: float = 0.2,
+    ):
+        if strategy not in (ROUND_ROBIN, LEAST_LATENCY):
+            raise ValueError("Unknown routing strategy: " + strategy)
+        self._nodes = [Node(url) for url in dict.fromkeys(urls)]
+        if not self._nodes:
+            raise ValueError("At least one node is required")
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self.health_interval = health_interval
+        self.discover_members = discover
+        self.transport = transport
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def nodes(self) -> List[Node]:
+        with self._lock:
+            return list(self._nodes)
+
+    @property
+    def healthy_nodes(self) -> List[Node]:
+        with self._lock:
+            return [node for node in self._nodes if node.healthy]
+
+    def pick(self, exclude: Iterable[Node] = ()) -> Optional[Node]:
+        """Node for the next request, None if every node was excluded
+        Args:
+            exclude: nodes already tried for this request
+        Returns:
+            A healthy node if any, else the node down for the longest time
+        """
+        excluded = set(map(id, exclude))
+        now = time.monotonic()
+        with self._lock:
+            allowed = [node for node in self._nodes if id(node) not in excluded]
+            if not allowed:
+                return None
+            candidates = [
+                node
+                for node in allowed
+                if node.healthy
+                or (self._thread is None and now - node.down_since >= self.retry_after)
+            ]
+            if not candidates:
+                return min(allowed, key=lambda node: node.down_since)
+            if self.strategy == LEAST_LATENCY:
+                return min(candidates, key=lambda node: node.latency)
+            return candidates[next(self._counter) % len(candidates)]
+
+    def success(self, node: Node, elapsed: float) -> None:
+        """Record a completed request"""
+        with self._lock:
+            if node.latency == 0.0:
+                node.latency = elapsed
+            else:
+                node.latency += self.smoothing * (elapsed - node.latency)
+            if not node.healthy:
+                logger.info("Infinispan node %s is back", node.url)
+            node.healthy = True
+            node.failures = 0
+
+    def failure(self, node: Node) -> None:
+        """Record a request that could not reach the node"""
+        with self._lock:
+            node.failures += 1
+            node.down_since = time.monotonic()
+            if node.healthy:
+                logger.warning("Infinispan node %s is down", node.url)
+            node.healthy = False
+
+    def check(self, node: Node) -> bool:
+        """Probe the health endpoint of a node and record the outcome"""
+        start = time.perf_counter()
+        try:
+            response = self.transport.request(
+                "GET", node.url + HEALTH_URL, timeout=self.timeout
+            )
+        except Exception:  # noqa: BLE001
+            self.failure(node)
+            return False
+        if not response.ok:
+            self.failure(node)
+            return False
+        self.success(node, time.perf_counter() - start)
+        return True
+
+    def check_all(self) -> None:
+        """Probe every node"""
+        for node in self.nodes:
+            self.check(node)
+
+    def discover(self) -> List[str]:
+        """Add the cluster members reported by a healthy node
+        Returns:
+            The urls of the nodes added
+        """
+        seed = self.pick()
+        if seed is None:
+            return []
+        try:
+            response = self.transport.request(
+                "GET", seed.url + CLUSTER_URL, timeout=self.timeout
+            )
+            members = json.loads(response.content).get(
+                "cluster_members_physical_addresses", []
+            )
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Unable to discover the cluster members: %s", e)
+            return []
+        scheme, _, address = self._nodes[0].url.partition("://")
+        port = address.rpartition(":")[2]
+        added = []
+        with self._lock:
+            known = {node.url for node in self._nodes}
+            for member in members:
+                host = member.rpartition(":")[0] or member
+                url = scheme + "://" + host + ":" + port
+                if url not in known:
+                    self._nodes.append(Node(url))
+                    known.add(url)
+                    added.append(url)
+        if added:
+            logger.info("Discovered Infinispan nodes %s", added)
+        return added
+
+    def start(self) -> None:
+        """Start the background health checks, if an interval is set"""
+        if self.health_interval is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="infinispan-health", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background health checks"""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            if self.discover_members:
+                self.discover()
+            self.check_all()
+
+
+_shared_routers: Dict[Tuple, List[Any]] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_router(
+        urls: Iterable[str], transport: Any = None, **options: Any
+) -> NodeRouter:
+    """Return the router shared by all the clients of a cluster with the
+    same routing options. It is created, discovers the members and starts
+    its health checks on first use; each call must be paired with a
+    `release_router`.
+    Args:
+        urls: the cluster nodes
+        transport: transport of the health checks and discovery
+        options: the other `NodeRouter` arguments
+    Returns:
+        The started NodeRouter
+    """
+    key = (tuple(urls), id(transport), tuple(sorted(options.items())))
+    with _shared_lock:
+        entry = _shared_routers.get(key)
+        if entry is None:
+            router = NodeRouter(urls, transport=transport, **options)
+            if router.discover_members:
+                router.discover()
+            # the transport is kept alive, so that its id stays unique
+            entry = _shared_routers[key] = [router, transport, 0]
+        entry[2] += 1
+        entry[0].start()
+        return entry[0]
+
+
+def release_router(router: NodeRouter) -> None:
+    """Release a router returned by `shared_router`, its health checks are
+    stopped once no client uses it"""
+    with _shared_lock:
+        for key, entry in list(_shared_routers.items()):
+            if entry[0] is router:
+                entry[2] -= 1
+                if entry[2] > 0:
+                    return
+                del _shared_routers[key]
+                break
+    router.stop()
+
+
+class HedgePolicy:
+    """Adaptive delay after which a read-only query is sent again.
+
+    The delay is the `percentile` of the latencies of the last `window`
+    queries, clamped to [min_delay, max_delay]; until `min_samples`
+    latencies are known `initial_delay` is used. Counters report how often
+    hedges fire, how often the hedge answers first and how often a query
+    was not hedged because no worker was free.
+    """
+
+    def __init__(
+            self,
+            percentile: float = 95.0,
+            window: int = 512,
+            min_samples: int = 20,
+            initial_delay: float = 0.05,
+            min_delay: float = 0.002,
+            max_delay: float = 1.0,
+    ):
+        if not 0 < percentile < 100:
+            raise ValueError("percentile must be between 0 and 100")
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.queries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped_hedges = 0
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._recorded = 0
+        self._delay = initial_delay
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for an answer before hedging"""
+        return self._delay
+
+    def record(self, latency: float) -> None:
+        """Record the latency of a single query request"""
+        with self._lock:
+            self._samples.append(latency)
+            self._recorded += 1
+            # the threshold is recomputed every few samples, not per query
+            if len(self._samples) >= self.min_samples and self._recorded % 8 == 0:
+                ordered = sorted(self._samples)
+                rank = int(len(ordered) * self.percentile / 100.0)
+                rank = min(rank, len(ordered) - 1)
+                self._delay = min(self.max_delay, max(self.min_delay, ordered[rank]))
+
+    def started(self, hedged: bool = False) -> None:
+        with self._lock:
+            if hedged:
+                self.hedged += 1
+            else:
+                self.queries += 1
+
+    def won(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def skipped(self) -> None:
+        with self._lock:
+            self.skipped_hedges += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the hedging counters and the current delay"""
+        return {
+            "queries": self.queries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "skipped_hedges": self.skipped_hedges,
+            "hedge_rate": self.hedged / self.queries if self.queries else 0.0,
+            "win_rate": self.hedge_wins / self.hedged if self.hedged else 0.0,
+            "delay": self._delay,
+        }
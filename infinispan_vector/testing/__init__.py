@@ -0,0 +1,4 @@
+"""In-process stand-ins for an Infinispan server, used by the unit tests and
+the benchmarks to run without a real cluster."""
+from infinispan_vector.testing.hotrod_stub import HotRodStubCluster
+from infinispan_vector.testing.standin import StandinServer
@@ -0,0 +1,158 @@
+"""In-process stub of an Infinispan cluster speaking Hot Rod.
+
+Each node keeps entries in memory and answers put, get, remove and query
+requests. The nodes of a cluster share their entries, like a real cluster
+forwarding operations to the owners, and a topology where segment `s` is
+owned by node `s % nodes`. The topology is sent to clients with an outdated
+topology id, and each node records the keys it received, so the routing of
+a client can be checked.
+"""
+from __future__ import annotations
+
+import json
+import socketserver
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from infinispan_vector.hotrod import (
+    ERROR,
+    GET,
+    PUT,
+    QUERY,
+    REMOVE,
+    REQUEST_MAGIC,
+    RESPONSE_MAGIC,
+    STATUS_KEY_NOT_FOUND,
+    STATUS_OK,
+    Reader,
+    Topology,
+    encode_bytes,
+    encode_string,
+    encode_vint,
+)
+
+
+class HotRodStubHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        reader = Reader(self.rfile)
+        while True:
+            try:
+                magic = reader.byte()
+            except ConnectionError:
+                return
+            if magic != REQUEST_MAGIC:
+                return
+            message_id = reader.vlong()
+            reader.byte()  # version
+            opcode = reader.byte()
+            cache = reader.string()
+            reader.vint()  # flags
+            reader.byte()  # intelligence
+            client_topology = reader.vint()
+            reader.media_type()
+            reader.media_type()
+            status, body = self.server.execute(opcode, cache, reader)
+            topology = self.server.topology
+            header = bytes([RESPONSE_MAGIC]) + encode_vint(message_id)
+            if status >= 0x80:
+                header += bytes([ERROR, status])
+            else:
+                header += bytes([opcode + 1, status])
+            if topology is not None and client_topology != topology.topology_id:
+                header += b"\x01" + topology.encode()
+            else:
+                header += b"\x00"
+            self.wfile.write(header + body)
+            self.wfile.flush()
+
+
+class HotRodStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+            self,
+            address: Tuple[str, int] = ("127.0.0.1", 0),
+            store: Optional[Dict[str, Dict[bytes, bytes]]] = None,
+    ):
+        super().__init__(address, HotRodStubHandler)
+        self.store: Dict[str, Dict[bytes, bytes]] = {} if store is None else store
+        self.received: List[bytes] = []
+        self.topology: Optional[Topology] = None
+        self.requests = 0
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return "%s:%d" % self.server_address[:2]
+
+    def execute(self, opcode: int, cache: str, reader: Reader) -> Tuple[int, bytes]:
+        self.requests += 1
+        entries = self.store.setdefault(cache, {})
+        if opcode in (PUT, GET, REMOVE):
+            key = reader.bytes()
+            self.received.append(key)
+        if opcode == PUT:
+            reader.byte()  # expiration
+            entries[key] = reader.bytes()
+            return STATUS_OK, b""
+        if opcode == GET:
+            value = entries.get(key)
+            if value is None:
+                return STATUS_KEY_NOT_FOUND, b""
+            return STATUS_OK, encode_bytes(value)
+        if opcode == REMOVE:
+            found = entries.pop(key, None) is not None
+            return (STATUS_OK if found else STATUS_KEY_NOT_FOUND), b""
+        if opcode == QUERY:
+            reader.bytes()
+            return STATUS_OK, encode_bytes(
+                json.dumps({"hit_count": 0, "hits": []}).encode()
+            )
+        return 0x84, encode_string("Unknown operation: " + hex(opcode))
+
+    def start(self) -> "HotRodStub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "HotRodStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class HotRodStubCluster:
+    """Several stub nodes sharing one consistent hash"""
+
+    def __init__(self, nodes: int = 3, num_segments: int = 16):
+        self.store: Dict[str, Dict[bytes, bytes]] = {}
+        self.nodes: List[HotRodStub] = [
+            HotRodStub(store=self.store) for _ in range(nodes)
+        ]
+        topology = Topology(
+            1,
+            [node.server_address[:2] for node in self.nodes],
+            [[s % nodes] for s in range(num_segments)],
+        )
+        for node in self.nodes:
+            node.topology = topology
+
+    @property
+    def hosts(self) -> List[str]:
+        return [node.host for node in self.nodes]
+
+    def __enter__(self) -> "HotRodStubCluster":
+        for node in self.nodes:
+            node.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for node in self.nodes:
+            node.stop()
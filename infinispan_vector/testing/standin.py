@@ -0,0 +1,335 @@
+"""In-process stand-in for the Infinispan REST endpoints used by the client.
+
+It keeps entries in memory and answers over HTTP/1.1 keep-alive, so it can
+be used to measure the client side cost of the transport and to run the
+unit tests and the benchmarks without a real server.
+
+Besides entries, it handles caches, schemas, health and cluster info, and
+the Ickle queries sent by `InfinispanVS`: kNN queries are answered by a
+brute-force search over the stored JSON entries, scored like the server
+does for the similarity declared in the schema (L2 by default). Filtering
+clauses and protostream entries are not supported.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from infinispan_vector.utils import _import_numpy, similarity_scores, top_k
+
+_QUERY = re.compile(
+    r"^\s*(?:select\s+(?P<projection>.+?)\s+)?from\s+(?P<entity>[\w.]+)(?:\s+v)?"
+    r"(?:\s+where\s+v\.(?P<field>\w+)\s*<->\s*\[(?P<vector>[^\]]*)\]\s*~\s*(?P<k>\d+))?"
+    r"(?P<filtering>\s+filtering\s+.*)?\s*$",
+    re.DOTALL,
+)
+_VECTOR_ANNOTATION = re.compile(
+    r"message\s+(\w+)\s*\{.*?@Vector\(([^)]*)\)", re.DOTALL
+)
+_SIMILARITY = re.compile(r"similarity\s*=\s*(\w+)")
+
+
+class _Index:
+    """Decoded entities and vectors of a cache, rebuilt after writes"""
+
+    def __init__(self, entries: Dict[str, bytes], entity: str, field: Optional[str]):
+        np = _import_numpy()
+        self.entities: List[dict] = []
+        vectors = []
+        for value in entries.values():
+            try:
+                entity_value = json.loads(value)
+            except (ValueError, UnicodeDecodeError):
+                continue  # protostream entries
+            if not isinstance(entity_value, dict):
+                continue
+            if entity_value.get("_type", entity) != entity:
+                continue
+            if field is not None:
+                vector = entity_value.get(field)
+                if vector is None:
+                    continue
+                if isinstance(vector, str):  # int8 quantized, base64
+                    vector = np.frombuffer(base64.b64decode(vector), dtype=np.int8)
+                vectors.append(np.asarray(vector, dtype=np.float32))
+            self.entities.append(entity_value)
+        self.vectors = np.stack(vectors) if vectors else np.zeros((0, 0), np.float32)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _entry(self) -> Tuple[str, str]:
+        parts = urlsplit(self.path).path.split("/")
+        # /rest/v2/caches/<cache>/<key>
+        cache = parts[4] if len(parts) > 4 else ""
+        key = unquote(parts[5]) if len(parts) > 5 else ""
+        return cache, key
+
+    def _schema_name(self) -> Optional[str]:
+        path = urlsplit(self.path).path
+        if path.startswith("/rest/v2/schemas/"):
+            return unquote(path[len("/rest/v2/schemas/"):])
+        return None
+
+    def _put_schema(self, schema: str, body: bytes) -> None:
+        self.server.schemas[schema] = body.decode("utf-8")
+        self._reply(200, json.dumps({"name": schema, "error": None}).encode())
+
+    def do_PUT(self):
+        schema = self._schema_name()
+        if schema is not None:
+            self._put_schema(schema, self._body())
+            return
+        cache, key = self._entry()
+        if urlsplit(self.path).path.count("/") > 5:
+            self._body()
+            self._reply(404)
+            return
+        self.server.write(cache, key, self._body())
+        self._reply(204)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.endswith("/health/status"):
+            self._reply(200, b"HEALTHY")
+            return
+        if path == "/rest/v2/cache-managers/default":
+            members = {"cluster_members_physical_addresses": self.server.members}
+            self._reply(200, json.dumps(members).encode())
+            return
+        schema = self._schema_name()
+        if schema is not None:
+            proto = self.server.schemas.get(schema)
+            if proto is None:
+                self._reply(404)
+            else:
+                self._reply(200, proto.encode())
+            return
+        cache, key = self._entry()
+        params = parse_qs(urlsplit(self.path).query)
+        if params.get("action") == ["keys"]:
+            keys = list(self.server.store.get(cache, {}))
+            self._reply(200, json.dumps(keys).encode())
+            return
+        if params.get("action") == ["search"]:
+            self._search(
+                cache,
+                params.get("query", [""])[0],
+                int(params.get("offset", [0])[0]),
+                _int_or_none(params.get("max_results", [None])[0]),
+            )
+            return
+        value = self.server.store.get(cache, {}).get(key)
+        if value is None:
+            self._reply(404)
+        else:
+            self._reply(200, value)
+
+    def do_HEAD(self):
+        cache, key = self._entry()
+        entries = self.server.store.get(cache)
+        if entries is None or (key and key not in entries):
+            self._reply(404)
+        else:
+            self._reply(200)
+
+    def do_DELETE(self):
+        schema = self._schema_name()
+        if schema is not None:
+            self.server.schemas.pop(schema, None)
+            self._reply(204)
+            return
+        cache, key = self._entry()
+        if key:
+            self.server.delete(cache, key)
+        else:
+            self.server.drop(cache)
+        self._reply(204)
+
+    def do_POST(self):
+        body = self._body()
+        schema = self._schema_name()
+        if schema is not None:
+            if schema in self.server.schemas:
+                self._error(409, "Schema " + schema + " already exists")
+                return
+            self._put_schema(schema, body)
+            return
+        cache, key = self._entry()
+        params = parse_qs(urlsplit(self.path).query)
+        action = params.get("action", [""])[0]
+        if action == "search":
+            request = json.loads(body) if body else {}
+            self._search(
+                cache,
+                request.get("query", ""),
+                int(request.get("offset", 0)),
+                _int_or_none(request.get("max_results")),
+            )
+        elif action == "clear" and not key:
+            self.server.drop(cache, keep=True)
+            self._reply(204)
+        else:
+            if not key:
+                self.server.store.setdefault(cache, {})
+            self._reply(204)
+
+    def _search(
+            self, cache: str, query: str, offset: int, max_results: Optional[int]
+    ) -> None:
+        if self.server.search_delay:
+            time.sleep(self.server.search_delay)
+        match = _QUERY.match(query)
+        if match is None:
+            self._error(400, "Unsupported query: " + query)
+            return
+        if match.group("filtering"):
+            self._error(400, "filtering is not supported by the stand-in")
+            return
+        entity, field = match.group("entity"), match.group("field")
+        index = self.server.index(cache, entity, field)
+        rows: List[Tuple[dict, Optional[float]]]
+        if field is None:
+            rows = [(value, None) for value in index.entities]
+        else:
+            query_vector = [float(x) for x in match.group("vector").split(",") if x]
+            k = int(match.group("k"))
+            if len(index.entities) and index.vectors.shape[1] != len(query_vector):
+                self._error(400, "Vector dimension mismatch")
+                return
+            scores = similarity_scores(
+                query_vector, index.vectors, self.server.similarity(entity)
+            )
+            rows = [(index.entities[i], float(scores[i])) for i in top_k(scores, k)]
+        total = len(rows)
+        end = None if max_results is None else offset + max_results
+        hits = [
+            {"hit": _project(value, match.group("projection"), score)}
+            for value, score in rows[offset:end]
+        ]
+        self._reply(200, json.dumps({"hit_count": total, "hits": hits}).encode())
+
+    def _error(self, status: int, message: str) -> None:
+        self._reply(status, json.dumps({"error": {"message": message}}).encode())
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def _project(entity: dict, projection: Optional[str], score: Optional[float]) -> dict:
+    if projection is None:
+        return entity
+    hit: Dict[str, Any] = {}
+    for item in projection.split(","):
+        item = item.strip()
+        if item == "v":
+            hit["*"] = entity
+        elif item == "score(v)":
+            hit["score()"] = score
+        elif item.startswith("v."):
+            hit[item[2:]] = entity.get(item[2:])
+    return hit
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0)):
+        super().__init__(address, StandinHandler)
+        self.store: Dict[str, Dict[str, bytes]] = {}
+        self.schemas: Dict[str, str] = {}
+        self.members: List[str] = []
+        self.search_delay = 0.0
+        self._indexes: Dict[Tuple[str, str, Optional[str]], _Index] = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return "%s:%d" % self.server_address[:2]
+
+    def write(self, cache: str, key: str, value: bytes) -> None:
+        with self._lock:
+            self.store.setdefault(cache, {})[key] = value
+            self._invalidate(cache)
+
+    def delete(self, cache: str, key: str) -> None:
+        with self._lock:
+            self.store.get(cache, {}).pop(key, None)
+            self._invalidate(cache)
+
+    def drop(self, cache: str, keep: bool = False) -> None:
+        """Delete a cache, or only its entries with keep"""
+        with self._lock:
+            if keep:
+                self.store.get(cache, {}).clear()
+            else:
+                self.store.pop(cache, None)
+            self._invalidate(cache)
+
+    def _invalidate(self, cache: str) -> None:
+        for key in [key for key in self._indexes if key[0] == cache]:
+            del self._indexes[key]
+
+    def index(self, cache: str, entity: str, field: Optional[str]) -> _Index:
+        """Decoded entries of a cache, cached until the next write"""
+        with self._lock:
+            key = (cache, entity, field)
+            index = self._indexes.get(key)
+            if index is None:
+                index = _Index(dict(self.store.get(cache, {})), entity, field)
+                self._indexes[key] = index
+            return index
+
+    def similarity(self, entity: str) -> str:
+        """Vector similarity declared for entity in the deployed schemas"""
+        for proto in list(self.schemas.values()):
+            for message, annotation in _VECTOR_ANNOTATION.findall(proto):
+                if message == entity:
+                    found = _SIMILARITY.search(annotation)
+                    return found.group(1) if found else "L2"
+        return "L2"
+
+    def handle_error(self, request, client_address) -> None:
+        # clients drop the requests they no longer wait for, e.g. hedged ones
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self) -> "StandinServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,94 @@
+"""Module providing the HTTP transport used by the Infinispan REST helper"""
+
+from __future__ import annotations
+
+import threading
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    Tuple,
+)
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REST_TIMEOUT = 10
+POOL_SIZE = 10
+
+
+class RestTransport:
+    """Pooled, keep-alive HTTP transport for the `Infinispan` REST interface.
+
+    Wraps a `requests.Session` whose adapter keeps up to `pool_size`
+    persistent connections per node, so consecutive operations reuse the
+    same TCP connection instead of opening a new one for every call.
+
+    Any object exposing the same `request` method can be passed to
+    `Infinispan` via the `transport` configuration entry.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, pool_block: bool = False):
+        self._pool_size = pool_size
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, pool_block=pool_block
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def request(
+            self, method: str, url: str, timeout: float = REST_TIMEOUT, **kwargs: Any
+    ) -> requests.Response:
+        """Send a request over a pooled connection
+        Args:
+            method(str): http method
+            url(str): full url of the resource
+            timeout(float): timeout in seconds for this operation
+        Returns:
+            An http Response
+        """
+        return self._session.request(method, url, timeout=timeout, **kwargs)
+
+    def close(self) -> None:
+        """Close all the pooled connections"""
+        self._session.close()
+
+
+_shared_transports: Dict[Tuple, RestTransport] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_transport(
+        schema: str, hosts: Tuple[str, ...], pool_size: int = POOL_SIZE
+) -> RestTransport:
+    """Return the transport shared by all the clients of a cluster
+    Args:
+        schema(str): http or https
+        hosts(tuple): the cluster nodes as host:port
+        pool_size(int): max number of pooled connections per node
+    Returns:
+        The RestTransport for the cluster, created on first use
+    """
+    key = (schema, tuple(hosts), pool_size)
+    with _shared_lock:
+        transport = _shared_transports.get(key)
+        if transport is None:
+            transport = RestTransport(pool_size=pool_size)
+            _shared_transports[key] = transport
+        return transport
+
+
+def close_shared_transports(schema: Optional[str] = None) -> None:
+    """Close and forget the shared transports
+    Args:
+        schema(str): if given only transports for this schema are closed
+    """
+    with _shared_lock:
+        for key in list(_shared_transports):
+            if schema is None or key[0] == schema:
+                _shared_transports.pop(key).close()
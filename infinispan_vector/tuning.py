@@ -0,0 +1,193 @@
+"""Module sweeping the vector index settings for recall and latency
+
+`tune_index` builds an index for each candidate HNSW setting
+(maxConnections, beamWidth) on a sample of vectors, measures recall@k
+against an exact search and the query latency, optionally with rescoring
+oversample factors as the per-query knob. `pareto_front` and `recommend`
+pick among the measured settings.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import (
+    Any,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from langchain_core.embeddings import Embeddings
+
+from infinispan_vector.infinispanvs import InfinispanVS
+from infinispan_vector.utils import _import_numpy, similarity_scores, top_k
+
+
+class TuningResult(NamedTuple):
+    max_connections: int
+    beam_width: int
+    oversample: float
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    build_seconds: float
+
+
+class _SampleEmbeddings(Embeddings):
+    """Embeds the row index of the sample, as text, to its vector"""
+
+    def __init__(self, vectors: Any):
+        self._vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vectors[int(text)].tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vectors[int(text)].tolist()
+
+
+def tune_index(
+        vectors: Any,
+        queries: Optional[Any] = None,
+        k: int = 10,
+        max_connections: Iterable[int] = (8, 16, 32),
+        beam_widths: Iterable[int] = (100, 256, 512),
+        oversample_factors: Iterable[float] = (1,),
+        num_queries: int = 100,
+        **kwargs: Any,
+) -> List[TuningResult]:
+    """Measure recall and latency of candidate index settings.
+
+    Each candidate is deployed as a fresh schema and cache, named by the
+    cache_name and entity_name configuration entries (both default to
+    "vector_tuning"), which are deleted afterwards, and its client is
+    closed.
+
+    Args:
+        vectors: sample of the data, one vector per row
+        queries: query vectors. Defaults to the last `num_queries` rows of
+            vectors, which are then left out of the index
+        k(int): number of results per query
+        max_connections: candidate HNSW maxConnections
+        beam_widths: candidate HNSW beamWidth
+        oversample_factors: rescoring factors measured for each index,
+            1 is the plain kNN search
+        num_queries(int): number of held out queries when queries is None
+        kwargs: `InfinispanVS` configuration, i.e. hosts and
+            vector_similarity
+    Returns:
+        One result per setting and oversample factor
+    """
+    np = _import_numpy()
+    sample = np.asarray(vectors, dtype=np.float32)
+    if queries is None:
+        if len(sample) <= num_queries:
+            raise ValueError("The sample must be larger than num_queries")
+        sample, queries = sample[:-num_queries], sample[-num_queries:]
+    queries = np.asarray(queries, dtype=np.float32)
+    similarity = str(kwargs.get("vector_similarity", "L2"))
+    truth = [
+        {str(i) for i in top_k(similarity_scores(query, sample, similarity), k)}
+        for query in queries
+    ]
+    keys = [str(i) for i in range(len(sample))]
+    config = {
+        "cache_name": "vector_tuning",
+        "entity_name": "vector_tuning",
+        **kwargs,
+        "keyfield": "_key",
+        "auto_projection": False,
+        "output_fields": None,
+    }
+    factors = list(oversample_factors)
+    results: List[TuningResult] = []
+    for connections in max_connections:
+        for beam_width in beam_widths:
+            store = InfinispanVS(
+                embedding=_SampleEmbeddings(sample),
+                **{
+                    **config,
+                    "vector_max_connections": connections,
+                    "vector_beam_width": beam_width,
+                },
+            )
+            try:
+                store.config_clear()
+                store.configure({}, sample.shape[1])
+                start = time.perf_counter()
+                store.add_texts(
+                    keys, [{"_key": key} for key in keys], ids=keys, return_ids=False
+                )
+                build_seconds = time.perf_counter() - start
+                for factor in factors:
+                    recall, latencies = _measure(store, queries, truth, k, factor)
+                    results.append(
+                        TuningResult(
+                            connections,
+                            beam_width,
+                            factor,
+                            recall,
+                            round(float(np.percentile(latencies, 50)) * 1000, 3),
+                            round(float(np.percentile(latencies, 95)) * 1000, 3),
+                            round(build_seconds, 3),
+                        )
+                    )
+            finally:
+                try:
+                    store.config_clear()
+                finally:
+                    store.close()
+    return results
+
+
+def _measure(
+        store: InfinispanVS, queries: Any, truth: List[set], k: int, oversample: float
+) -> Tuple[float, List[float]]:
+    found = 0
+    latencies = []
+    for query, expected in zip(queries, truth):
+        embedding = query.tolist()
+        start = time.perf_counter()
+        if oversample > 1:
+            hits = store._rescored_hits(embedding, k, oversample)
+            keys = [hit.id for hit, _ in hits]
+        else:
+            found_keys = store.similarity_search_ids_by_vector(embedding, k)
+            keys = [key for key, _ in found_keys]
+        latencies.append(time.perf_counter() - start)
+        found += len(expected.intersection(keys))
+    total = sum(len(expected) for expected in truth)
+    return (found / total if total else 0.0), latencies
+
+
+def pareto_front(results: Sequence[TuningResult]) -> List[TuningResult]:
+    """Results not dominated by another one with higher or equal recall and
+    lower or equal p95 latency, fastest first"""
+    front = [
+        result
+        for result in results
+        if not any(
+            other.recall >= result.recall
+            and other.p95_ms <= result.p95_ms
+            and (other.recall > result.recall or other.p95_ms < result.p95_ms)
+            for other in results
+        )
+    ]
+    return sorted(front, key=lambda result: (result.p95_ms, -result.recall))
+
+
+def recommend(
+        results: Sequence[TuningResult], min_recall: float = 0.95
+) -> Optional[TuningResult]:
+    """The fastest Pareto-optimal result reaching min_recall, the most
+    accurate one if none does, None if there are no results"""
+    front = pareto_front(results)
+    if not front:
+        return None
+    for result in front:
+        if result.recall >= min_recall:
+            return result
+    return max(front, key=lambda result: result.recall)
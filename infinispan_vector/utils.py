@@ -0,0 +1,108 @@
+"""Vector math helpers, vectorized with NumPy"""
+
+from __future__ import annotations
+
+from typing import Any, List
+
+
+def _import_numpy() -> Any:
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError(
+            "Could not import numpy python package. "
+            "Please install it with `pip install numpy`."
+        )
+    return np
+
+
+def _normalize(vectors: Any) -> Any:
+    np = _import_numpy()
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def maximal_marginal_relevance(
+        query_embedding: Any,
+        embeddings: Any,
+        k: int = 4,
+        lambda_mult: float = 0.5,
+) -> List[int]:
+    """Select the indexes of k embeddings by maximal marginal relevance.
+
+    Cosine similarities between the query and the candidates and among
+    the candidates are computed once as matrix products; each selection
+    step is then a handful of array operations over all candidates.
+
+    Args:
+        query_embedding: the query vector.
+        embeddings: candidate vectors, one per row.
+        k: number of candidates to select.
+        lambda_mult: 1 for pure relevance, 0 for maximum diversity.
+
+    Returns:
+        Indexes of the selected candidates, in selection order.
+    """
+    np = _import_numpy()
+    candidates = np.asarray(embeddings, dtype=np.float32)
+    if candidates.size == 0 or k <= 0:
+        return []
+    candidates = _normalize(candidates)
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    k = min(k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    for _ in range(1, k):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        idx = int(np.argmax(scores))
+        selected.append(idx)
+        np.maximum(max_similarity, similarity[idx], out=max_similarity)
+    return selected
+
+
+def similarity_scores(
+        query_embedding: Any, embeddings: Any, similarity: str = "L2"
+) -> Any:
+    """Exact scores of embeddings against a query, on the same scale as
+    the server's `score()` for the given vector similarity.
+
+    Args:
+        query_embedding: the query vector.
+        embeddings: vectors to score, one per row.
+        similarity: one of L2, COSINE, INNER_PRODUCT, MAX_INNER_PRODUCT.
+
+    Returns:
+        A NumPy array with one score per row, higher is more similar.
+    """
+    np = _import_numpy()
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if vectors.size == 0:
+        return np.zeros(0, dtype=np.float32)
+    similarity = similarity.upper()
+    if similarity == "L2":
+        diff = vectors - query
+        return 1.0 / (1.0 + np.einsum("ij,ij->i", diff, diff))
+    if similarity == "COSINE":
+        return (1.0 + _normalize(vectors) @ _normalize(query)) / 2.0
+    dot = vectors @ query
+    if similarity == "INNER_PRODUCT":
+        return (1.0 + dot) / 2.0
+    if similarity == "MAX_INNER_PRODUCT":
+        return np.where(dot < 0, 1.0 / (1.0 - dot), dot + 1.0)
+    raise ValueError("Unknown vector similarity: " + similarity)
+
+
+def top_k(scores: Any, k: int) -> List[int]:
+    """Indexes of the k highest scores, best first"""
+    np = _import_numpy()
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")].tolist()
@@ -0,0 +1,36 @@
+"""Embedding class recording its calls, for testing purposes."""
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from tests.integration_tests.vectorstores.fake_embeddings import FakeEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Wraps embeddings, FakeEmbeddings by default, and records the texts
+    they embed: `batches` holds the texts of each embed_documents call and
+    `queries` the texts of each embed_query call."""
+
+    def __init__(self, embeddings: Optional[Embeddings] = None) -> None:
+        self.embeddings = embeddings or FakeEmbeddings()
+        self.batches: List[List[str]] = []
+        self.queries: List[str] = []
+
+    @property
+    def embedded(self) -> List[str]:
+        """Texts passed to embed_documents, in order"""
+        return [text for batch in self.batches for text in batch]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(list(texts))
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.queries.append(text)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed_query(text)
@@ -1,4 +1,5 @@
 """Test Infinispan functionality."""
+import asyncio
 from typing import Any, List, Optional
 
 import pytest
@@ -144,3 +145,103 @@ class TestBasic:
                 raise
         output = docsearch.similarity_search("foo", k=10)
         assert len(output) == 6
+
+    def test_infinispan_async_search(self, autoconfig) -> None:
+        """Test async search over the aiohttp client."""
+        if not autoconfig:
+            _infinispan_setup_noautoconf()
+        docsearch = _infinispanvs_from_texts(auto_config=autoconfig)
+
+        async def search() -> List[Document]:
+            try:
+                return await docsearch.asimilarity_search("foo", k=1)
+            finally:
+                await docsearch.aispn.close()
+
+        output = asyncio.run(search())
+        assert output == [Document(page_content="foo")]
+
+    def test_infinispan_search_batch(self, autoconfig) -> None:
+        """Test batched search returns results in input order."""
+        if not autoconfig:
+            _infinispan_setup_noautoconf()
+        docsearch = _infinispanvs_from_texts(auto_config=autoconfig)
+        output = docsearch.similarity_search_batch(["foo", "bar", "baz"], k=1)
+        assert output == [[Document(page_content=t)] for t in fake_texts]
+
+    def test_infinispan_search_ids(self, autoconfig) -> None:
+        """Test ids and scores only search."""
+        if not autoconfig:
+            return
+        ids = ["id_" + str(i) for i in range(len(fake_texts))]
+        docsearch = _infinispanvs_from_texts(
+            ids=ids, auto_config=autoconfig, keyfield="_key"
+        )
+        output = docsearch.similarity_search_ids_by_vector(
+            FakeEmbeddings().embed_query("foo"), k=2
+        )
+        assert [key for key, _ in output] == ["id_0", "id_1"]
+
+    def test_infinispan_get_by_ids(self, autoconfig) -> None:
+        """Test fetching documents by key through the near cache."""
+        if not autoconfig:
+            _infinispan_setup_noautoconf()
+        ids = ["id_" + str(i) for i in range(len(fake_texts))]
+        docsearch = _infinispanvs_from_texts(
+            ids=ids, auto_config=autoconfig, near_cache_size=10
+        )
+        output = docsearch.get_by_ids(["id_2", "id_0", "missing"])
+        assert output == [Document(page_content="baz"), Document(page_content="foo")]
+        assert docsearch.get_by_ids(["id_2"]) == [Document(page_content="baz")]
+        assert docsearch.near_cache.stats()["hits"] == 1
+
+    def test_infinispan_quantized(self, autoconfig) -> None:
+        """Test search on int8 quantized vectors, with rescoring."""
+        if not autoconfig:
+            return
+        docsearch = _infinispanvs_from_texts(
+            auto_config=autoconfig, vector_quantization="int8"
+        )
+        output = docsearch.similarity_search_with_score("foo", k=1, oversample=3)
+        assert [doc for doc, _ in output] == [Document(page_content="foo")]
+        assert output[0][1] == 1.0
+
+    def test_infinispan_mmr(self, autoconfig) -> None:
+        """Test maximal marginal relevance search."""
+        if not autoconfig:
+            _infinispan_setup_noautoconf()
+        docsearch = _infinispanvs_from_texts(auto_config=autoconfig)
+        output = docsearch.max_marginal_relevance_search("foo", k=2, fetch_k=3)
+        assert len(output) == 2
+        assert output[0] == Document(page_content="foo")
+
+    def test_infinispan_rescore(self, autoconfig) -> None:
+        """Test oversampled search with exact rescoring and recall measure."""
+        if not autoconfig:
+            _infinispan_setup_noautoconf()
+        docsearch = _infinispanvs_from_texts(auto_config=autoconfig)
+        output = docsearch.similarity_search_with_score("foo", k=2, oversample=2)
+        assert [doc for doc, _ in output] == [
+            Document(page_content="foo"),
+            Document(page_content="bar"),
+        ]
+        assert output[0][1] == 1.0
+        recall = docsearch.measure_recall([FakeEmbeddings().embed_query("foo")], k=2)
+        assert recall[1] == 1.0
+
+    def test_infinispan_with_filter(self, autoconfig) -> None:
+        """Test metadata filter pushdown."""
+        if not autoconfig:
+            return
+        metadatas = [{"page": i, "label": "label" + str(i)} for i in range(len(fake_texts))]
+        docsearch = _infinispanvs_from_texts(
+            metadatas=metadatas,
+            auto_config=autoconfig,
+            filterable_fields=["page", "label"],
+        )
+        output = docsearch.similarity_search("foo", k=3, filter={"page": {"$gte": 1}})
+        assert [doc.page_content for doc in output] == ["bar", "baz"]
+        output = docsearch.similarity_search(
+            "foo", k=3, filter={"$or": [{"label": "label2"}, {"page": 0}]}
+        )
+        assert [doc.page_content for doc in output] == ["foo", "baz"]
@@ -0,0 +1,26 @@
+"""Test the client side LRU cache."""
+import time
+
+from infinispan_vector.cache import LRUCache
+
+
+def test_lru_eviction() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiration() -> None:
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
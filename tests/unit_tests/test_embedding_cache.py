@@ -0,0 +1,73 @@
+"""Test the persistent memory-mapped embedding cache."""
+import multiprocessing
+import os
+
+from infinispan_vector import MMapEmbeddingCache
+from tests.integration_tests.vectorstores.counting_embeddings import (
+    CountingEmbeddings,
+)
+from tests.integration_tests.vectorstores.fake_embeddings import (
+    ConsistentFakeEmbeddings,
+)
+
+
+def _embed_in_child(path: str, queue) -> None:
+    model = CountingEmbeddings(ConsistentFakeEmbeddings())
+    cache = MMapEmbeddingCache(model, path, model_id="fake")
+    cache.embed_documents(["a", "b", "c"])
+    queue.put(model.embedded)
+
+
+def test_only_misses_reach_the_model(tmp_path) -> None:
+    model = CountingEmbeddings(ConsistentFakeEmbeddings())
+    cache = MMapEmbeddingCache(model, str(tmp_path / "emb.bin"), model_id="fake")
+    first = cache.embed_documents(["a", "b"])
+    again = cache.embed_documents(["b", "a", "c"])
+    assert model.embedded == ["a", "b", "c"]
+    assert again[:2] == [first[1], first[0]]
+    assert cache.stats()["hits"] == 2
+
+
+def test_shared_across_processes(tmp_path) -> None:
+    path = str(tmp_path / "emb.bin")
+    MMapEmbeddingCache(CountingEmbeddings(ConsistentFakeEmbeddings()), path, model_id="fake").embed_documents(
+        ["a", "b"]
+    )
+    queue = multiprocessing.get_context("spawn").SimpleQueue()
+    child = multiprocessing.get_context("spawn").Process(
+        target=_embed_in_child, args=(path, queue)
+    )
+    child.start()
+    child.join()
+    assert queue.get() == ["c"]
+
+
+def test_compaction_keeps_recent_entries(tmp_path) -> None:
+    model = CountingEmbeddings(ConsistentFakeEmbeddings())
+    cache = MMapEmbeddingCache(
+        model, str(tmp_path / "emb.bin"), model_id="fake", max_entries=8
+    )
+    cache.embed_documents([str(i) for i in range(9)])
+    assert len(cache) == 6
+    model.batches.clear()
+    cache.embed_documents(["8", "0"])
+    assert model.embedded == ["0"]
+
+
+def test_index_file(tmp_path) -> None:
+    path = str(tmp_path / "emb.bin")
+    texts = [str(i) for i in range(3000)]
+    first = MMapEmbeddingCache(CountingEmbeddings(ConsistentFakeEmbeddings()), path, model_id="fake")
+    vectors = first.embed_documents(texts)
+    assert os.path.getsize(path + ".idx") > 3000 * 20 * 2
+    model = CountingEmbeddings(ConsistentFakeEmbeddings())
+    reopened = MMapEmbeddingCache(model, path, model_id="fake")
+    assert reopened.embed_documents(texts[::-1]) == vectors[::-1]
+    assert model.embedded == []
+    # files written without an index are indexed on the first miss
+    os.remove(path + ".idx")
+    model = CountingEmbeddings(ConsistentFakeEmbeddings())
+    assert MMapEmbeddingCache(model, path, model_id="fake").embed_documents(
+        ["7", "new"]
+    )[0] == vectors[7]
+    assert model.embedded == ["new"]
@@ -0,0 +1,22 @@
+"""Test the metadata filter compiler."""
+import pytest
+
+from infinispan_vector.filters import compile_filter
+
+
+def test_compile_filter() -> None:
+    assert compile_filter({"label": "a", "page": {"$gte": 1, "$lt": 3}}) == (
+        "(v.label = 'a' and v.page >= 1 and v.page < 3)"
+    )
+    assert compile_filter(
+        {"$or": [{"title": {"$in": ["x", "it's"]}}, {"flag": True}]}
+    ) == "(((v.title in ('x', 'it''s')) or (v.flag = true)))"
+
+
+@pytest.mark.parametrize(
+    "bad",
+    [{}, {"a b": 1}, {"page": {"$like": 1}}, {"page": {"$in": []}}, {"$or": []}],
+)
+def test_compile_filter_rejects_invalid(bad) -> None:
+    with pytest.raises(ValueError):
+        compile_filter(bad)
@@ -0,0 +1,57 @@
+"""Test the Hot Rod transport against the protocol stub."""
+import io
+import json
+
+from infinispan_vector import Infinispan, InfinispanVS
+from infinispan_vector.hotrod import Reader, encode_vint, segment_of
+from infinispan_vector.protostream import wrap_string
+from infinispan_vector.testing import HotRodStubCluster
+from tests.integration_tests.vectorstores.fake_embeddings import FakeEmbeddings
+
+
+def test_vint_roundtrip() -> None:
+    values = [0, 1, 127, 128, 300, 2 ** 31, 2 ** 62]
+    reader = Reader(io.BytesIO(b"".join(encode_vint(v) for v in values)))
+    assert [reader.vlong() for _ in values] == values
+
+
+def test_segments_spread_keys() -> None:
+    segments = [segment_of(wrap_string("key" + str(i)), 8) for i in range(400)]
+    assert set(segments) == set(range(8))
+
+
+def test_keys_are_routed_to_owners() -> None:
+    with HotRodStubCluster(nodes=3) as cluster:
+        ispn = Infinispan(hosts=cluster.hosts[:1], protocol="hotrod")
+        assert ispn.get("k0", "vector").status_code == 404
+        topology = ispn.hotrod.topologies["vector"]
+        for node in cluster.nodes:
+            node.received.clear()
+        for i in range(30):
+            assert ispn.put("k" + str(i), json.dumps({"n": i}), "vector").ok
+        for node in cluster.nodes:
+            assert node.received
+            for key in node.received:
+                assert topology.owner(key) == node.server_address[:2]
+        assert len(cluster.store["vector"]) == 30
+        assert ispn.get("k7", "vector").json() == {"n": 7}
+        assert ispn.delete("k7", "vector").ok
+        assert ispn.delete("k7", "vector").status_code == 404
+        assert ispn.req_query("from vector", "vector").json()["hits"] == []
+        # no REST operation was used
+        assert ispn._router is None and ispn._transport is None
+        ispn.hotrod.close()
+
+
+def test_vector_store_over_hotrod() -> None:
+    with HotRodStubCluster(nodes=2) as cluster:
+        ispnvs = InfinispanVS(
+            embedding=FakeEmbeddings(),
+            hosts=cluster.hosts,
+            protocol="hotrod",
+            auto_projection=False,
+        )
+        keys = ispnvs.add_texts(["a", "b", "c"], [{"text": t} for t in "abc"])
+        assert [doc.page_content for doc in ispnvs.get_by_ids(keys)] == ["a", "b", "c"]
+        assert ispnvs.similarity_search("a") == []
+        assert ispnvs.delete(keys)
@@ -0,0 +1,96 @@
+"""Test the instrumentation of the client operations."""
+from typing import Any, List, Optional, Tuple
+
+import pytest
+import requests
+
+from infinispan_vector import Infinispan, InfinispanVS, Metrics, MetricsHook
+from infinispan_vector.metrics import Histogram, stage
+from infinispan_vector.testing import StandinServer
+from tests.integration_tests.vectorstores.fake_embeddings import FakeEmbeddings
+
+
+class RecordingHook(MetricsHook):
+    def __init__(self) -> None:
+        self.finished: List[Tuple[str, Optional[BaseException]]] = []
+        self.transfers: List[Tuple[str, int, int]] = []
+
+    def stage_started(self, name: str) -> Any:
+        return name
+
+    def stage_finished(
+            self, name: str, token: Any, seconds: float, error: Optional[BaseException]
+    ) -> None:
+        assert token == name
+        self.finished.append((name, error))
+
+    def bytes_transferred(self, operation: str, sent: int, received: int) -> None:
+        self.transfers.append((operation, sent, received))
+
+
+def test_disabled_by_default() -> None:
+    ispn = Infinispan()
+    assert ispn.metrics is None
+    assert stage(None, "a") is stage(None, "b")
+
+
+def test_histogram_quantiles() -> None:
+    histogram = Histogram()
+    for value in (0.0001, 0.002, 0.003, 0.2):
+        histogram.observe(value)
+    assert histogram.count == 4
+    assert histogram.quantile(0.5) == 0.0025
+    assert histogram.quantile(1.0) == 0.25
+
+
+def test_search_stages() -> None:
+    hook = RecordingHook()
+    with StandinServer() as server:
+        ispnvs = InfinispanVS(
+            embedding=FakeEmbeddings(),
+            hosts=[server.host],
+            metrics_hooks=[hook],
+            auto_projection=False,
+        )
+        ispnvs.add_texts(["a", "b"], [{"text": "a"}, {"text": "b"}])
+        assert len(ispnvs.similarity_search("a")) == 2
+        assert ispnvs.ispn.get("missing", "vector").status_code == 404
+    snapshot = ispnvs.metrics.snapshot()
+    for name in (
+        "embed_documents",
+        "encode",
+        "http.put",
+        "similarity_search",
+        "embed_query",
+        "build_query",
+        "http.query",
+        "decode",
+        "to_docs",
+    ):
+        assert snapshot["stages"][name]["count"] >= 1, name
+    assert snapshot["stages"]["http.put"]["count"] == 2
+    assert snapshot["errors"] == {}
+    assert snapshot["bytes_sent"] > 0
+    assert snapshot["bytes_received"] > 0
+    assert ("similarity_search", None) in hook.finished
+    assert [t for t in hook.transfers if t[0] == "http.put"][0][1] > 0
+
+
+def test_errors_are_counted() -> None:
+    metrics = Metrics()
+    ispn = Infinispan(hosts=["127.0.0.1:1"], metrics=metrics)
+    with pytest.raises(requests.ConnectionError):
+        ispn.get("k", "vector")
+    assert metrics.snapshot()["errors"] == {"http.get": 1}
+
+
+def test_nested_error_counted_once() -> None:
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with stage(metrics, "query"):
+            with stage(metrics, "http.query"):
+                raise ValueError("failed")
+    with pytest.raises(KeyError):
+        with stage(metrics, "query"):
+            raise KeyError("failed")
+    assert metrics.snapshot()["errors"] == {"http.query": 1, "query": 1}
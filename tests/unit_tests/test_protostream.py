@@ -0,0 +1,83 @@
+"""Test the protostream entry encoder."""
+import json
+import struct
+
+import pytest
+
+from infinispan_vector import InfinispanVS
+from infinispan_vector.protostream import ProtobufEncoder, wrap_message
+from infinispan_vector.testing import StandinServer
+from tests.integration_tests.vectorstores.fake_embeddings import FakeEmbeddings
+
+PROTO = """
+package demo;
+/**
+ * @Indexed
+ */
+message vector {
+/**
+ * @Vector(dimension=2)
+ */
+repeated float vector = 1;
+optional string text = 2;
+optional int32 page = 3;
+optional double weight = 4;
+optional bool draft = 5;
+}
+"""
+
+
+def test_encode_message() -> None:
+    encoder = ProtobufEncoder.from_schema(PROTO, "vector")
+    assert encoder.type_name == "demo.vector"
+    message = encoder.encode_message(
+        {
+            "_type": "vector",
+            "vector": [1.0, 2.0],
+            "text": "a",
+            "page": -1,
+            "weight": 0.5,
+            "draft": True,
+            "missing": None,
+        }
+    )
+    assert message == (
+        b"\x0a\x08"
+        + struct.pack("<2f", 1.0, 2.0)
+        + b"\x12\x01a"
+        + b"\x18"
+        + b"\xff" * 9
+        + b"\x01"
+        + b"\x21"
+        + struct.pack("<d", 0.5)
+        + b"\x28\x01"
+    )
+    assert encoder.encode({"text": "a"}) == wrap_message("demo.vector", b"\x12\x01a")
+    assert wrap_message("demo.vector", b"").startswith(b"\x82\x01\x0bdemo.vector")
+
+
+def test_unknown_field_is_rejected() -> None:
+    encoder = ProtobufEncoder.from_schema(PROTO, "vector")
+    with pytest.raises(ValueError):
+        encoder.encode({"color": "red"})
+    with pytest.raises(ValueError):
+        ProtobufEncoder.from_schema(PROTO, "sentence")
+
+
+def test_add_texts_sends_protostream() -> None:
+    with StandinServer() as server:
+        ispnvs = InfinispanVS(
+            embedding=FakeEmbeddings(),
+            hosts=[server.host],
+            entry_encoding="protostream",
+        )
+        with pytest.raises(ValueError):
+            ispnvs.add_texts(["a"])
+        ispnvs.schema_create(ispnvs.schema_builder({"text": "a"}, 10))
+        keys = ispnvs.add_texts(["a", "b"], [{"text": "a"}, {"text": "b"}])
+        stored = server.store["vector"][keys[0]]
+        assert stored.startswith(b"\x82\x01\x06vector")
+        json_size = len(
+            json.dumps({"_type": "vector", "vector": [1.0] * 9 + [0.0], "text": "a"})
+        )
+        assert len(stored) < json_size
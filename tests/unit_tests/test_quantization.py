@@ -0,0 +1,160 @@
+"""Test the int8 vector quantization."""
+import asyncio
+import base64
+import json
+
+import numpy as np
+import pytest
+
+from infinispan_vector import InfinispanVS, Int8Quantizer
+from infinispan_vector.testing import StandinServer
+from tests.integration_tests.vectorstores.fake_embeddings import (
+    ConsistentFakeEmbeddings,
+    FakeEmbeddings,
+)
+
+
+def test_quantize_roundtrip() -> None:
+    rnd = np.random.default_rng(0)
+    vectors = rnd.normal(size=(200, 16)) * np.linspace(0.1, 2.0, 16)
+    for per_dimension in (False, True):
+        quantizer = Int8Quantizer.calibrate(vectors, per_dimension=per_dimension)
+        codes = quantizer.quantize(vectors)
+        assert codes.dtype == np.int8
+        error = np.abs(quantizer.dequantize(codes) - vectors)
+        assert (error <= quantizer.scales / 2 + 1e-6).all()
+    restored = Int8Quantizer.from_dict(json.loads(json.dumps(quantizer.to_dict())))
+    assert (restored.quantize(vectors) == codes).all()
+    encoded = base64.b64encode(quantizer.encode(vectors[0])).decode()
+    assert np.allclose(quantizer.decode(encoded), quantizer.dequantize(codes[0]))
+
+
+def test_store_quantized_vectors() -> None:
+    with StandinServer() as server:
+        ispnvs = InfinispanVS(
+            embedding=FakeEmbeddings(), hosts=[server.host], vector_quantization="int8"
+        )
+        schema = ispnvs.schema_builder({"text": "a"}, 10)
+        assert "optional bytes vector = 1;" in schema
+        assert "repeated float" not in schema
+        keys = ispnvs.add_texts(["a"], [{"text": "a"}])
+        stored = json.loads(server.store["vector"][keys[0]])
+        assert len(base64.b64decode(stored["vector"])) == 10
+        assert sorted(stored) == ["_type", "text", "vector"]
+        # rescored with the dequantized vectors
+        output = ispnvs.similarity_search("a", k=1, oversample=2)
+        assert output[0].page_content == "a"
+        query = ispnvs._prepared_query(ispnvs._projection()).render(
+            ispnvs._query_vector([1.0] * 9 + [0.0]), 4
+        )
+        assert "<-> [127,127,127,127,127,127,127,127,127,0]~4" in query
+
+        ispnvs = InfinispanVS(
+            embedding=FakeEmbeddings(),
+            hosts=[server.host],
+            quantizer=ispnvs.quantizer.to_dict(),
+            entry_encoding="protostream",
+        )
+        ispnvs.schema_create(ispnvs.schema_builder({"text": "a"}, 10))
+        keys = ispnvs.add_texts(["b"], [{"text": "b"}])
+        assert b"\x0a\x0a\x7f\x7f" in server.store["vector"][keys[0]]
+
+
+def test_quantizer_stored_with_cache() -> None:
+    with StandinServer() as server:
+        embeddings = ConsistentFakeEmbeddings()
+        ispnvs = InfinispanVS(
+            embedding=embeddings,
+            hosts=[server.host],
+            vector_quantization="int8",
+            quantization_sample_size=3,
+            batch_size=2,
+            float_vectorfield="vector_float",
+        )
+        texts = ["a", "b", "c", "d", "e"]
+        ispnvs.add_texts(texts, [{"text": text} for text in texts])
+        # calibrated on the first two windows, before any write
+        expected = Int8Quantizer.calibrate(embeddings.embed_documents(texts[:4]))
+        assert ispnvs.quantizer.to_dict() == expected.to_dict()
+        assert "vector_quantizer.proto" in server.schemas
+        stored = json.loads(next(iter(server.store["vector"].values())))
+        assert stored["vector_float"][:9] == [1.0] * 9
+
+        other = InfinispanVS(
+            embedding=embeddings,
+            hosts=[server.host],
+            vector_quantization="int8",
+            float_vectorfield="vector_float",
+        )
+        other.add_texts(["f"], [{"text": "f"}])
+        assert other.quantizer.to_dict() == expected.to_dict()
+        output = other.similarity_search_with_score("c", k=1, oversample=3)
+        assert output[0][0].page_content == "c"
+        assert output[0][1] == 1.0
+        assert "vector_float" not in output[0][0].metadata
+
+        server.schemas["vector_quantizer.proto"] = "// not a quantizer\n"
+        with pytest.raises(ValueError):
+            InfinispanVS(
+                embedding=FakeEmbeddings(),
+                hosts=[server.host],
+                vector_quantization="int8",
+            ).add_texts(["g"], [{"text": "g"}])
+
+
+def test_aadd_texts_calibrates_once() -> None:
+    with StandinServer() as server:
+        ispnvs = InfinispanVS(
+            embedding=ConsistentFakeEmbeddings(),
+            hosts=[server.host],
+            vector_quantization="int8",
+            quantization_sample_size=4,
+            batch_size=2,
+        )
+        texts = ["a", "b", "c", "d", "e"]
+
+        async def run() -> list:
+            keys = await ispnvs.aadd_texts(texts, [{"text": t} for t in texts])
+            await ispnvs.aispn.close()
+            return keys
+
+        keys = asyncio.run(run())
+        assert len(server.store["vector"]) == len(keys) == 5
+        assert ispnvs.quantizer.scales[-1] == np.float32(3 / 127)
+        assert "vector_quantizer.proto" in server.schemas
+
+        # a new store loads the quantizer with the async client only
+        other = InfinispanVS(
+            embedding=ConsistentFakeEmbeddings(),
+            hosts=[server.host],
+            vector_quantization="int8",
+        )
+        other.ispn.schema_get = None
+
+        async def search() -> list:
+            try:
+                return await other.asimilarity_search_by_vector(
+                    [1.0] * 9 + [3.0], k=1
+                )
+            finally:
+                await other.aispn.close()
+
+        assert asyncio.run(search())[0].page_content == "d"
+        assert other.quantizer.to_dict() == ispnvs.quantizer.to_dict()
+
+        empty = InfinispanVS(
+            embedding=ConsistentFakeEmbeddings(),
+            hosts=[server.host],
+            vector_quantization="int8",
+            entity_name="empty",
+        )
+        empty.ispn.schema_get = None
+
+        async def fail() -> None:
+            try:
+                await empty.asimilarity_search_by_vector([1.0] * 10, k=1)
+            finally:
+                await empty.aispn.close()
+
+        with pytest.raises(ValueError, match="calibrated quantizer"):
+            asyncio.run(fail())
@@ -0,0 +1,154 @@
+"""Test routing over the nodes of a cluster."""
+import asyncio
+import socket
+import time
+
+import pytest
+import requests
+
+from infinispan_vector import AsyncInfinispan, HedgePolicy, Infinispan, NodeRouter
+from infinispan_vector.testing import StandinServer
+
+
+def _closed_port() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return "127.0.0.1:%d" % s.getsockname()[1]
+
+
+def test_round_robin_spreads_requests() -> None:
+    with StandinServer() as first, StandinServer() as second:
+        ispn = Infinispan(hosts=[first.host, second.host])
+        for i in range(10):
+            assert ispn.put(str(i), "{}", "vector").ok
+        assert len(first.store["vector"]) == 5
+        assert len(second.store["vector"]) == 5
+
+
+def test_failover_marks_node_down() -> None:
+    with StandinServer() as server:
+        dead = _closed_port()
+        ispn = Infinispan(hosts=[dead, server.host], node_retry_after=60)
+        for i in range(4):
+            assert ispn.put(str(i), "{}", "vector").ok
+        assert len(server.store["vector"]) == 4
+        assert [node.url for node in ispn.router.healthy_nodes] == [
+            "http://" + server.host
+        ]
+
+
+def test_all_nodes_down_raises() -> None:
+    ispn = Infinispan(hosts=[_closed_port()])
+    with pytest.raises(requests.ConnectionError):
+        ispn.get("k", "vector")
+
+
+def test_least_latency() -> None:
+    router = NodeRouter(["http://a", "http://b"], strategy="least_latency")
+    a, b = router.nodes
+    router.success(a, 0.5)
+    router.success(b, 0.1)
+    assert router.pick() is b
+    router.failure(b)
+    assert router.pick() is a
+
+
+def test_health_checks_revive_nodes() -> None:
+    with StandinServer() as server:
+        ispn = Infinispan(hosts=[server.host], health_check_interval=0.05)
+        node = ispn.router.nodes[0]
+        ispn.router.failure(node)
+        deadline = time.monotonic() + 5
+        while not node.healthy and time.monotonic() < deadline:
+            time.sleep(0.02)
+        ispn.close()
+        assert node.healthy
+
+
+def test_router_shared_until_closed() -> None:
+    with StandinServer() as server:
+        dead = _closed_port()
+        with Infinispan(hosts=[dead, server.host], health_check_interval=60) as first:
+            second = Infinispan(hosts=[dead, server.host], health_check_interval=60)
+            assert second.router is first.router
+            router = first.router
+            # HEAD goes through the router and fails over like other requests
+            server.store["vector"] = {}
+            assert first.path_exists("/rest/v2/caches/vector")
+            assert not first.path_exists("/rest/v2/caches/missing")
+            url = "http://" + server.host + "/rest/v2/caches/vector"
+            assert Infinispan.resource_exists(url)
+            second.close()
+            assert router._thread is not None
+        assert router._thread is None
+
+
+def test_discover_members() -> None:
+    with StandinServer() as server:
+        server.members = ["127.0.0.1:7800", "10.1.1.2:7800"]
+        ispn = Infinispan(hosts=[server.host], discover_nodes=True)
+        port = server.host.rpartition(":")[2]
+        assert [node.url for node in ispn.router.nodes] == [
+            "http://" + server.host,
+            "http://10.1.1.2:" + port,
+        ]
+
+
+def test_hedged_queries_avoid_slow_node() -> None:
+    with StandinServer() as slow, StandinServer() as fast:
+        slow.search_delay = 0.5
+        ispn = Infinispan(
+            hosts=[slow.host, fast.host], hedge_queries=True, hedge_max_delay=0.02
+        )
+        start = time.perf_counter()
+        for _ in range(4):
+            assert ispn.req_query("from vector", "vector").ok
+        assert time.perf_counter() - start < 1.0
+        stats = ispn.hedge_policy.stats()
+        assert stats["queries"] == 4
+        assert stats["hedged"] >= 2
+        assert stats["hedge_wins"] >= 2
+
+
+def test_hedges_skipped_while_workers_busy() -> None:
+    with StandinServer() as slow, StandinServer() as fast:
+        slow.search_delay = 0.5
+        fast.search_delay = 0.05
+        ispn = Infinispan(
+            hosts=[slow.host, fast.host],
+            pool_size=1,
+            hedge_queries=True,
+            hedge_max_delay=0.01,
+        )
+        for _ in range(3):
+            assert ispn.req_query("from vector", "vector").ok
+        # the losing request to the slow node holds one of the 2 workers
+        assert ispn.hedge_policy.stats()["skipped_hedges"] >= 1
+        ispn.close()
+
+
+def test_hedge_policy_delay_follows_percentile() -> None:
+    policy = HedgePolicy(percentile=90, min_samples=10, min_delay=0.0)
+    assert policy.delay() == policy.initial_delay
+    for i in range(1, 81):
+        policy.record(i / 1000.0)
+    assert policy.delay() == pytest.approx(0.073)
+
+
+def test_async_hedged_queries() -> None:
+    async def run(aispn: AsyncInfinispan) -> float:
+        try:
+            start = time.perf_counter()
+            for _ in range(4):
+                assert (await aispn.req_query("from vector", "vector")).ok
+            return time.perf_counter() - start
+        finally:
+            await aispn.close()
+
+    with StandinServer() as slow, StandinServer() as fast:
+        slow.search_delay = 0.5
+        aispn = AsyncInfinispan(
+            hosts=[slow.host, fast.host], hedge_queries=True, hedge_max_delay=0.02
+        )
+        assert asyncio.run(run(aispn)) < 1.0
+        assert aispn.hedge_policy.stats()["hedge_wins"] >= 2
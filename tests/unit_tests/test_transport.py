@@ -0,0 +1,36 @@
+"""Test the pooled REST transport."""
+from infinispan_vector import Infinispan
+from infinispan_vector.testing import StandinServer
+from infinispan_vector.transport import RestTransport
+
+
+class RecordingTransport:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def request(self, method, url, timeout, **kwargs):
+        self.calls.append((method, url, timeout))
+
+
+def test_transport_shared_by_cluster() -> None:
+    ispn1 = Infinispan(hosts=["10.0.0.1:11222"])
+    ispn2 = Infinispan(hosts=["10.0.0.1:11222"])
+    ispn3 = Infinispan(hosts=["10.0.0.2:11222"])
+    assert ispn1.transport is ispn2.transport
+    assert ispn1.transport is not ispn3.transport
+
+
+def test_per_operation_timeouts() -> None:
+    transport = RecordingTransport()
+    ispn = Infinispan(transport=transport, timeout=3, timeouts={"query": 0.5})
+    ispn.req_query("from vector", "vector")
+    ispn.get("k", "vector")
+    assert [t for _, _, t in transport.calls] == [0.5, 3]
+
+
+def test_put_get_over_pooled_connections() -> None:
+    with StandinServer() as server:
+        ispn = Infinispan(hosts=[server.host], transport=RestTransport(pool_size=2))
+        for i in range(5):
+            assert ispn.put(str(i), '{"a": %d}' % i, "c").ok
+        assert ispn.get("3", "c").json() == {"a": 3}
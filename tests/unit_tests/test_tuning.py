@@ -0,0 +1,78 @@
+"""Test the vector index tuning tools."""
+import numpy as np
+
+from infinispan_vector import InfinispanVS
+from infinispan_vector.testing import StandinServer
+from infinispan_vector.tuning import (
+    TuningResult,
+    pareto_front,
+    recommend,
+    tune_index,
+)
+
+
+def _result(recall: float, p95_ms: float) -> TuningResult:
+    return TuningResult(16, 100, 1, recall, p95_ms / 2, p95_ms, 0.1)
+
+
+def test_schema_vector_parameters() -> None:
+    proto = InfinispanVS(
+        vector_similarity="cosine", vector_max_connections=32, vector_beam_width=200
+    ).schema_builder({"text": "a"}, 4)
+    assert (
+        "@Vector(dimension=4, similarity=COSINE, maxConnections=32, beamWidth=200)"
+        in proto
+    )
+    assert "@Vector(dimension=4)\n" in InfinispanVS().schema_builder({}, 4)
+
+
+def test_similarity_learned_from_schema() -> None:
+    store = InfinispanVS()
+    proto = InfinispanVS(vector_similarity="INNER_PRODUCT").schema_builder({}, 2)
+    store._set_schema(proto)
+    assert store._similarity == "INNER_PRODUCT"
+
+
+def test_pareto_front_and_recommend() -> None:
+    slow_exact = _result(1.0, 9.0)
+    fast_good = _result(0.96, 3.0)
+    dominated = _result(0.9, 4.0)
+    fastest = _result(0.8, 1.0)
+    results = [slow_exact, fast_good, dominated, fastest]
+    assert pareto_front(results) == [fastest, fast_good, slow_exact]
+    assert recommend(results, min_recall=0.95) is fast_good
+    assert recommend(results, min_recall=0.99) is slow_exact
+    assert recommend([fastest], min_recall=0.99) is fastest
+    assert recommend([]) is None
+
+
+def test_tune_index_against_standin(monkeypatch) -> None:
+    closed = []
+    close = InfinispanVS.close
+    monkeypatch.setattr(
+        InfinispanVS, "close", lambda store: closed.append(store) or close(store)
+    )
+    rnd = np.random.default_rng(0)
+    vectors = rnd.normal(size=(60, 8))
+    with StandinServer() as server:
+        results = tune_index(
+            vectors,
+            k=5,
+            max_connections=(8, 16),
+            beam_widths=(100,),
+            oversample_factors=(1, 2),
+            num_queries=10,
+            hosts=[server.host],
+        )
+        assert server.store == {}
+        assert server.schemas == {}
+    # one client per candidate, each closed
+    assert len(closed) == 2
+    assert [(r.max_connections, r.oversample) for r in results] == [
+        (8, 1),
+        (8, 2),
+        (16, 1),
+        (16, 2),
+    ]
+    # the stand-in searches exactly
+    assert all(result.recall == 1.0 for result in results)
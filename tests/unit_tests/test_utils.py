@@ -0,0 +1,35 @@
+"""Test the vector math helpers."""
+import time
+
+import numpy as np
+
+from infinispan_vector.utils import (
+    maximal_marginal_relevance,
+    similarity_scores,
+    top_k,
+)
+
+
+def test_mmr_prefers_diverse_candidates() -> None:
+    query = [1.0, 0.0]
+    candidates = [[1.0, 0.0], [1.0, 0.01], [0.7, 0.7]]
+    assert maximal_marginal_relevance(query, candidates, k=2, lambda_mult=1.0) == [0, 1]
+    assert maximal_marginal_relevance(query, candidates, k=2, lambda_mult=0.3) == [0, 2]
+
+
+def test_mmr_fetch_k_200_is_fast() -> None:
+    rng = np.random.default_rng(0)
+    candidates = rng.standard_normal((200, 768)).astype(np.float32)
+    start = time.perf_counter()
+    selected = maximal_marginal_relevance(candidates[0], candidates, k=20)
+    assert time.perf_counter() - start < 0.5
+    assert len(set(selected)) == 20
+
+
+def test_similarity_scores_and_top_k() -> None:
+    vectors = [[0.0, 0.0], [3.0, 4.0], [1.0, 0.0]]
+    scores = similarity_scores([0.0, 0.0], vectors, "L2")
+    assert np.allclose(scores, [1.0, 1 / 26, 0.5])
+    assert top_k(scores, 2) == [0, 2]
+    cosine = similarity_scores([1.0, 0.0], vectors[1:], "cosine")
+    assert np.allclose(cosine, [0.8, 1.0])
@@ -0,0 +1,323 @@
+"""Test InfinispanVS client side behaviour against the stand-in server."""
+import asyncio
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from infinispan_vector import InfinispanBulkWriteError, InfinispanVS, RestTransport
+from infinispan_vector.testing import StandinServer
+from tests.integration_tests.vectorstores.counting_embeddings import (
+    CountingEmbeddings,
+)
+from tests.integration_tests.vectorstores.fake_embeddings import FakeEmbeddings
+
+
+@pytest.fixture
+def server():
+    with StandinServer() as s:
+        yield s
+
+
+def test_add_texts_chunked(server) -> None:
+    ispnvs = InfinispanVS(
+        embedding=FakeEmbeddings(), hosts=[server.host], batch_size=2, max_workers=3
+    )
+    texts = ["t" + str(i) for i in range(7)]
+    keys = ispnvs.add_texts(texts, [{"text": t} for t in texts])
+    assert len(keys) == 7
+    stored = server.store["vector"]
+    assert sorted(json.loads(stored[k])["text"] for k in keys) == sorted(texts)
+
+
+def test_add_texts_reports_failures(server) -> None:
+    ispnvs = InfinispanVS(embedding=FakeEmbeddings(), hosts=[server.host])
+    ids = ["ok", "bad/key/x", "ok2"]
+    ispnvs._ids = ids
+    with pytest.raises(InfinispanBulkWriteError) as err:
+        ispnvs.add_texts(["a", "b", "c"])
+    assert list(err.value.failures) == ["bad/key/x"]
+    assert err.value.keys == ["ok", "ok2"]
+
+
+def test_add_texts_short_metadatas(server) -> None:
+    ispnvs = InfinispanVS(embedding=FakeEmbeddings(), hosts=[server.host])
+    with pytest.raises(ValueError, match="fewer metadatas than texts"):
+        ispnvs.add_texts(["a", "b"], iter([{"text": "a"}]))
+    with pytest.raises(ValueError, match="fewer ids than texts"):
+        ispnvs.add_texts(["a", "b"], ids=iter(["a"]))
+    with pytest.raises(ValueError, match="fewer metadatas than texts"):
+        asyncio.run(ispnvs.aadd_texts(["a", "b"], [{"text": "a"}]))
+    with pytest.raises(ValueError, match="fewer metadatas than texts"):
+        ispnvs.sync_texts(["a", "b"], [{"n": 1}])
+
+
+def test_aadd_texts(server) -> None:
+    ispnvs = InfinispanVS(embedding=FakeEmbeddings(), hosts=[server.host], batch_size=2)
+
+    async def run():
+        keys = await ispnvs.aadd_texts(["a", "b", "c"], [{"text": t} for t in "abc"])
+        docs = await ispnvs.asimilarity_search("a")
+        await ispnvs.aispn.close()
+        return keys, docs
+
+    keys, docs = asyncio.run(run())
+    assert sorted(json.loads(server.store["vector"][k])["text"] for k in keys) == [
+        "a",
+        "b",
+        "c",
+    ]
+    # batches of 2: "a" and "c" are both embedded at distance 0
+    assert sorted(doc.page_content for doc in docs) == ["a", "b", "c"]
+    assert docs[-1].page_content == "b"
+
+
+def test_async_across_loops_and_rescored(server) -> None:
+    ispnvs = InfinispanVS(embedding=FakeEmbeddings(), hosts=[server.host])
+    texts = ["a", "b", "c"]
+    ispnvs.add_texts(texts, [{"text": t} for t in texts])
+
+    async def search(**kwargs):
+        return await ispnvs.asimilarity_search_with_score("a", k=2, **kwargs)
+
+    # sessions are bound to their loop, each loop gets its own
+    loops = [asyncio.new_event_loop(), asyncio.new_event_loop()]
+    plain = loops[0].run_until_complete(search())
+    rescored = loops[1].run_until_complete(search(oversample=2))
+    for loop in loops:
+        loop.run_until_complete(ispnvs.aispn.close())
+        loop.close()
+    assert rescored == plain
+    assert [doc.page_content for doc, _ in rescored] == ["a", "b"]
+
+
+def test_from_texts_streams_input(server) -> None:
+    produced = []
+
+    def rows():
+        for i in range(50):
+            produced.append(i)
+            yield "t" + str(i)
+
+    class WindowCheckEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            # never more than the current and the lookahead window are read
+            assert len(produced) <= int(texts[0][1:]) + 2 * 8
+            return super().embed_documents(texts)
+
+    InfinispanVS.from_texts(
+        rows(),
+        WindowCheckEmbeddings(),
+        metadatas=({"text": "t" + str(i)} for i in range(50)),
+        auto_config=False,
+        hosts=[server.host],
+        batch_size=8,
+    )
+    assert len(produced) == 50
+    assert len(server.store["vector"]) == 50
+
+
+def test_query_embedding_cache(server) -> None:
+    embeddings = CountingEmbeddings()
+    ispnvs = InfinispanVS(embedding=embeddings, hosts=[server.host], query_cache_size=8)
+    ispnvs.similarity_search("foo  bar")
+    ispnvs.similarity_search(" foo bar ")
+    ispnvs.similarity_search("baz")
+    assert embeddings.queries == ["foo  bar", "baz"]
+    assert ispnvs.query_cache.stats()["hits"] == 1
+    assert ispnvs.query_cache.stats()["misses"] == 2
+
+
+def test_result_cache_invalidated_by_writes(server) -> None:
+    searches = []
+
+    class CountingTransport(RestTransport):
+        def request(self, method, url, timeout, **kwargs):
+            if "action=search" in url:
+                searches.append(url)
+            return super().request(method, url, timeout, **kwargs)
+
+    ispnvs = InfinispanVS(
+        embedding=FakeEmbeddings(),
+        hosts=[server.host],
+        transport=CountingTransport(),
+        result_cache_size=8,
+    )
+    query = [1.0] * 9 + [2.0]
+    ispnvs.similarity_search_by_vector(query, k=2)
+    ispnvs.similarity_search_by_vector([1.0] * 9 + [2.0000000001], k=2)
+    assert len(searches) == 1
+    ispnvs.similarity_search_by_vector(query, k=3)
+    assert len(searches) == 2
+    keys = ispnvs.add_texts(["a"], [{"text": "a"}])
+    ispnvs.similarity_search_by_vector(query, k=2)
+    assert len(searches) == 3
+    assert ispnvs.delete(keys)
+    ispnvs.similarity_search_by_vector(query, k=2)
+    assert len(searches) == 4
+    assert server.store["vector"] == {}
+
+
+def test_result_cache_returns_copies(server) -> None:
+    ispnvs = InfinispanVS(
+        embedding=FakeEmbeddings(), hosts=[server.host], result_cache_size=8
+    )
+    ispnvs.add_texts(["a"], [{"text": "a", "tags": ["x"]}])
+    query = [1.0] * 10
+    first = ispnvs.similarity_search_by_vector(query, k=1)
+    first[0].page_content = "changed"
+    first[0].metadata["tags"].append("y")
+    second = ispnvs.similarity_search_by_vector(query, k=1)
+    second[0].metadata["tags"].append("z")
+    assert ispnvs.similarity_search_by_vector(query, k=1) == [
+        Document(page_content="a", metadata={"tags": ["x"]})
+    ]
+
+
+def test_similarity_search_batch(server) -> None:
+    embeddings = CountingEmbeddings()
+    ispnvs = InfinispanVS(embedding=embeddings, hosts=[server.host], query_cache_size=8)
+    ispnvs.similarity_search_batch(["a", "b"])
+    results = ispnvs.similarity_search_batch(["a", "c", "d"], k=2)
+    assert embeddings.batches == [["a", "b"], ["c", "d"]]
+    assert results == [[], [], []]
+
+    texts = ["t0", "t1", "t2", "t3"]
+    ispnvs.add_texts(texts, [{"text": t} for t in texts])
+    # embedded in one call, "z", "x" and "y" get the vectors of t0, t1, t2
+    results = ispnvs.similarity_search_with_score_batch(["z", "x", "y"], k=2)
+    assert [found[0][0].page_content for found in results] == ["t0", "t1", "t2"]
+    assert [found[0][1] for found in results] == [1.0, 1.0, 1.0]
+    assert [doc.page_content for doc, _ in results[0]] == ["t0", "t1"]
+    # single query searches do not reuse the batch embedding of "x"
+    assert ispnvs.similarity_search("x", k=1) == [Document(page_content="t0")]
+
+
+def test_prepared_query() -> None:
+    ispnvs = InfinispanVS(output_fields=["label", "text"], query_vector_precision=4)
+    assert ispnvs._projection() == "v.label,v.text, score(v)"
+    prepared = ispnvs._prepared_query(ispnvs._projection())
+    assert prepared.render(ispnvs._query_vector([0.123456, 2.5]), 3) == (
+        "select v.label,v.text, score(v) from vector v "
+        "where v.vector <-> [0.1235,2.5]~3"
+    )
+    assert ispnvs._prepared_query(ispnvs._projection()) is prepared
+
+
+def test_hits_are_decoded_lazily() -> None:
+    ispnvs = InfinispanVS(keyfield="_key")
+    result = {
+        "hits": [
+            {"hit": {"*": {"_type": "vector", "_key": "k1", "text": "foo", "a": 1},
+                     "score()": 0.9}},
+        ]
+    }
+    hits = ispnvs._query_result_to_hits(result)
+    assert hits[0]._document is None
+    assert (hits[0].id, hits[0].score) == ("k1", 0.9)
+    assert hits[0].document == Document(page_content="foo", metadata={"a": 1})
+
+
+def test_iter_similar_pages_lazily() -> None:
+    requests_seen = []
+
+    class PagingTransport:
+        def request(self, method, url, timeout, **kwargs):
+            body = json.loads(kwargs["data"])
+            requests_seen.append((body["offset"], body["max_results"]))
+            start = body["offset"]
+            end = min(start + body["max_results"], 25)
+            hits = [{"hit": {"*": {"text": str(i)}, "score()": 1.0 / (i + 1)}}
+                    for i in range(start, end)]
+            return type("Response", (), {"content": json.dumps({"hits": hits})})
+
+    ispnvs = InfinispanVS(transport=PagingTransport(), auto_projection=False)
+    hits = ispnvs.iter_similar([1.0, 0.0], k=25, page_size=10)
+    assert next(hits).document.page_content == "0"
+    assert requests_seen == [(0, 10)]
+    rest = [hit.document.page_content for hit in hits]
+    assert rest == [str(i) for i in range(1, 25)]
+    assert requests_seen == [(0, 10), (10, 10), (20, 5)]
+
+
+def test_sync_texts_only_embeds_changes(server) -> None:
+    embeddings = CountingEmbeddings()
+    ispnvs = InfinispanVS(embedding=embeddings, hosts=[server.host])
+    stats = ispnvs.sync_texts(["a", "b", "c"], [{"n": 1}, {"n": 2}, {"n": 3}])
+    assert stats == {"added": 3, "skipped": 0, "deleted": 0}
+    stats = ispnvs.sync_texts(
+        ["a", "b", "d"], [{"n": 1}, {"n": 5}, {"n": 4}], delete_missing=True
+    )
+    assert stats == {"added": 2, "skipped": 1, "deleted": 2}
+    assert embeddings.embedded == ["a", "b", "c", "b", "d"]
+    assert len(server.store["vector"]) == 3
+
+
+def test_get_by_ids_near_cache(server) -> None:
+    ispnvs = InfinispanVS(
+        embedding=FakeEmbeddings(),
+        hosts=[server.host],
+        textfield="text",
+        near_cache_size=10,
+    )
+    keys = ispnvs.add_texts(["a", "b"], [{"text": "a"}, {"text": "b"}])
+    server.store["sentence"] = {"s1": json.dumps({"sentence": "hello"}).encode()}
+    docs = ispnvs.get_by_ids([keys[1], "missing", keys[0]])
+    assert [doc.page_content for doc in docs] == ["b", "a"]
+    assert ispnvs.get_entries(["s1"], cache_name="sentence") == [
+        {"sentence": "hello"}
+    ]
+    server.store["vector"].clear()
+    # entries handed out are copies of the cached ones
+    ispnvs.get_entries([keys[0]])[0]["text"] = "changed"
+    assert [doc.page_content for doc in ispnvs.get_by_ids(keys)] == ["a", "b"]
+    assert ispnvs.near_cache.stats()["hits"] == 3
+    ispnvs.add_texts(["c"], [{"text": "c"}])
+    assert ispnvs.get_by_ids(keys) == []
+
+
+def test_automatic_projection() -> None:
+    queries = []
+
+    class SchemaTransport:
+        def request(self, method, url, timeout, **kwargs):
+            if "/schemas/" in url:
+                proto = InfinispanVS().schema_builder({"text": "a", "label": "b"}, 2)
+                return type("Response", (), {"ok": True, "text": proto})
+            queries.append(json.loads(kwargs["data"])["query"])
+            hits = [{"hit": {"text": "foo", "label": None, "score()": 0.5}}]
+            return type("Response", (), {"content": json.dumps({"hits": hits})})
+
+    ispnvs = InfinispanVS(transport=SchemaTransport())
+    hits = ispnvs.similarity_search_hits_by_vector([1.0, 0.0], k=1)
+    assert queries[0].startswith("select v.text,v.label, score(v) from vector v")
+    assert hits[0].entity == {"text": "foo"}
+    ispnvs.similarity_search_hits_by_vector([1.0, 0.0], k=1, with_vectors=True)
+    assert queries[1].startswith("select v.text,v.label,v.vector, score(v)")
+    assert ispnvs._projection() == "v.text,v.label, score(v)"
+    ispnvs.schema_create(
+        InfinispanVS().schema_builder({"text": "a", "color": "b"}, 2)
+    )
+    assert ispnvs._projection() == "v.text,v.color, score(v)"
+
+
+def test_standin_knn(server) -> None:
+    ispnvs = InfinispanVS(
+        embedding=FakeEmbeddings(), hosts=[server.host], keyfield="_key"
+    )
+    ispnvs.configure({"text": ""}, 10)
+    texts = ["t" + str(i) for i in range(5)]
+    ispnvs.add_texts(
+        texts, [{"text": t, "_key": t} for t in texts], ids=texts, batch_size=5
+    )
+    found = ispnvs.similarity_search_ids_by_vector([1.0] * 9 + [1.2], k=3)
+    assert [key for key, _ in found] == ["t1", "t2", "t0"]
+    assert found[0][1] == pytest.approx(1 / 1.04)
+    hits = list(ispnvs.iter_similar([1.0] * 9 + [4.0], k=5, page_size=2))
+    assert [hit.document.page_content for hit in hits] == [
+        "t4",
+        "t3",
+        "t2",
+        "t1",
+        "t0",
+    ]